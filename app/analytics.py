@@ -0,0 +1,241 @@
+"""Vectorized returns analytics over balance snapshot history"""
+
+import numpy as np
+import pandas as pd
+
+# Crypto trades every day, so returns annualize over calendar days
+PERIODS_PER_YEAR = 365
+ROLLING_WINDOWS = (7, 30, 90)
+
+
+def balances_frame(rows: list) -> pd.DataFrame:
+    """
+    Pivot snapshot rows into a daily balance frame
+
+    Args:
+        rows: Dicts with account_id, snapshot_date and total_balance_usd
+
+    Returns:
+        DataFrame indexed by calendar day with one column per account.
+        Missing days carry the previous balance forward.
+    """
+    if not rows:
+        return pd.DataFrame(dtype=float)
+    frame = pd.DataFrame(
+        rows, columns=["account_id", "snapshot_date", "total_balance_usd"]
+    )
+    frame["snapshot_date"] = pd.to_datetime(frame["snapshot_date"])
+    frame["total_balance_usd"] = frame["total_balance_usd"].astype(float)
+    wide = frame.pivot_table(
+        index="snapshot_date",
+        columns="account_id",
+        values="total_balance_usd",
+        aggfunc="last",
+    )
+    # Fill gaps between snapshots, but not past an account's last snapshot
+    daily = wide.asfreq("D")
+    return daily.ffill().where(daily.bfill().notna())
+
+
+def flows_frame(rows: list, balances: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pivot the net_flow_usd of snapshot rows onto a balance frame's days
+
+    Each flow sits on the snapshot day whose daily return it was netted out
+    of (daily_returns.net_flow_usd); days without one get 0.
+    """
+    if not rows or balances.empty:
+        return pd.DataFrame(0.0, index=balances.index, columns=balances.columns)
+    frame = pd.DataFrame(rows, columns=["account_id", "snapshot_date", "net_flow_usd"])
+    frame["snapshot_date"] = pd.to_datetime(frame["snapshot_date"])
+    frame["net_flow_usd"] = frame["net_flow_usd"].fillna(0).astype(float)
+    wide = frame.pivot_table(
+        index="snapshot_date",
+        columns="account_id",
+        values="net_flow_usd",
+        aggfunc="sum",
+    )
+    return wide.reindex(index=balances.index, columns=balances.columns).fillna(0.0)
+
+
+def load_history(
+    db, exchange: str = "kraken", account_id: str = None, start_date=None, end_date=None
+) -> tuple:
+    """
+    Load snapshot history and its deposits/withdrawals with a single query
+
+    Returns:
+        (balances, flows) frames for compute_metrics
+    """
+    rows = db.get_balance_history(exchange, account_id, start_date, end_date)
+    balances = balances_frame(rows)
+    return balances, flows_frame(rows, balances)
+
+
+def load_balances(
+    db, exchange: str = "kraken", account_id: str = None, start_date=None, end_date=None
+) -> pd.DataFrame:
+    """Load snapshot history for one or all accounts with a single query"""
+    return load_history(db, exchange, account_id, start_date, end_date)[0]
+
+
+def compute_returns(balances: pd.DataFrame, flows: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Daily simple returns net of deposits and withdrawals
+
+    A day's flow is counted as arriving at its start, like
+    daily_returns.daily_return_pct: (balance - previous - flow) / (previous
+    + flow). A non-positive base yields NaN, not inf.
+    """
+    base = balances.shift(1)
+    if flows is not None:
+        base = base + flows.reindex_like(balances).fillna(0)
+    return (balances / base.where(base > 0)) - 1
+
+
+def growth_index(returns: pd.DataFrame, balances: pd.DataFrame) -> pd.DataFrame:
+    """Compounded value of 1 USD held from each account's first day (NaN outside it)"""
+    return (1 + returns.fillna(0)).cumprod().where(balances.notna())
+
+
+def compute_metrics(
+    balances: pd.DataFrame,
+    risk_free_rate: float = 0.0,
+    periods_per_year: int = PERIODS_PER_YEAR,
+    windows=ROLLING_WINDOWS,
+    flows: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """
+    Return statistics for every account column in one vectorized pass
+
+    Returns are time-weighted: deposits and withdrawals in flows are netted
+    out of each day's return, so they move the balances but not the
+    cumulative, rolling or risk figures.
+
+    Args:
+        balances: Daily balance frame from balances_frame()
+        risk_free_rate: Annual risk-free rate for Sharpe/Sortino (e.g. 0.04)
+        periods_per_year: Periods used to annualize (default: 365 days)
+        windows: Trailing windows in days for rolling returns
+        flows: Daily net flows from flows_frame() (None: no deposits or withdrawals)
+
+    Returns:
+        DataFrame indexed by account_id with columns: start_date, end_date,
+        days, start_balance, end_balance, cumulative_return, return_<n>d,
+        annualized_return, log_return, volatility, sharpe, sortino,
+        max_drawdown and max_drawdown_date. Returns and ratios are fractions
+        (0.05 == 5%).
+    """
+    if balances.empty:
+        return pd.DataFrame()
+
+    values = balances.to_numpy(dtype=float)
+    returns = compute_returns(balances, flows)
+    growth = growth_index(returns, balances)
+    index = growth.to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_returns = np.log1p(returns)
+
+    # First and last observed balance per account (columns start on different days)
+    observed = balances.notna()
+    first_idx = observed.to_numpy().argmax(axis=0)
+    last_idx = len(balances) - 1 - observed.to_numpy()[::-1].argmax(axis=0)
+    cols = np.arange(values.shape[1])
+    start_balance = values[first_idx, cols]
+    end_balance = values[last_idx, cols]
+    days = (last_idx - first_idx).astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cumulative = np.where(
+            start_balance > 0,
+            index[last_idx, cols] / index[first_idx, cols] - 1,
+            np.nan,
+        )
+        annualized = np.where(
+            (days > 0) & (cumulative > -1),
+            (1 + cumulative) ** (periods_per_year / days) - 1,
+            np.nan,
+        )
+
+    metrics = pd.DataFrame(
+        {
+            "start_date": balances.index[first_idx].date,
+            "end_date": balances.index[last_idx].date,
+            "days": days.astype(int),
+            "start_balance": start_balance,
+            "end_balance": end_balance,
+            "cumulative_return": cumulative,
+        },
+        index=balances.columns,
+    )
+
+    for window in windows:
+        trailing = _trailing(growth, window).to_numpy()
+        metrics[f"return_{window}d"] = trailing[last_idx, cols]
+
+    # Daily excess return over the per-period risk-free rate
+    rf_daily = (1 + risk_free_rate) ** (1 / periods_per_year) - 1
+    excess = returns - rf_daily
+    mean_excess = excess.mean()
+    volatility = returns.std(ddof=1)
+    downside = np.sqrt((excess.clip(upper=0) ** 2).mean())
+    scale = np.sqrt(periods_per_year)
+
+    metrics["annualized_return"] = annualized
+    metrics["log_return"] = log_returns.sum(min_count=1)
+    metrics["volatility"] = volatility * scale
+    metrics["sharpe"] = (mean_excess / volatility.where(volatility > 0)) * scale
+    metrics["sortino"] = (mean_excess / downside.where(downside > 0)) * scale
+
+    drawdown = (growth / growth.cummax() - 1).where(balances > 0)
+    metrics["max_drawdown"] = drawdown.min()
+    # idxmin raises on an all-NA column (e.g. an account that only ever held 0)
+    troughs = drawdown.dropna(axis=1, how="all").idxmin()
+    metrics["max_drawdown_date"] = pd.to_datetime(
+        troughs.reindex(balances.columns)
+    ).dt.date
+
+    metrics.index.name = "account_id"
+    return metrics
+
+
+def rolling_returns(
+    balances: pd.DataFrame, window: int, flows: pd.DataFrame = None
+) -> pd.DataFrame:
+    """Trailing `window`-day compounded return (net of flows) for every day and account"""
+    return _trailing(growth_index(compute_returns(balances, flows), balances), window)
+
+
+def _trailing(growth: pd.DataFrame, window: int) -> pd.DataFrame:
+    previous = growth.shift(window)
+    return growth / previous.where(previous != 0) - 1
+
+
+def format_metrics(account_id: str, m: pd.Series) -> str:
+    """Render one account's metrics as a fixed-width text block"""
+
+    def pct(value) -> str:
+        return "n/a" if pd.isna(value) else f"{value * 100:+.2f}%"
+
+    def ratio(value) -> str:
+        return "n/a" if pd.isna(value) else f"{value:.2f}"
+
+    trough = m["max_drawdown_date"] if pd.notna(m["max_drawdown_date"]) else "n/a"
+    lines = [
+        f"Account:       {account_id}",
+        f"Period:        {m['start_date']} → {m['end_date']} ({m['days']} days)",
+        f"Balance:       ${m['start_balance']:,.2f} → ${m['end_balance']:,.2f}",
+        f"Cumulative:    {pct(m['cumulative_return'])}",
+    ]
+    for column in [c for c in m.index if c.startswith("return_")]:
+        label = f"{column[len('return_'):]}:"
+        lines.append(f"{label:<15}{pct(m[column])}")
+    lines += [
+        f"Annualized:    {pct(m['annualized_return'])}",
+        f"Log return:    {ratio(m['log_return'])}",
+        f"Volatility:    {pct(m['volatility']).lstrip('+')}",
+        f"Sharpe:        {ratio(m['sharpe'])}",
+        f"Sortino:       {ratio(m['sortino'])}",
+        f"Max drawdown:  {pct(m['max_drawdown'])} ({trough})",
+    ]
+    return "\n".join(lines)
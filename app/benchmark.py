@@ -0,0 +1,500 @@
+"""Benchmarks for database and pipeline performance"""
+
+import functools
+import json
+import math
+import random
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import click
+import config
+import main
+from analytics import balances_frame, compute_metrics, load_history
+from database import Database
+from fake_kraken import FakeKraken, fake_accounts, parse_spec
+from kraken import KrakenConnector
+import raw_payloads
+
+# Pipeline stages timed by `bench pipeline`: stage -> (owner, method name).
+# Exchange stages time single API calls, retries included as separate calls.
+PIPELINE_STAGES = {
+    "account": (main, "run_daily_snapshot"),
+    "fetch_balance": (FakeKraken, "fetch_balance"),
+    "fetch_tickers": (FakeKraken, "fetch_tickers"),
+    "valuation": (KrakenConnector, "_build_balance"),
+    "snapshot_write": (Database, "save_balance_snapshot"),
+    "ledger_fetch": (KrakenConnector, "fetch_ledger_page"),
+    "ledger_write": (Database, "save_ledger_entries"),
+    "returns": (Database, "recompute_returns"),
+    "trade_fetch": (KrakenConnector, "fetch_trades_page"),
+    "trade_write": (Database, "save_trades"),
+    "pnl": (main, "update_pnl"),
+}
+
+# Tables holding rows of the synthetic accounts, cleared before each run and after the last
+PIPELINE_TABLES = (
+    "balance_rollups",
+    "account_summaries",
+    "daily_returns",
+    "ledger_entries",
+    "trades",
+    "balance_holdings",
+    "balance_snapshots",
+    "sync_checkpoints",
+)
+
+# Stages whose return value is the number of rows inserted
+ROW_STAGES = ("ledger_write", "trade_write")
+
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_trades(count: int, seed: int = 42, start: datetime = None):
+    """
+    Generate ccxt-shaped trade dictionaries
+
+    Args:
+        count: Number of trades to generate
+        seed: Random seed for reproducible data
+        start: Timestamp of the first trade (default: 2020-01-01)
+
+    Returns:
+        Generator of trade dictionaries
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2020, 1, 1)
+    symbols = ["BTC/USD", "ETH/USD", "SOL/USD", "XRP/USD", "LTC/USD", "DOGE/USD"]
+
+    for i in range(count):
+        ts = start + timedelta(seconds=i * 30)
+        price = round(rng.uniform(0.1, 70000), 2)
+        amount = round(rng.uniform(0.0001, 10), 8)
+        side = rng.choice(["buy", "sell"])
+        yield {
+            "id": f"BENCH-{seed}-{i:09d}",
+            "order": f"O{i:09d}",
+            "timestamp": int(ts.timestamp() * 1000),
+            "datetime": ts.isoformat() + "Z",
+            "symbol": rng.choice(symbols),
+            "type": "limit",
+            "side": side,
+            "takerOrMaker": "taker",
+            "price": price,
+            "amount": amount,
+            "cost": round(price * amount, 2),
+            "fee": {"cost": round(price * amount * 0.0026, 8), "currency": "USD"},
+            "info": {"ordertype": "limit", "pair": "SYNTH", "misc": ""},
+        }
+
+
+def synthetic_balances(accounts: int, days: int, seed: int = 42, start=None):
+    """
+    Generate balance_snapshots-shaped rows following a random walk
+
+    Args:
+        accounts: Number of accounts
+        days: Daily snapshots per account
+        seed: Random seed for reproducible data
+        start: Date of the first snapshot (default: 2015-01-01)
+
+    Returns:
+        List of dicts with account_id, snapshot_date and total_balance_usd
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2015, 1, 1).date()
+    rows = []
+    for a in range(accounts):
+        balance = rng.uniform(1000, 100000)
+        for d in range(days):
+            balance *= 1 + rng.gauss(0.0005, 0.03)
+            rows.append(
+                {
+                    "account_id": f"bench_{a:03d}",
+                    "snapshot_date": start + timedelta(days=d),
+                    "total_balance_usd": round(balance, 2),
+                }
+            )
+    return rows
+
+
+def _chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _delete_account_trades(db: Database, account_id: str):
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM trades WHERE exchange = %s AND account_id = %s",
+                ("benchmark", account_id),
+            )
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class StageTimer:
+    """Thread-safe wall-clock samples per pipeline stage"""
+
+    def __init__(self):
+        self.samples = {}
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, rows: int = None):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if rows is not None:
+                self.rows[stage] = self.rows.get(stage, 0) + rows
+
+    def summary(self) -> dict:
+        """{stage: count, total and p50/p95/p99/max in milliseconds}"""
+        stages = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            stats = {"count": len(values), "total_s": round(sum(values), 4)}
+            for pct in PERCENTILES:
+                stats[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 3)
+            stats["max_ms"] = round(values[-1] * 1000, 3)
+            if stage in self.rows:
+                stats["rows"] = self.rows[stage]
+            stages[stage] = stats
+        return stages
+
+
+@contextmanager
+def timed_stages(timer: StageTimer, stages: dict = PIPELINE_STAGES):
+    """
+    Wrap each stage's method so every call is recorded under its stage
+
+    The return values of ROW_STAGES are summed as the stage's rows. The
+    originals are restored on exit.
+    """
+    originals = []
+    for stage, (owner, name) in stages.items():
+        original = getattr(owner, name)
+
+        def wrapper(*args, __stage=stage, __original=original, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = __original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+            timer.record(__stage, elapsed, result if __stage in ROW_STAGES else None)
+            return result
+
+        setattr(owner, name, functools.wraps(original)(wrapper))
+        originals.append((owner, name, original))
+    try:
+        yield timer
+    finally:
+        for owner, name, original in reversed(originals):
+            setattr(owner, name, original)
+
+
+def _reset_accounts(db: Database, account_ids: list):
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            for table in PIPELINE_TABLES:
+                cur.execute(
+                    f"DELETE FROM {table} WHERE account_id = ANY(%s)", (account_ids,)
+                )
+
+
+def _read_balance(db: Database, account_id: str) -> list:
+    latest = db.get_latest_balance("kraken", account_id)
+    return db.get_holdings(latest["id"], latest["snapshot_date"])
+
+
+def _read_stats(db: Database, account_id: str):
+    balances, flows = load_history(db, "kraken", account_id)
+    return compute_metrics(balances, flows=flows)
+
+
+def _time_reads(db: Database, timer: StageTimer, account_ids: list):
+    """Time the reads behind the bot's /balance, /trades, /returns and /stats"""
+    reads = {
+        "read_balance": lambda a: _read_balance(db, a),
+        "read_trades": lambda a: db.get_all_trades("kraken", a, limit=20),
+        "read_returns": lambda a: db.get_all_returns("kraken", a, limit=10),
+        "read_stats": lambda a: _read_stats(db, a),
+    }
+    for account_id in account_ids:
+        for stage, read in reads.items():
+            started = time.perf_counter()
+            read(account_id)
+            timer.record(stage, time.perf_counter() - started)
+
+
+def run_pipeline_benchmark(
+    dsn: str, spec: str, runs: int = 3, workers: int = None
+) -> dict:
+    """
+    Drive run_all_snapshots against the fake exchange and a scratch database
+
+    Each run starts from empty synthetic accounts, so every run does a full
+    trade/ledger backfill and the results are comparable across runs. The
+    synthetic rows are deleted again afterwards. The configured DATABASE_URL
+    is refused: runs apply partition retention like a real snapshot run.
+
+    Returns:
+        JSON-serializable result: settings, per-stage latency percentiles,
+        throughput and peak RSS
+    """
+    if not dsn or dsn == config.DATABASE_URL:
+        raise ValueError(
+            "The pipeline benchmark needs a scratch database, not DATABASE_URL"
+        )
+    settings = parse_spec(spec)
+    accounts = fake_accounts(settings)
+    account_ids = [a["account_id"] for a in accounts]
+
+    db = Database(
+        dsn,
+        config.DB_POOL_MIN,
+        max(config.DB_POOL_MAX, workers or config.SNAPSHOT_WORKERS),
+        config.RAW_PAYLOAD_MODE,
+        config.DB_PARTITIONING,
+    )
+    db.create_balance_snapshots_table()
+    db.create_balance_holdings_table()
+    db.create_returns_table()
+    db.create_trades_table()
+    db.create_sync_checkpoints_table()
+    db.create_raw_payloads_table()
+    db.create_summary_tables()
+
+    # create_connector reads the spec from config at call time
+    previous_spec, config.FAKE_KRAKEN = config.FAKE_KRAKEN, spec
+    timer = StageTimer()
+    wall = 0.0
+    failures = 0
+    try:
+        for _ in range(runs):
+            _reset_accounts(db, account_ids)
+            with timed_stages(timer):
+                started = time.perf_counter()
+                results = main.run_all_snapshots(db, accounts, max_workers=workers)
+                wall += time.perf_counter() - started
+            failures += sum(1 for r in results if r["status"] != "success")
+        _time_reads(db, timer, account_ids)
+    finally:
+        config.FAKE_KRAKEN = previous_spec
+        try:
+            _reset_accounts(db, account_ids)
+        finally:
+            db.close()
+
+    stages = timer.summary()
+
+    def per_second(stage: str, count: int = None) -> float:
+        stats = stages.get(stage)
+        if not stats or not stats["total_s"]:
+            return 0.0
+        return round((count or stats.get("rows", stats["count"])) / stats["total_s"], 1)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "spec": spec,
+        "settings": settings,
+        "runs": runs,
+        "workers": workers or config.SNAPSHOT_WORKERS,
+        "failures": failures,
+        "wall_s": round(wall, 3),
+        "stages": stages,
+        "throughput": {
+            "accounts_per_s": round(len(accounts) * runs / wall, 2) if wall else 0.0,
+            "trades_per_s": per_second("trade_write"),
+            "ledger_entries_per_s": per_second("ledger_write"),
+            "snapshots_per_s": per_second("snapshot_write"),
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Per-stage p50/p95 changes against a baseline
+
+    Returns:
+        List of (stage, metric, baseline, current, change fraction, regressed)
+    """
+    rows = []
+    for stage, stats in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            old, new = before[metric], stats[metric]
+            change = (new - old) / old if old else 0.0
+            rows.append((stage, metric, old, new, change, change > threshold))
+    for metric, new in current["throughput"].items():
+        old = baseline.get("throughput", {}).get(metric)
+        if old:
+            change = (new - old) / old
+            rows.append(("throughput", metric, old, new, change, -change > threshold))
+    return rows
+
+
+@click.group()
+def bench():
+    """Performance benchmarks (run against a scratch database)"""
+    pass
+
+
+@bench.command()
+@click.option(
+    "--sizes", default="10000,100000,1000000", help="Comma-separated trade counts"
+)
+@click.option("--chunk", default=100000, help="Trades per save_trades call")
+@click.option("--dsn", default=None, help="Database URL (default: DATABASE_URL)")
+@click.option(
+    "--raw-mode",
+    type=click.Choice(raw_payloads.MODES),
+    default=config.RAW_PAYLOAD_MODE,
+    help="Raw payload storage mode",
+)
+def trades_ingest(sizes, chunk, dsn, raw_mode):
+    """Compare batched INSERT vs COPY ingestion rows/sec for save_trades"""
+    db = Database(dsn or config.DATABASE_URL, raw_payload_mode=raw_mode)
+    db.create_trades_table()
+    db.create_raw_payloads_table()
+
+    click.echo(
+        f"{'Trades':>10} {'Mode':<8} {'Seconds':>10} {'Rows/sec':>12} {'Inserted':>10}"
+    )
+    click.echo("-" * 54)
+
+    for size in [int(s) for s in sizes.split(",")]:
+        for mode, bulk in (("batch", False), ("copy", True)):
+            account_id = f"bench_{mode}_{size}"
+            _delete_account_trades(db, account_id)
+
+            inserted = 0
+            elapsed = 0.0
+            for trades in _chunks(synthetic_trades(size), chunk):
+                started = time.perf_counter()
+                inserted += db.save_trades(trades, "benchmark", account_id, bulk=bulk)
+                elapsed += time.perf_counter() - started
+
+            click.echo(
+                f"{size:>10,} {mode:<8} {elapsed:>10.2f} "
+                f"{size / elapsed:>12,.0f} {inserted:>10,}"
+            )
+            _delete_account_trades(db, account_id)
+
+
+@bench.command()
+@click.option("--accounts", default=100, help="Number of synthetic accounts")
+@click.option("--years", default=10, help="Years of daily snapshots per account")
+@click.option("--repeat", default=5, help="Timed runs (best is reported)")
+def returns_analytics(accounts, years, repeat):
+    """Time the vectorized returns analytics over synthetic snapshot history"""
+    days = years * 365
+    rows = synthetic_balances(accounts, days)
+    click.echo(f"{len(rows):,} snapshots ({accounts} accounts x {days} days)")
+
+    frame_times, metric_times = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        balances = balances_frame(rows)
+        built = time.perf_counter()
+        metrics = compute_metrics(balances)
+        frame_times.append(built - started)
+        metric_times.append(time.perf_counter() - built)
+
+    frame_best, metric_best = min(frame_times), min(metric_times)
+    click.echo(f"{'Stage':<10} {'Seconds':>10} {'Rows/sec':>14}")
+    click.echo("-" * 36)
+    for stage, elapsed in (("frame", frame_best), ("metrics", metric_best)):
+        click.echo(f"{stage:<10} {elapsed:>10.3f} {len(rows) / elapsed:>14,.0f}")
+    click.echo(f"Computed {len(metrics.columns)} metrics for {len(metrics)} accounts")
+
+
+@bench.command()
+@click.option(
+    "--spec",
+    default="accounts=10,keys=5,assets=10,trades=2000,ledger=50,latency=0.02",
+    help="Fake exchange settings (FAKE_KRAKEN syntax)",
+)
+@click.option("--runs", default=3, help="Full pipeline runs from empty accounts")
+@click.option("--workers", default=None, type=int, help="Snapshot workers")
+@click.option(
+    "--dsn",
+    required=True,
+    help="Scratch database URL (DATABASE_URL is refused; fake_* rows are written)",
+)
+@click.option("--output", default=None, help="Write results as a JSON baseline")
+@click.option("--baseline", default=None, help="Compare against a saved baseline")
+@click.option("--threshold", default=0.2, help="Change flagged as a regression")
+def pipeline(spec, runs, workers, dsn, output, baseline, threshold):
+    """End-to-end snapshot pipeline latency per stage against a fake exchange"""
+    if dsn == config.DATABASE_URL:
+        raise click.BadParameter(
+            "use a scratch database, not DATABASE_URL", param_hint="--dsn"
+        )
+    result = run_pipeline_benchmark(dsn, spec, runs, workers)
+
+    click.echo(
+        f"{result['runs']} runs x {result['settings']['accounts']} accounts "
+        f"in {result['wall_s']:.1f}s ({result['failures']} failed accounts)\n"
+    )
+    click.echo(
+        f"{'Stage':<16} {'Calls':>7} {'p50 ms':>10} {'p95 ms':>10} "
+        f"{'p99 ms':>10} {'Max ms':>10} {'Rows':>9}"
+    )
+    click.echo("-" * 78)
+    for stage, st in result["stages"].items():
+        click.echo(
+            f"{stage:<16} {st['count']:>7,} {st['p50_ms']:>10.2f} "
+            f"{st['p95_ms']:>10.2f} {st['p99_ms']:>10.2f} {st['max_ms']:>10.2f} "
+            f"{st.get('rows', ''):>9}"
+        )
+    click.echo("")
+    for metric, value in result["throughput"].items():
+        click.echo(f"{metric:<22} {value:>12,.1f}")
+    click.echo(f"{'peak_rss_mb':<22} {result['peak_rss_mb']:>12,.1f}")
+
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+        click.echo(f"\nAgainst {baseline} ({previous.get('created', '?')}):\n")
+        regressions = 0
+        for stage, metric, old, new, change, regressed in compare_results(
+            result, previous, threshold
+        ):
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            click.echo(
+                f"{stage:<16} {metric:<22} {old:>12,.2f} → {new:>12,.2f} "
+                f"{change * 100:+7.1f}%{flag}"
+            )
+        click.echo(f"\n{regressions} regressions over {threshold * 100:.0f}%")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        click.echo(f"\nBaseline written to {output}")
+
+
+if __name__ == "__main__":
+    bench()
@@ -1,16 +1,32 @@
 """Command-line interface for trading analytics"""
 
+import os
+import time
 import click
 import config
-from kraken import KrakenConnector
+from datetime import date, datetime, timedelta
+from analytics import compute_metrics, format_metrics, load_history
+from exports import FORMATS, export_filename, write_export
+import profiling
+import raw_payloads
 from database import Database
-from main import calculate_and_save_return
+from main import calculate_and_save_return, create_connector, sync_ledger
+from pnl import METHODS, format_pnl, latest_prices, update_pnl
 
 
 @click.group()
-def cli():
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Write a cProfile file for this command (to PROFILE_DIR or ./profiles)",
+)
+@click.pass_context
+def cli(ctx, profile):
     """Trading Analytics CLI"""
-    pass
+    if profile:
+        profiling.enable()
+    if ctx.invoked_subcommand:
+        ctx.with_resource(profiling.profile(f"cli-{ctx.invoked_subcommand}"))
 
 
 @cli.command()
@@ -18,12 +34,10 @@ def test_connection():
     """Test Kraken API connection"""
     click.echo("Testing Kraken connection...")
 
-    account_id = config.get_account_id(config.KRAKEN_API_KEY, config.ACCOUNT_ID)
-    click.echo(f"Account ID: {account_id}")
-
-    connector = KrakenConnector(
-        config.KRAKEN_API_KEY, config.KRAKEN_API_SECRET, account_id
-    )
+    connector = create_connector()
+    click.echo(f"Account ID: {connector.account_id}")
+    if config.FAKE_KRAKEN:
+        click.echo(f"Using the offline stand-in (FAKE_KRAKEN={config.FAKE_KRAKEN})")
 
     if connector.test_connection():
         click.echo("✅ Connection successful!")
@@ -36,13 +50,8 @@ def pull_balance():
     """Pull current balance from Kraken, save to database, and calculate returns"""
     click.echo("Fetching balance from Kraken...")
 
-    # Setup
-    account_id = config.get_account_id(config.KRAKEN_API_KEY, config.ACCOUNT_ID)
-
-    # Fetch from Kraken
-    connector = KrakenConnector(
-        config.KRAKEN_API_KEY, config.KRAKEN_API_SECRET, account_id
-    )
+    # Fetch from Kraken (or the FAKE_KRAKEN stand-in)
+    connector = create_connector()
     balance = connector.get_account_balance()
 
     click.echo(f"Account: {balance['account_id']}")
@@ -51,10 +60,17 @@ def pull_balance():
 
     # Save to database
     click.echo("\nSaving to database...")
-    db = Database(config.DATABASE_URL)
+    db = Database(
+        config.DATABASE_URL,
+        raw_payload_mode=config.RAW_PAYLOAD_MODE,
+        partitioned=config.DB_PARTITIONING,
+    )
 
-    # Ensure returns table exists
+    # Ensure returns and holdings tables exist
     db.create_returns_table()
+    db.create_balance_holdings_table()
+    db.create_raw_payloads_table()
+    db.create_summary_tables()
 
     db.save_balance_snapshot(balance)
 
@@ -84,11 +100,14 @@ def show_balance(account):
     click.echo(f"Date: {balance['snapshot_date']}")
     click.echo(f"Total (USD): ${balance['total_balance_usd']:,.2f}\n")
 
-    # Parse balances (handle both dict and JSON string)
+    # Normalized holdings, else parse balances (handle both dict and JSON string)
     import json
 
+    holdings = db.get_holdings(balance["id"], balance["snapshot_date"])
     balances_raw = balance["balances"]
-    if isinstance(balances_raw, str):
+    if holdings:
+        balances_dict = {h["asset"]: h for h in holdings}
+    elif isinstance(balances_raw, str):
         balances_dict = json.loads(balances_raw)
     else:
         balances_dict = balances_raw
@@ -192,6 +211,463 @@ def latest_return(account):
     click.echo(f"Change: {sign}${return_usd:,.2f} ({sign}{return_pct:.2f}%)")
 
 
+@cli.command()
+@click.option(
+    "--period", type=click.Choice(["week", "month"]), default="week", help="Rollup"
+)
+@click.option("--limit", default=12, help="Number of periods to show")
+@click.option("--account", default=None, help="Specific account ID")
+def rollups(period, limit, account):
+    """Show weekly or monthly balance and return rollups"""
+    db = Database(config.DATABASE_URL)
+    rows = db.get_rollups(period, "kraken", account, limit)
+
+    if not rows:
+        click.echo("No rollups found. Run 'refresh_summaries' to build them.")
+        return
+
+    click.echo(f"\n📅 {period.capitalize()}ly Returns\n")
+    click.echo(
+        f"{'Account':<16} {'Start':<12} {'Close':>14} {'Return USD':>14} "
+        f"{'Return %':>9} {'Days':>5}"
+    )
+    click.echo("-" * 75)
+    for r in rows:
+        return_usd = float(r["return_usd"])
+        return_pct = r["return_pct"]
+        sign = "+" if return_usd >= 0 else ""
+        pct = f"{sign}{float(return_pct):.2f}%" if return_pct is not None else "n/a"
+        click.echo(
+            f"{r['account_id']:<16} {str(r['period_start']):<12} "
+            f"${float(r['close_balance_usd']):>13,.2f} {sign}${return_usd:>12,.2f} "
+            f"{pct:>9} {r['snapshot_count']:>5}"
+        )
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID (default: all)")
+def refresh_summaries(account):
+    """Rebuild account summaries and weekly/monthly rollups from history"""
+    db = Database(config.DATABASE_URL)
+    db.create_returns_table()
+    db.create_summary_tables()
+
+    started = time.perf_counter()
+    result = db.refresh_summaries("kraken", account)
+    click.echo(
+        f"✅ {result['summaries']:,} account summaries and {result['rollups']:,} "
+        f"rollups rebuilt in {time.perf_counter() - started:.2f}s"
+    )
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID")
+@click.option("--days", default=None, type=int, help="Only use the last N days")
+@click.option("--risk-free", default=0.0, help="Annual risk-free rate (e.g. 0.04)")
+def analytics(account, days, risk_free):
+    """Show cumulative, rolling and risk-adjusted return statistics"""
+    db = Database(config.DATABASE_URL)
+    start_date = date.today() - timedelta(days=days) if days else None
+    balances, flows = load_history(db, "kraken", account, start_date)
+
+    if balances.empty:
+        click.echo("No balance history found")
+        return
+
+    metrics = compute_metrics(balances, risk_free_rate=risk_free, flows=flows)
+    click.echo("\n📐 Return Analytics\n")
+    for account_id, row in metrics.iterrows():
+        click.echo(format_metrics(account_id, row))
+        click.echo()
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID (default: all)")
+@click.option(
+    "--method",
+    type=click.Choice(METHODS),
+    default=config.COST_BASIS_METHOD,
+    help="Lot matching method",
+)
+@click.option(
+    "--rebuild", is_flag=True, help="Replay all trades, ignoring the checkpoint"
+)
+def pnl(account, method, rebuild):
+    """Show realized and unrealized PnL per asset from the trades table"""
+    db = Database(config.DATABASE_URL)
+    db.create_sync_checkpoints_table()
+    accounts = [account] if account else [a["account_id"] for a in db.list_accounts()]
+
+    if not accounts:
+        click.echo("No accounts found")
+        return
+
+    click.echo(f"\n💹 PnL ({method})\n")
+    for account_id in accounts:
+        started = time.perf_counter()
+        engine = update_pnl(db, "kraken", account_id, method, rebuild)
+        report = engine.report(latest_prices(db, "kraken", account_id))
+        click.echo(format_pnl(account_id, report))
+        click.echo(
+            f"{engine.count:,} trades matched in {time.perf_counter() - started:.2f}s\n"
+        )
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID (default: all)")
+@click.option("--start", default=None, help="First return date to rebuild (YYYY-MM-DD)")
+@click.option("--end", default=None, help="Last return date to rebuild (YYYY-MM-DD)")
+def backfill_returns(account, start, end):
+    """Recompute flow-adjusted daily returns from stored snapshots in one SQL pass"""
+    db = Database(config.DATABASE_URL)
+    db.create_returns_table()
+    db.value_ledger_flows("kraken", account)
+
+    started = time.perf_counter()
+    result = db.recompute_returns("kraken", account, start, end)
+    elapsed = time.perf_counter() - started
+
+    click.echo(
+        f"✅ Rebuilt {result['upserted']:,} daily returns "
+        f"({result['deleted']:,} stale removed) in {elapsed:.2f}s"
+    )
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID (default: all)")
+@click.option("--hours", default=24, help="Hours of samples to show")
+def intraday(account, hours):
+    """Show the intraday equity curve"""
+    db = Database(config.DATABASE_URL)
+    since = datetime.now() - timedelta(hours=hours)
+    rows = db.get_intraday_history("kraken", account, since)
+
+    if not rows:
+        click.echo("No intraday samples (set INTRADAY_INTERVAL_MINUTES)")
+        return
+
+    click.echo(f"\n⏱️  Intraday Balance (last {hours}h)\n")
+    click.echo(f"{'Account':<20} {'Time':<20} {'Res.':>6} {'Balance (USD)':>15}")
+    click.echo("-" * 65)
+    for row in rows:
+        click.echo(
+            f"{row['account_id']:<20} {row['snapshot_time']:%Y-%m-%d %H:%M}     "
+            f"{row['resolution_seconds'] // 60:>5}m ${row['total_balance_usd']:>14,.2f}"
+        )
+
+
+@cli.command()
+@click.option("--account", default=None, help="Specific account ID (default: all)")
+@click.option("--start", default=None, help="First day to roll up (YYYY-MM-DD)")
+@click.option("--end", default=None, help="Last day to roll up (YYYY-MM-DD)")
+def rollup_daily(account, start, end):
+    """Rebuild daily snapshots from the last intraday sample of each day"""
+    db = Database(config.DATABASE_URL, partitioned=config.DB_PARTITIONING)
+    start = date.fromisoformat(start) if start else None
+    end = date.fromisoformat(end) if end else None
+
+    started = time.perf_counter()
+    written = db.rollup_daily_snapshots("kraken", account, start, end)
+    click.echo(
+        f"✅ Rolled up {written:,} daily snapshots in {time.perf_counter() - started:.2f}s"
+    )
+    click.echo("Run backfill_returns over the same range to refresh daily returns")
+
+
+@cli.command()
+@click.option(
+    "--rules",
+    default=config.INTRADAY_COMPACTION,
+    help="age:resolution pairs, e.g. 7d:1h,90d:1d",
+)
+@click.option(
+    "--retention-days",
+    default=config.INTRADAY_RETENTION_DAYS,
+    help="Delete samples older than this (0 keeps all)",
+)
+def compact_intraday(rules, retention_days):
+    """Downsample old intraday samples and expire the oldest"""
+    try:
+        rules = config.parse_compaction_rules(rules)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    db = Database(config.DATABASE_URL)
+    result = db.compact_intraday_snapshots(rules, retention_days)
+    click.echo(
+        f"✅ {result['downsampled']:,} samples downsampled, "
+        f"{result['expired']:,} expired"
+    )
+
+
+@cli.command()
+@click.option(
+    "--kind",
+    type=click.Choice(["balances", "returns", "trades"]),
+    default="trades",
+    help="What to export",
+)
+@click.option(
+    "--format", "fmt", type=click.Choice(list(FORMATS)), default=config.EXPORT_FORMAT
+)
+@click.option("--limit", default=None, type=int, help="Newest N rows (default: all)")
+@click.option("--account", default=None, help="Specific account ID")
+@click.option(
+    "--output", default=None, help="Output path (default: <kind>_<time>.<ext>)"
+)
+def export(kind, fmt, limit, account, output):
+    """Export balances, returns or trades to CSV, compressed CSV or Parquet"""
+    db = Database(config.DATABASE_URL)
+    output = output or export_filename(kind, fmt)
+
+    started = time.perf_counter()
+    try:
+        with open(output, "wb") as f:
+            rows = write_export(db, kind, f, fmt, "kraken", account, limit)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+
+    size = os.path.getsize(output)
+    click.echo(
+        f"✅ Exported {rows:,} {kind} rows to {output} "
+        f"({size / 1024:,.0f} KiB in {elapsed:.2f}s)"
+    )
+
+
+@cli.command()
+@click.option("--max-pages", default=None, type=int, help="Cap on pages this run")
+def sync_ledger_entries(max_pages):
+    """Sync the Kraken ledger for every account and re-net affected returns"""
+    db = Database(config.DATABASE_URL)
+    db.create_returns_table()
+    db.create_sync_checkpoints_table()
+
+    for account in config.load_accounts():
+        account_id = account["account_id"]
+        stats = sync_ledger(db, create_connector(account), account_id, max_pages)
+        since = db.value_ledger_flows("kraken", account_id)
+        status = "complete" if stats["complete"] else "paused, resumes next run"
+        click.echo(
+            f"{account_id}: {stats['inserted']:,} new ledger entries "
+            f"({stats['pages']} pages, {status})"
+        )
+        if since:
+            result = db.recompute_returns("kraken", account_id, start_date=since)
+            click.echo(
+                f"  Returns since {since} re-netted ({result['upserted']:,} days)"
+            )
+
+
+@cli.command()
+@click.option("--limit", default=20, help="Number of flows to show")
+@click.option("--account", default=None, help="Specific account ID")
+def flows(limit, account):
+    """Show recent deposits, withdrawals and transfers"""
+    db = Database(config.DATABASE_URL)
+    rows = db.get_ledger_flows("kraken", account, limit)
+
+    if not rows:
+        click.echo("No deposits or withdrawals found. Run 'sync_ledger_entries'.")
+        return
+
+    click.echo(f"\n🏦 Cash Flows (Last {len(rows)})\n")
+    click.echo(
+        f"{'Time':<20} {'Account':<15} {'Type':<11} {'Currency':<8} "
+        f"{'Amount':>18} {'USD':>14}"
+    )
+    click.echo("-" * 91)
+    for row in rows:
+        usd = (
+            f"${float(row['usd_value']):,.2f}"
+            if row["usd_value"] is not None
+            else "n/a"
+        )
+        click.echo(
+            f"{row['entry_timestamp']:%Y-%m-%d %H:%M:%S} "
+            f"{row['account_id']:<15} {row['entry_type']:<11} {row['currency']:<8} "
+            f"{float(row['amount']):>18,.8f} {usd:>14}"
+        )
+
+
+@cli.command()
+def migrate_holdings():
+    """Copy per-asset balances from snapshot JSONB into balance_holdings"""
+    db = Database(config.DATABASE_URL)
+    db.create_balance_holdings_table()
+    inserted = db.migrate_balance_holdings()
+    click.echo(f"✅ Migrated {inserted:,} holdings")
+
+
+@cli.command()
+@click.argument("asset")
+@click.option("--limit", default=30, help="Number of snapshots to show")
+@click.option("--account", default=None, help="Specific account ID")
+def asset_history(asset, limit, account):
+    """Show one asset's amount, price and USD value over time"""
+    db = Database(config.DATABASE_URL)
+    rows = db.get_asset_history(asset.upper(), "kraken", account, limit)
+
+    if not rows:
+        click.echo(f"No holdings history found for {asset.upper()}")
+        return
+
+    click.echo(f"\n🪙 {asset.upper()} History (Last {len(rows)} snapshots)\n")
+    click.echo(f"{'Date':<12} {'Account':<15} {'Amount':>18} {'Price':>14} {'USD':>14}")
+    click.echo("-" * 77)
+    for row in rows:
+        price = f"${float(row['price']):,.4f}" if row["price"] is not None else "n/a"
+        click.echo(
+            f"{str(row['snapshot_date']):<12} "
+            f"{row['account_id']:<15} "
+            f"{float(row['amount']):>18,.8f} "
+            f"{price:>14} "
+            f"${float(row['usd_value']):>13,.2f}"
+        )
+
+
+@cli.command()
+@click.option(
+    "--mode",
+    type=click.Choice(raw_payloads.MODES),
+    required=True,
+    help="Target storage mode",
+)
+@click.option("--batch-size", default=1000, help="Rows converted per transaction")
+def migrate_raw_payloads(mode, batch_size):
+    """Convert stored raw payloads on trades and snapshots to another mode"""
+    db = Database(config.DATABASE_URL)
+    db.create_raw_payloads_table()
+
+    started = time.perf_counter()
+    result = db.migrate_raw_payloads(mode, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+
+    for table in ("trades", "balance_snapshots"):
+        click.echo(f"{table}: {result[table]:,} rows converted to {mode}")
+    click.echo(f"raw_payloads: {result['orphans_deleted']:,} orphans deleted")
+    click.echo(f"✅ Done in {elapsed:.1f}s — run VACUUM FULL to reclaim disk space")
+
+
+@cli.command()
+@click.option("--limit", default=1000, help="Rows fetched by the latency probes")
+def raw_payload_report(limit):
+    """Show raw payload storage size and hot-query latency"""
+    db = Database(config.DATABASE_URL)
+    report = db.raw_payload_report()
+
+    click.echo("\n📦 Table Sizes (MiB)\n")
+    click.echo(f"{'Table':<20} {'Heap':>9} {'TOAST':>9} {'Indexes':>9} {'Total':>9}")
+    click.echo("-" * 60)
+    for name, sizes in report["tables"].items():
+        mib = {k: v / 1024**2 for k, v in sizes.items()}
+        click.echo(
+            f"{name:<20} {mib['heap']:>9,.1f} {mib['toast']:>9,.1f} "
+            f"{mib['indexes']:>9,.1f} {mib['total']:>9,.1f}"
+        )
+
+    click.echo("\n🗜️  Payload Storage\n")
+    click.echo(
+        f"{'Table':<20} {'Rows':>10} {'JSONB':>10} {'Compr.':>10} {'Offload':>10} "
+        f"{'JSONB MiB':>10} {'Compr. MiB':>11}"
+    )
+    click.echo("-" * 87)
+    for name, st in report["storage"].items():
+        click.echo(
+            f"{name:<20} {st['rows']:>10,} {st['jsonb']:>10,} "
+            f"{st['compressed']:>10,} {st['offload']:>10,} "
+            f"{st['jsonb_bytes'] / 1024**2:>10,.1f} "
+            f"{st['compressed_bytes'] / 1024**2:>11,.1f}"
+        )
+
+    click.echo("\n⏱️  Hot Query Latency\n")
+    for label, query in (
+        ("get_all_trades", lambda: db.get_all_trades("kraken", limit=limit)),
+        ("get_all_balances", lambda: db.get_all_balances("kraken", limit=limit)),
+    ):
+        query()  # warm the connection and cache
+        started = time.perf_counter()
+        rows = query()
+        elapsed = time.perf_counter() - started
+        click.echo(f"{label:<20} {len(rows):>6,} rows in {elapsed * 1000:>8.1f} ms")
+
+
+@cli.command()
+def partitions():
+    """List partitions of trades, snapshots and holdings"""
+    db = Database(config.DATABASE_URL)
+    rows = db.list_partitions()
+
+    if not rows:
+        click.echo(
+            "No partitioned tables (set DB_PARTITIONING=true or run partition_tables)"
+        )
+        return
+
+    click.echo(f"\n🗂️  Partitions\n")
+    click.echo(f"{'Partition':<30} {'Rows (est.)':>12} {'MiB':>9}  Bounds")
+    click.echo("-" * 90)
+    for row in rows:
+        click.echo(
+            f"{row['partition']:<30} {row['estimated_rows']:>12,} "
+            f"{row['total_bytes'] / 1024**2:>9,.1f}  {row['bounds']}"
+        )
+
+
+@cli.command()
+@click.confirmation_option(
+    prompt="This locks trades and snapshots while copying. Stop the bot and cron first. Continue?"
+)
+def partition_tables():
+    """Convert existing trades/snapshots/holdings tables to monthly partitions"""
+    db = Database(config.DATABASE_URL)
+    started = time.perf_counter()
+    copied = db.partition_tables()
+    db.create_raw_payloads_table()
+
+    if not copied:
+        click.echo("Nothing to convert: tables are already partitioned or missing")
+        return
+    for table, rows in copied.items():
+        click.echo(f"{table}: {rows:,} rows copied (old table kept as {table}_old)")
+    click.echo(f"✅ Done in {time.perf_counter() - started:.1f}s")
+    click.echo(
+        "Verify, then: DROP TABLE balance_holdings_old, balance_snapshots_old, trades_old"
+    )
+
+
+@cli.command()
+@click.option(
+    "--trades-months",
+    default=config.TRADES_RETENTION_MONTHS,
+    help="Months of trades kept (0 keeps all)",
+)
+@click.option(
+    "--snapshots-months",
+    default=config.SNAPSHOTS_RETENTION_MONTHS,
+    help="Months of snapshots and holdings kept (0 keeps all)",
+)
+@click.option(
+    "--drop", is_flag=True, help="Drop retired partitions instead of archiving them"
+)
+def maintain_partitions(trades_months, snapshots_months, drop):
+    """Create upcoming partitions and retire ones past retention"""
+    db = Database(config.DATABASE_URL)
+    result = db.maintain_partitions(
+        {"trades": trades_months, "balance_snapshots": snapshots_months},
+        archive=not drop and config.RETENTION_ARCHIVE,
+        months_ahead=config.PARTITION_PREMAKE_MONTHS,
+    )
+
+    for table, created in result["created"].items():
+        click.echo(f"{table}: {created} partitions created")
+    for table, retired in result["retired"].items():
+        action = "dropped" if drop or not config.RETENTION_ARCHIVE else "archived"
+        click.echo(f"{table}: {len(retired)} partitions {action}")
+        for name in retired:
+            click.echo(f"  - {name}")
+
+
 @cli.command()
 def list_accounts():
     """List all tracked accounts"""
@@ -214,5 +690,50 @@ def list_accounts():
         )
 
 
+@cli.command()
+@click.option("--dir", "directory", default=None, help="Profile directory")
+@click.option("--name", default=None, help="Only runs of this name (e.g. bot-pull)")
+@click.option("--hours", default=24, help="Only runs started this recently (0: all)")
+@click.option("--limit", default=10, help="Number of runs to list")
+@click.option("--top", default=15, help="Functions shown for the slowest run")
+@click.option(
+    "--sort",
+    type=click.Choice(["cumulative", "tottime"]),
+    default="cumulative",
+    help="Function ordering",
+)
+def profiles(directory, name, hours, limit, top, sort):
+    """List the slowest recent profiled runs and summarize the slowest"""
+    directory = directory or config.PROFILE_DIR or "profiles"
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+    runs = profiling.list_profiles(directory, name, since)
+
+    if not runs:
+        click.echo(f"No profiles in {directory}")
+        return
+
+    click.echo(f"\n{'Started':<20} {'Name':<24} {'Duration':>12}  File")
+    click.echo("-" * 90)
+    for run in runs[:limit]:
+        click.echo(
+            f"{run['started']:%Y-%m-%d %H:%M:%S}  {run['name']:<24} "
+            f"{run['duration_ms']:>10,}ms  {os.path.basename(run['path'])}"
+        )
+
+    if top:
+        slowest = runs[0]
+        click.echo(
+            f"\nTop functions of {slowest['name']} ({slowest['duration_ms']:,} ms) "
+            f"by {sort}:\n"
+        )
+        click.echo(f"{'Calls':>10} {'Own s':>9} {'Total s':>9}  Function")
+        for row in profiling.top_functions(slowest["path"], top, sort):
+            click.echo(
+                f"{row['calls']:>10,} {row['tottime']:>9.3f} {row['cumtime']:>9.3f}"
+                f"  {row['function']}"
+            )
+        click.echo(f"\nFull profile: python -m pstats {slowest['path']}")
+
+
 if __name__ == "__main__":
     cli()
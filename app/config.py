@@ -1,11 +1,16 @@
 """Configuration and settings"""
 
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Connection pool size for long-lived processes (set DB_POOL_MAX=0 to connect per call)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
 KRAKEN_API_KEY = os.getenv("KRAKEN_MAIN_API_KEY")
 KRAKEN_API_SECRET = os.getenv("KRAKEN_MAIN_API_SECRET")
 
@@ -15,6 +20,81 @@ ACCOUNT_ID = os.getenv("ACCOUNT_ID", None)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ALLOWED_USER_IDS = os.getenv("ALLOWED_USER_IDS")
 
+# Accounts registry (JSON list) and number of accounts snapshotted in parallel
+ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE", "accounts.json")
+SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "4"))
+
+# Ticker price cache: seconds before a cached price is refetched, and an optional
+# shared store ("postgres" or "file:/path/to/prices.json") for other processes
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "60"))
+PRICE_CACHE_STORE = os.getenv("PRICE_CACHE_STORE", "")
+
+# How raw ccxt payloads are kept on new trades/snapshots: jsonb (default), off,
+# compressed (zstd/zlib bytea) or offload (deduplicated raw_payloads table)
+RAW_PAYLOAD_MODE = os.getenv("RAW_PAYLOAD_MODE", "jsonb")
+
+# Monthly range partitioning for newly created trades/balance_snapshots/
+# balance_holdings tables (convert existing ones with cli.py partition_tables),
+# and months of partitions created ahead of the current month
+DB_PARTITIONING = os.getenv("DB_PARTITIONING", "false").lower() == "true"
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+
+# Retention for partitioned tables: whole months kept before the current one
+# (0 keeps everything). Older partitions are moved to the "archive" schema,
+# or dropped when RETENTION_ARCHIVE=false.
+TRADES_RETENTION_MONTHS = int(os.getenv("TRADES_RETENTION_MONTHS", "0"))
+SNAPSHOTS_RETENTION_MONTHS = int(os.getenv("SNAPSHOTS_RETENTION_MONTHS", "0"))
+RETENTION_ARCHIVE = os.getenv("RETENTION_ARCHIVE", "true").lower() == "true"
+
+# Seconds the bot reuses a query result (0 disables). Entries are also dropped
+# as soon as a write is announced on the database's kraken_writes channel.
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "300"))
+
+# Lot matching for realized/unrealized PnL over the trades table: fifo, lifo or average
+COST_BASIS_METHOD = os.getenv("COST_BASIS_METHOD", "fifo")
+
+# Default format for bot exports: csv, csv.gz, csv.zst (zstandard) or parquet (pyarrow)
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "csv")
+
+# Intraday snapshots: minutes between samples (0 disables), how old samples are
+# thinned ("age:resolution" pairs, e.g. "7d:1h,90d:1d") and days after which
+# samples are deleted (0 keeps them; daily rollups are always kept)
+INTRADAY_INTERVAL_MINUTES = int(os.getenv("INTRADAY_INTERVAL_MINUTES", "0"))
+INTRADAY_COMPACTION = os.getenv("INTRADAY_COMPACTION", "7d:1h,90d:1d")
+INTRADAY_RETENTION_DAYS = int(os.getenv("INTRADAY_RETENTION_DAYS", "365"))
+
+# In-process scheduler of the bot (scheduler.py), replacing the cron one-shot
+# runs: daily snapshot cron expression (local time) and the most random delay
+# added to each run. Intraday samples follow INTRADAY_INTERVAL_MINUTES.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SNAPSHOT_SCHEDULE = os.getenv("SNAPSHOT_SCHEDULE", "5 0 * * *")
+SCHEDULE_JITTER_SECONDS = float(os.getenv("SCHEDULE_JITTER_SECONDS", "30"))
+
+# Port of the bot's Prometheus /metrics endpoint (0 disables). Cron runs log a
+# JSON metrics summary at exit and also write it to METRICS_SUMMARY_FILE if set.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_SUMMARY_FILE = os.getenv("METRICS_SUMMARY_FILE", "")
+
+# Profiling (profiling.py): directory per-run cProfile files go to (empty
+# disables; `cli.py --profile` and `main.py --profile` enable it per run), the
+# shortest run worth keeping in milliseconds, and how many files to keep
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_MIN_MS = int(os.getenv("PROFILE_MIN_MS", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+# Offline stand-in for Kraken (fake_kraken.py): a spec such as
+# "accounts=20,keys=5,assets=15,trades=5000,latency=0.05,rate_limit=0.02".
+# Empty (default) talks to the real API.
+FAKE_KRAKEN = os.getenv("FAKE_KRAKEN", "")
+
+# Optional cap on trade history pages fetched per run (50 trades per page).
+# Unfinished backfills resume from their checkpoint on the next run.
+TRADE_SYNC_MAX_PAGES = (
+    int(os.getenv("TRADE_SYNC_MAX_PAGES"))
+    if os.getenv("TRADE_SYNC_MAX_PAGES")
+    else None
+)
+
 
 def get_account_id(api_key: str, account_name: str = None) -> str:
     """
@@ -36,3 +116,88 @@ def get_account_id(api_key: str, account_name: str = None) -> str:
 
     # Use last 8 characters of API key as fallback
     return api_key[-8:] if len(api_key) >= 8 else api_key
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text: str) -> int:
+    """Seconds in a duration like '90s', '5m', '1h', '7d' or '2w'"""
+    text = text.strip().lower()
+    if not text or text[-1] not in DURATION_UNITS or not text[:-1].isdigit():
+        raise ValueError(f"Invalid duration {text!r} (e.g. 5m, 1h, 7d)")
+    return int(text[:-1]) * DURATION_UNITS[text[-1]]
+
+
+def parse_compaction_rules(spec: str) -> list:
+    """
+    Parse intraday compaction rules
+
+    Args:
+        spec: Comma-separated "age:resolution" pairs, e.g. "7d:1h,90d:1d"
+
+    Returns:
+        List of (age_seconds, resolution_seconds) tuples, youngest first
+    """
+    rules = []
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        age, _, resolution = pair.partition(":")
+        rules.append((parse_duration(age), parse_duration(resolution)))
+    return sorted(rules)
+
+
+def load_accounts(path: str = None) -> list:
+    """
+    Load the accounts registry
+
+    The registry is a JSON list of objects with an "account_id" plus either
+    "api_key"/"api_secret" or the names of env vars holding them
+    ("api_key_env"/"api_secret_env"). Entries with "enabled": false are
+    skipped. Without a registry file, the KRAKEN_MAIN_API_KEY account is used,
+    or the FAKE_KRAKEN synthetic accounts when no key is set.
+
+    Args:
+        path: Registry file path (default: ACCOUNTS_FILE)
+
+    Returns:
+        List of dicts with account_id, api_key and api_secret
+    """
+    path = path or ACCOUNTS_FILE
+    if not os.path.exists(path):
+        if not KRAKEN_API_KEY and FAKE_KRAKEN:
+            from fake_kraken import fake_accounts, parse_spec
+
+            return fake_accounts(parse_spec(FAKE_KRAKEN))
+        if not KRAKEN_API_KEY:
+            return []
+        return [
+            {
+                "account_id": get_account_id(KRAKEN_API_KEY, ACCOUNT_ID),
+                "api_key": KRAKEN_API_KEY,
+                "api_secret": KRAKEN_API_SECRET,
+            }
+        ]
+
+    with open(path) as f:
+        entries = json.load(f)
+
+    accounts = []
+    for entry in entries:
+        if not entry.get("enabled", True):
+            continue
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""))
+        api_secret = entry.get("api_secret") or os.getenv(
+            entry.get("api_secret_env", "")
+        )
+        if not api_key or not api_secret:
+            raise ValueError(
+                f"Missing API credentials for account {entry.get('account_id')}"
+            )
+        accounts.append(
+            {
+                "account_id": get_account_id(api_key, entry.get("account_id")),
+                "api_key": api_key,
+                "api_secret": api_secret,
+            }
+        )
+    return accounts
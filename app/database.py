@@ -1,16 +1,458 @@
 """Database operations"""
 
 import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from contextlib import contextmanager
 import json
+import os
+import re
+import select
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
+
+import config
+import raw_payloads
+
+
+TRADE_COLUMNS = (
+    "exchange",
+    "account_id",
+    "trade_id",
+    "trade_timestamp",
+    "symbol",
+    "side",
+    "type",
+    "price",
+    "amount",
+    "cost",
+    "fee_cost",
+    "fee_currency",
+    "raw_data",
+    "raw_compressed",
+    "raw_hash",
+)
+
+# Columns read by the hot snapshot/trade queries; raw payloads are left out so
+# listing rows never pulls TOASTed JSON through the buffer cache
+SNAPSHOT_COLUMNS = (
+    "id, exchange, account_id, snapshot_date, timestamp, total_balance_usd, balances"
+)
+TRADE_READ_COLUMNS = ", ".join(
+    ("id",) + TRADE_COLUMNS[: TRADE_COLUMNS.index("raw_data")]
+)
+
+# NOTIFY channel announcing committed writes to readers that cache (the bot)
+WRITE_CHANNEL = "kraken_writes"
+
+# Tables whose rows carry a raw ccxt payload
+RAW_PAYLOAD_TABLES = ("trades", "balance_snapshots")
+
+# Tables range-partitioned by month (when partitioning is enabled) and their key
+PARTITION_KEYS = {
+    "trades": "trade_timestamp",
+    "balance_snapshots": "snapshot_date",
+    "balance_holdings": "snapshot_date",
+    "intraday_snapshots": "snapshot_time",
+}
+# Holdings reference snapshots, so they are retired together (holdings first)
+RETENTION_GROUPS = {
+    "trades": ("trades",),
+    "balance_snapshots": ("balance_holdings", "balance_snapshots"),
+}
+ARCHIVE_SCHEMA = "archive"
+PARTITION_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+# Export SELECTs (before WHERE) and their newest-first sort column. Timestamps
+# are truncated to whole seconds and numerics rounded to the stored precision.
+EXPORT_QUERIES = {
+    "balances": (
+        """
+        SELECT date_trunc('second', timestamp) AS timestamp,
+               ROUND(total_balance_usd, 2) AS total_balance_usd
+        FROM balance_snapshots
+        """,
+        "snapshot_date",
+    ),
+    "returns": (
+        """
+        SELECT return_date AS date,
+               previous_date,
+               ROUND(daily_return_usd, 2) AS return_usd,
+               ROUND(daily_return_pct, 2) AS return_pct,
+               ROUND(current_balance_usd, 2) AS balance_usd
+        FROM daily_returns
+        """,
+        "return_date",
+    ),
+    "trades": (
+        """
+        SELECT date_trunc('second', trade_timestamp) AS timestamp,
+               symbol,
+               UPPER(side) AS side,
+               type,
+               ROUND(amount, 8) AS amount,
+               ROUND(price, 8) AS price,
+               ROUND(cost, 2) AS cost,
+               fee_cost,
+               fee_currency,
+               trade_id
+        FROM trades
+        """,
+        "trade_timestamp",
+    ),
+}
+
+# balance_holdings rows exploded from the balances JSONB of snapshots `s`;
+# callers append further AND conditions
+HOLDINGS_FROM_JSONB = """
+    INSERT INTO balance_holdings (
+        snapshot_id, exchange, account_id, snapshot_date,
+        asset, amount, usd_value, price
+    )
+    SELECT
+        s.id, s.exchange, s.account_id, s.snapshot_date, h.key,
+        (h.value->>'amount')::numeric,
+        ROUND((h.value->>'usd_value')::numeric, 2),
+        COALESCE(
+            (h.value->>'price')::numeric,
+            (h.value->>'usd_value')::numeric
+                / NULLIF((h.value->>'amount')::numeric, 0)
+        )
+    FROM balance_snapshots s
+    CROSS JOIN LATERAL jsonb_each(s.balances) h
+    WHERE s.balances IS NOT NULL
+    AND jsonb_typeof(s.balances) = 'object'
+"""
+
+# Kraken ledger types that move value into or out of the account; returns
+# exclude them (staking/earn moves net to zero across the two ledger legs)
+LEDGER_FLOW_TYPES = ("deposit", "withdrawal", "transfer")
+
+# Periods kept in balance_rollups (date_trunc field names)
+ROLLUP_PERIODS = ("week", "month")
+
+# Upserts balance_rollups for every period touched by the balance_snapshots
+# rows matching {filter}; each period's return is measured against the last
+# snapshot before it (or the period's first snapshot for the first period).
+# Deposits/withdrawals are taken out of return_usd, and return_pct links the
+# period's daily time-weighted returns when there are any.
+ROLLUP_QUERY = """
+    WITH touched AS (
+        SELECT DISTINCT s.exchange, s.account_id, p.period,
+               date_trunc(p.period, s.snapshot_date)::date AS period_start
+        FROM balance_snapshots s
+        CROSS JOIN (VALUES {periods}) AS p(period)
+        WHERE {filter}
+    )
+    INSERT INTO balance_rollups AS r (
+        exchange, account_id, period, period_start, open_date, close_date,
+        open_balance_usd, close_balance_usd, high_balance_usd, low_balance_usd,
+        previous_close_usd, return_usd, return_pct, snapshot_count, updated_at
+    )
+    SELECT t.exchange, t.account_id, t.period, t.period_start,
+           a.open_date, a.close_date, a.open_balance, a.close_balance,
+           a.high_balance, a.low_balance, prev.total_balance_usd,
+           a.close_balance - COALESCE(prev.total_balance_usd, a.open_balance)
+               - COALESCE(f.net_flow, 0),
+           CASE WHEN f.days > 0 THEN ROUND((f.growth - 1) * 100, 4)
+           ELSE ROUND(
+               (a.close_balance - COALESCE(prev.total_balance_usd, a.open_balance))
+               / NULLIF(COALESCE(prev.total_balance_usd, a.open_balance), 0) * 100,
+               4
+           ) END,
+           a.snapshots, NOW()
+    FROM touched t
+    CROSS JOIN LATERAL (
+        SELECT MIN(snapshot_date) AS open_date,
+               MAX(snapshot_date) AS close_date,
+               (ARRAY_AGG(total_balance_usd ORDER BY snapshot_date))[1] AS open_balance,
+               (ARRAY_AGG(total_balance_usd ORDER BY snapshot_date DESC))[1]
+                   AS close_balance,
+               MAX(total_balance_usd) AS high_balance,
+               MIN(total_balance_usd) AS low_balance,
+               COUNT(*) AS snapshots
+        FROM balance_snapshots s
+        WHERE s.exchange = t.exchange AND s.account_id = t.account_id
+        AND s.snapshot_date >= t.period_start
+        AND s.snapshot_date < t.period_start + ('1 ' || t.period)::interval
+    ) a
+    LEFT JOIN LATERAL (
+        SELECT total_balance_usd FROM balance_snapshots s
+        WHERE s.exchange = t.exchange AND s.account_id = t.account_id
+        AND s.snapshot_date < t.period_start
+        ORDER BY s.snapshot_date DESC LIMIT 1
+    ) prev ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT SUM(r.net_flow_usd) AS net_flow,
+               EXP(SUM(LN(GREATEST(1 + r.daily_return_pct / 100, 1e-9)))) AS growth,
+               COUNT(*) AS days
+        FROM daily_returns r
+        WHERE r.exchange = t.exchange AND r.account_id = t.account_id
+        AND r.return_date >= t.period_start
+        AND r.return_date < t.period_start + ('1 ' || t.period)::interval
+    ) f ON TRUE
+    ON CONFLICT (exchange, account_id, period, period_start) DO UPDATE SET
+        open_date = EXCLUDED.open_date,
+        close_date = EXCLUDED.close_date,
+        open_balance_usd = EXCLUDED.open_balance_usd,
+        close_balance_usd = EXCLUDED.close_balance_usd,
+        high_balance_usd = EXCLUDED.high_balance_usd,
+        low_balance_usd = EXCLUDED.low_balance_usd,
+        previous_close_usd = EXCLUDED.previous_close_usd,
+        return_usd = EXCLUDED.return_usd,
+        return_pct = EXCLUDED.return_pct,
+        snapshot_count = EXCLUDED.snapshot_count,
+        updated_at = EXCLUDED.updated_at
+""".replace(
+    "{periods}", ", ".join(f"('{p}')" for p in ROLLUP_PERIODS)
+)
+
+# Copies each account's most recent daily return into account_summaries
+SUMMARY_RETURN_QUERY = """
+    UPDATE account_summaries a SET
+        return_date = r.return_date,
+        daily_return_usd = r.daily_return_usd,
+        daily_return_pct = r.daily_return_pct,
+        updated_at = NOW()
+    FROM (
+        SELECT DISTINCT ON (exchange, account_id)
+            exchange, account_id, return_date, daily_return_usd, daily_return_pct
+        FROM daily_returns
+        WHERE {filter}
+        ORDER BY exchange, account_id, return_date DESC
+    ) r
+    WHERE a.exchange = r.exchange AND a.account_id = r.account_id
+"""
+
+# Characters handed to COPY FROM STDIN per read
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def _local_timezone():
+    """
+    Zone of the naive local timestamps (balance_snapshots.timestamp) for SQL
+
+    Ledger entries and trades are naive UTC; AT TIME ZONE with this value
+    converts between the two. That is the TZ name Python's local time
+    follows when set (the container sets it), else the current UTC offset.
+    """
+    return os.getenv("TZ", "").lstrip(":") or datetime.now().astimezone().utcoffset()
+
+
+def _bucket_start(value: datetime, seconds: int) -> datetime:
+    """Start of value's seconds-long bucket, counted like extract(epoch) in SQL"""
+    epoch = datetime(1970, 1, 1)
+    elapsed = (value - epoch) // timedelta(seconds=seconds)
+    return epoch + elapsed * timedelta(seconds=seconds)
+
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _copy_text(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bytes, memoryview)):
+        # bytea hex input, with the backslash escaped for COPY text format
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, str):
+        return (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    return str(value)
+
+
+class _CopyRowStream:
+    """File-like object that renders rows in COPY text format on demand"""
+
+    def __init__(self, rows: Iterable[list]):
+        self._rows = iter(rows)
+        self._pending = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._pending]
+        buffered = len(self._pending)
+        while size < 0 or buffered < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "\t".join([_copy_text(v) for v in row]) + "\n"
+            parts.append(line)
+            buffered += len(line)
+
+        data = "".join(parts)
+        if size < 0:
+            chunk, self._pending = data, ""
+        else:
+            chunk, self._pending = data[:size], data[size:]
+        return chunk
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool with blocking checkout and stats
+
+    ThreadedConnectionPool raises immediately when exhausted, so checkouts are
+    gated by a semaphore sized to maxconn; callers wait up to `timeout` seconds
+    for a free connection instead of failing.
+    """
+
+    def __init__(
+        self,
+        connection_string: str,
+        minconn: int = 1,
+        maxconn: int = 5,
+        timeout: float = 30.0,
+        health_check_after: float = 30.0,
+    ):
+        self._pool = ThreadedConnectionPool(minconn, maxconn, connection_string)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "health_checks": 0,
+            "discarded": 0,
+            "in_use": 0,
+        }
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0)
+        if idle < self.health_check_after:
+            return True
+        with self._lock:
+            self.stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            waited = time.perf_counter() - started
+            with self._lock:
+                self.stats["waits"] += 1
+                self.stats["wait_time"] += waited
+            if not acquired:
+                raise PoolError(
+                    f"No database connection available after {self.timeout:.0f}s"
+                )
+
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                with self._lock:
+                    self.stats["discarded"] += 1
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.stats["checkouts"] += 1
+            self.stats["in_use"] += 1
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        close = close or conn.closed != 0
+        if close:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self.stats["in_use"] -= 1
+            self._slots.release()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "minconn": self.minconn, "maxconn": self.maxconn}
+
+    def close(self):
+        self._pool.closeall()
 
 
 class Database:
-    def __init__(self, connection_string: str):
+    # save_trades switches to COPY for batches at least this large
+    COPY_THRESHOLD = 1000
+
+    def __init__(
+        self,
+        connection_string: str,
+        pool_min: int = None,
+        pool_max: int = None,
+        raw_payload_mode: str = "jsonb",
+        partitioned: bool = False,
+        partition_premake_months: int = None,
+    ):
+        """
+        Args:
+            connection_string: PostgreSQL DSN
+            pool_min: Connections kept open by the pool (pooled mode only)
+            pool_max: Maximum pooled connections. None or 0 connects per call.
+            raw_payload_mode: How new rows keep raw ccxt payloads (raw_payloads.MODES)
+            partitioned: Create trades/balance_snapshots/balance_holdings as
+                monthly range-partitioned tables (existing tables are untouched)
+            partition_premake_months: Monthly partitions created ahead of the
+                current month (default: config.PARTITION_PREMAKE_MONTHS)
+        """
+        if raw_payload_mode not in raw_payloads.MODES:
+            raise ValueError(f"Unknown raw payload mode {raw_payload_mode!r}")
         self.connection_string = connection_string
+        self.raw_payload_mode = raw_payload_mode
+        self.partitioned = partitioned
+        self.partition_premake_months = (
+            config.PARTITION_PREMAKE_MONTHS
+            if partition_premake_months is None
+            else partition_premake_months
+        )
+        # table -> set of partition months, or None for a plain table
+        self._partitions = {}
+        self._partition_lock = threading.Lock()
+        # Set once account_summaries/balance_rollups are known to exist
+        self._summaries_ready = False
+        # Table groups ensure_snapshot_schema() already created on this instance
+        self._schema_ready = set()
+        self._schema_lock = threading.Lock()
+        self.pool = (
+            ConnectionPool(connection_string, pool_min or 1, pool_max)
+            if pool_max
+            else None
+        )
 
     def _decimal_to_str(self, obj):
         if isinstance(obj, Decimal):
@@ -23,15 +465,77 @@ class Database:
 
     @contextmanager
     def get_connection(self):
-        conn = psycopg2.connect(self.connection_string)
+        if self.pool is None:
+            conn = psycopg2.connect(self.connection_string)
+        else:
+            conn = self.pool.getconn()
+        broken = False
         try:
             yield conn
             conn.commit()
         except Exception:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
             raise
         finally:
-            conn.close()
+            if self.pool is None:
+                conn.close()
+            else:
+                self.pool.putconn(conn, close=broken)
+
+    def pool_stats(self) -> Optional[dict]:
+        return self.pool.get_stats() if self.pool else None
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+    def _notify_write(self, cur, table: str, account_id: str = None):
+        """Queue a WRITE_CHANNEL notification, delivered when the transaction commits"""
+        cur.execute(
+            "SELECT pg_notify(%s, %s)",
+            (WRITE_CHANNEL, json.dumps({"table": table, "account_id": account_id})),
+        )
+
+    def listen_writes(self, callback, stop_event, poll_seconds: float = 5.0):
+        """
+        Deliver WRITE_CHANNEL notifications until stop_event is set
+
+        Blocks on a dedicated autocommit connection, outside the pool.
+        callback receives each payload ({"table", "account_id"}), or None
+        after (re)connecting since notifications may have been missed.
+
+        Args:
+            callback: Called with a payload dict or None
+            stop_event: threading.Event ending the loop
+            poll_seconds: Wait between checks of stop_event and reconnects
+        """
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.connection_string)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {WRITE_CHANNEL}")
+                callback(None)
+                while not stop_event.is_set():
+                    if not select.select([conn], [], [], poll_seconds)[0]:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            callback(json.loads(notify.payload))
+                        except ValueError:
+                            callback(None)
+            except psycopg2.Error as e:
+                print(f"Write listener disconnected ({e}), reconnecting")
+                stop_event.wait(poll_seconds)
+            finally:
+                if conn is not None:
+                    conn.close()
 
     def create_returns_table(self):
         query = """
@@ -50,18 +554,57 @@ class Database:
             );
             CREATE INDEX IF NOT EXISTS idx_returns_exchange_account 
             ON daily_returns(exchange, account_id, return_date DESC);
+            ALTER TABLE daily_returns
+            ADD COLUMN IF NOT EXISTS net_flow_usd NUMERIC(20,2) NOT NULL DEFAULT 0;
         """
+        # Returns are computed net of the ledger's deposits and withdrawals
+        self.create_ledger_table()
         with self.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(query)
         print("Daily returns table created/verified")
 
-    def create_trades_table(self):
-        query = """
-            CREATE TABLE IF NOT EXISTS trades (
+    def create_ledger_table(self):
+        # amount is signed (negative for withdrawals); usd_value is filled in
+        # for flow entries by value_ledger_flows()
+        query = f"""
+            CREATE TABLE IF NOT EXISTS ledger_entries (
                 id SERIAL PRIMARY KEY,
                 exchange VARCHAR(50) NOT NULL,
                 account_id VARCHAR(100) NOT NULL,
+                entry_id VARCHAR(100) NOT NULL,
+                reference_id VARCHAR(100),
+                entry_timestamp TIMESTAMP NOT NULL,
+                entry_type VARCHAR(30) NOT NULL,
+                subtype VARCHAR(30),
+                currency VARCHAR(20) NOT NULL,
+                amount NUMERIC(30,10) NOT NULL,
+                fee NUMERIC(30,10),
+                balance NUMERIC(30,10),
+                usd_value NUMERIC(20,2),
+                UNIQUE(exchange, account_id, entry_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_ledger_exchange_account
+            ON ledger_entries(exchange, account_id, entry_timestamp DESC);
+            CREATE INDEX IF NOT EXISTS idx_ledger_flows
+            ON ledger_entries(exchange, account_id, entry_timestamp)
+            INCLUDE (usd_value)
+            WHERE entry_type IN ({", ".join(f"'{t}'" for t in LEDGER_FLOW_TYPES)});
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+        print("Ledger entries table created/verified")
+
+    def _trades_ddl(self, partitioned: bool) -> str:
+        # A partitioned table needs the partition key in every unique constraint;
+        # trade ids never change timestamp, so dedup is unaffected
+        key = ", trade_timestamp" if partitioned else ""
+        return f"""
+            CREATE TABLE IF NOT EXISTS trades (
+                id SERIAL,
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
                 trade_id VARCHAR(100) NOT NULL,
                 trade_timestamp TIMESTAMP NOT NULL,
                 symbol VARCHAR(20) NOT NULL,
@@ -73,22 +616,26 @@ class Database:
                 fee_cost NUMERIC(20,8),
                 fee_currency VARCHAR(10),
                 raw_data JSONB,
-                UNIQUE(exchange, account_id, trade_id)
-            );
+                raw_compressed BYTEA,
+                raw_hash BYTEA,
+                PRIMARY KEY (id{key}),
+                UNIQUE(exchange, account_id, trade_id{key})
+            ){" PARTITION BY RANGE (trade_timestamp)" if partitioned else ""};
             CREATE INDEX IF NOT EXISTS idx_trades_exchange_account 
             ON trades(exchange, account_id, trade_timestamp DESC);
             CREATE INDEX IF NOT EXISTS idx_trades_symbol 
             ON trades(symbol, trade_timestamp DESC);
         """
-        with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query)
+
+    def create_trades_table(self):
+        self._create_table("trades", self._trades_ddl)
         print("Trades table created/verified")
 
-    def create_balance_snapshots_table(self):
-        query = """
+    def _snapshots_ddl(self, partitioned: bool) -> str:
+        key = ", snapshot_date" if partitioned else ""
+        return f"""
             CREATE TABLE IF NOT EXISTS balance_snapshots (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 exchange VARCHAR(50) NOT NULL,
                 account_id VARCHAR(100) NOT NULL,
                 snapshot_date DATE NOT NULL,
@@ -96,57 +643,1227 @@ class Database:
                 total_balance_usd NUMERIC(20,2) NOT NULL,
                 balances JSONB,
                 raw_data JSONB,
+                raw_compressed BYTEA,
+                raw_hash BYTEA,
+                PRIMARY KEY (id{key}),
                 UNIQUE(exchange, account_id, snapshot_date)
-            );
+            ){" PARTITION BY RANGE (snapshot_date)" if partitioned else ""};
             CREATE INDEX IF NOT EXISTS idx_snapshots_exchange_account 
             ON balance_snapshots(exchange, account_id, snapshot_date DESC);
         """
+
+    def create_balance_snapshots_table(self):
+        self._create_table("balance_snapshots", self._snapshots_ddl)
+        print("Balance snapshots table created/verified")
+
+    def _holdings_ddl(self, partitioned: bool) -> str:
+        # exchange/account_id/snapshot_date are copied from the snapshot so
+        # per-asset history is an index-only range scan without a join
+        if partitioned:
+            key, columns = ", snapshot_date", "snapshot_id, snapshot_date"
+            referenced = "id, snapshot_date"
+        else:
+            key, columns, referenced = "", "snapshot_id", "id"
+        return f"""
+            CREATE TABLE IF NOT EXISTS balance_holdings (
+                snapshot_id INTEGER NOT NULL,
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
+                snapshot_date DATE NOT NULL,
+                asset VARCHAR(20) NOT NULL,
+                amount NUMERIC(30,10) NOT NULL,
+                usd_value NUMERIC(20,2) NOT NULL,
+                price NUMERIC(30,10),
+                PRIMARY KEY (snapshot_id, asset{key}),
+                FOREIGN KEY ({columns})
+                    REFERENCES balance_snapshots({referenced}) ON DELETE CASCADE
+            ){" PARTITION BY RANGE (snapshot_date)" if partitioned else ""};
+            CREATE INDEX IF NOT EXISTS idx_holdings_asset_history
+            ON balance_holdings(exchange, account_id, asset, snapshot_date DESC)
+            INCLUDE (amount, usd_value, price);
+        """
+
+    def create_balance_holdings_table(self):
+        self._create_table("balance_holdings", self._holdings_ddl)
+        print("Balance holdings table created/verified")
+
+    def _intraday_ddl(self, partitioned: bool) -> str:
+        key = ", snapshot_time" if partitioned else ""
+        return f"""
+            CREATE TABLE IF NOT EXISTS intraday_snapshots (
+                id BIGSERIAL,
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
+                snapshot_time TIMESTAMP NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                resolution_seconds INTEGER NOT NULL,
+                total_balance_usd NUMERIC(20,2) NOT NULL,
+                balances JSONB,
+                PRIMARY KEY (id{key}),
+                UNIQUE(exchange, account_id, snapshot_time)
+            ){" PARTITION BY RANGE (snapshot_time)" if partitioned else ""};
+        """
+
+    def create_intraday_snapshots_table(self):
+        # The unique key's index serves per-account range scans
+        self._create_table("intraday_snapshots", self._intraday_ddl)
+        print("Intraday snapshots table created/verified")
+
+    def _create_table(self, table: str, ddl):
+        """
+        Create a table that may be partitioned, plus its upcoming partitions
+
+        New tables are partitioned when self.partitioned is set; holdings
+        follow whatever balance_snapshots is, since their foreign key must
+        include the partition key. Existing tables are left as they are.
+        """
         with self.get_connection() as conn:
             with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+                exists = cur.fetchone()[0]
+                if table == "balance_holdings":
+                    partitioned = self._is_partitioned(cur, "balance_snapshots")
+                else:
+                    partitioned = self.partitioned
+                if exists and partitioned and not self._is_partitioned(cur, table):
+                    print(
+                        f"{table} is not partitioned; run cli.py partition_tables "
+                        "to convert it"
+                    )
+                cur.execute(ddl(partitioned))
+        self._partitions.pop(table, None)
+        today = date.today()
+        self._ensure_partitions(
+            table, today, _add_months(today, self.partition_premake_months)
+        )
+
+    def _is_partitioned(self, cur, table: str) -> bool:
+        cur.execute(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)
+            )
+            """,
+            (table,),
+        )
+        return cur.fetchone()[0]
+
+    def _load_partitions(self, cur, table: str):
+        """Months with an attached partition, or None if table is not partitioned"""
+        if not self._is_partitioned(cur, table):
+            return None
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            (table,),
+        )
+        months = set()
+        for (name,) in cur.fetchall():
+            match = PARTITION_SUFFIX.search(name)
+            if match:
+                months.add(date(int(match.group(1)), int(match.group(2)), 1))
+        return months
+
+    def _ensure_partitions(self, table: str, first, last) -> int:
+        """
+        Create any missing monthly partitions of table covering first..last
+
+        Runs in its own committed transaction before the rows are written, so
+        concurrent writers never see a partition that is not yet visible.
+        A no-op for plain tables. Returns the number of partitions created.
+        """
+        with self._partition_lock:
+            months = []
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    if table not in self._partitions:
+                        self._partitions[table] = self._load_partitions(cur, table)
+                    known = self._partitions[table]
+                    if known is None:
+                        return 0
+                    month, last = _month_start(first), _month_start(last)
+                    while month <= last:
+                        if month not in known:
+                            cur.execute(
+                                f"""
+                                CREATE TABLE IF NOT EXISTS {_partition_name(table, month)}
+                                PARTITION OF {table}
+                                FOR VALUES FROM (%s) TO (%s)
+                                """,
+                                (month, _add_months(month, 1)),
+                            )
+                            months.append(month)
+                        month = _add_months(month, 1)
+            known.update(months)
+        return len(months)
+
+    def list_partitions(self) -> list:
+        """Partitions of the partitioned tables with estimated rows and size"""
+        query = """
+            SELECT p.relname AS parent, c.relname AS partition,
+                   pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                   GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+                   pg_total_relation_size(c.oid) AS total_bytes
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE i.inhparent = ANY(ARRAY[{}]::regclass[])
+            ORDER BY p.relname, c.relname
+        """.format(
+            ", ".join("to_regclass(%s)" for _ in PARTITION_KEYS)
+        )
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, list(PARTITION_KEYS))
+                return [dict(row) for row in cur.fetchall()]
+
+    def apply_retention(
+        self, table: str, keep_months: int, archive: bool = True
+    ) -> list:
+        """
+        Retire monthly partitions older than the retention window
+
+        Partitions are detached, then moved to the archive schema or dropped.
+        Retiring balance_snapshots retires the matching balance_holdings
+        partitions first. Plain tables are skipped.
+
+        Args:
+            table: 'trades' or 'balance_snapshots'
+            keep_months: Whole months kept before the current one (0 keeps all)
+            archive: Move to the archive schema (True) or drop (False)
+
+        Returns:
+            Names of the retired partitions
+        """
+        if table not in RETENTION_GROUPS:
+            raise ValueError(f"No retention policy for {table}")
+        if keep_months <= 0:
+            return []
+        cutoff = _add_months(_month_start(date.today()), -keep_months)
+
+        retired = []
+        with self._partition_lock:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    if archive:
+                        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                    for name in RETENTION_GROUPS[table]:
+                        months = self._load_partitions(cur, name) or set()
+                        for month in sorted(m for m in months if m < cutoff):
+                            partition = _partition_name(name, month)
+                            cur.execute(
+                                f"ALTER TABLE {name} DETACH PARTITION {partition}"
+                            )
+                            # Detached holdings keep a foreign key to the live
+                            # snapshots, which would block detaching those next
+                            cur.execute(
+                                """
+                                SELECT conname FROM pg_constraint
+                                WHERE conrelid = to_regclass(%s) AND contype = 'f'
+                                """,
+                                (partition,),
+                            )
+                            for (constraint,) in cur.fetchall():
+                                cur.execute(
+                                    f'ALTER TABLE {partition} DROP CONSTRAINT "{constraint}"'
+                                )
+                            if archive:
+                                cur.execute(
+                                    f"ALTER TABLE {partition} SET SCHEMA {ARCHIVE_SCHEMA}"
+                                )
+                            else:
+                                cur.execute(f"DROP TABLE {partition}")
+                            retired.append(partition)
+                    for name in RETENTION_GROUPS[table]:
+                        self._partitions.pop(name, None)
+
+        action = f"archived to {ARCHIVE_SCHEMA}" if archive else "dropped"
+        print(f"{table}: {len(retired)} partitions before {cutoff} {action}")
+        return retired
+
+    def maintain_partitions(
+        self, retention: dict = None, archive: bool = True, months_ahead: int = None
+    ) -> dict:
+        """
+        Create upcoming partitions and apply the retention policy
+
+        Args:
+            retention: {table: months to keep} for RETENTION_GROUPS tables
+            archive: Archive (True) or drop (False) retired partitions
+            months_ahead: Partitions created ahead (default: partition_premake_months)
+
+        Returns:
+            Dict with "created" ({table: new partitions}) and "retired"
+            ({table: retired partition names})
+        """
+        today = date.today()
+        ahead = self.partition_premake_months if months_ahead is None else months_ahead
+        created = {
+            table: self._ensure_partitions(table, today, _add_months(today, ahead))
+            for table in PARTITION_KEYS
+        }
+        retired = {
+            table: self.apply_retention(table, months, archive)
+            for table, months in (retention or {}).items()
+            if months
+        }
+        if retired.get("balance_snapshots"):
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    has_summaries = self._has_summaries(cur)
+            if has_summaries:
+                # Snapshot counts and first dates now start at the cutoff
+                self.refresh_summaries()
+        return {"created": created, "retired": retired}
+
+    def partition_tables(self) -> dict:
+        """
+        Rebuild plain trades/snapshot/holdings tables as partitioned
+
+        Each table is renamed to <table>_old (with its indexes and id
+        sequence), recreated partitioned, given partitions covering its data
+        and refilled, all in one transaction. Ids are preserved. The _old
+        tables are kept for verification and must be dropped by hand.
+
+        Returns:
+            Dict of {table: rows copied} for the tables converted
+        """
+        copied = {}
+        with self._partition_lock:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    for table, ddl in (
+                        ("trades", self._trades_ddl),
+                        ("balance_snapshots", self._snapshots_ddl),
+                        ("balance_holdings", self._holdings_ddl),
+                        ("intraday_snapshots", self._intraday_ddl),
+                    ):
+                        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+                        if not cur.fetchone()[0] or self._is_partitioned(cur, table):
+                            continue
+                        copied[table] = self._partition_table(cur, table, ddl)
+            self._partitions.clear()
+        for table, rows in copied.items():
+            print(f"{table}: {rows} rows copied into partitioned table")
+        return copied
+
+    def _columns(self, cur, table: str) -> list:
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s AND table_schema = current_schema()
+            ORDER BY ordinal_position
+            """,
+            (table,),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def _partition_table(self, cur, table: str, ddl) -> int:
+        old = f"{table}_old"
+        key = PARTITION_KEYS[table]
+
+        # Free the index, constraint and sequence names for the new table
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = to_regclass(%s)
+            """,
+            (table,),
+        )
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index}_old")
+        sequence = None
+        if "id" in self._columns(cur, table):
+            cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+            sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} RENAME TO {old}_id_seq")
+        cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        cur.execute(ddl(True))
+
+        cur.execute(f"SELECT MIN({key}) FROM {old}")
+        first = cur.fetchone()[0]
+        today = date.today()
+        month = min(_month_start(first or today), _month_start(today))
+        last = _add_months(_month_start(today), self.partition_premake_months)
+        while month <= last:
+            cur.execute(
+                f"""
+                CREATE TABLE {_partition_name(table, month)} PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s)
+                """,
+                (month, _add_months(month, 1)),
+            )
+            month = _add_months(month, 1)
+
+        old_columns = set(self._columns(cur, old))
+        columns = ", ".join(c for c in self._columns(cur, table) if c in old_columns)
+        cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")
+        copied = cur.rowcount
+        if sequence:
+            cur.execute(
+                f"""
+                SELECT setval(
+                    pg_get_serial_sequence(%s, 'id'),
+                    (SELECT COALESCE(MAX(id), 0) + 1 FROM {table}),
+                    false
+                )
+                """,
+                (table,),
+            )
+        return copied
+
+    def create_summary_tables(self):
+        """
+        Create the per-account latest-state and weekly/monthly rollup tables
+
+        Both are maintained on write, so the bot's latest-balance, account
+        list and period-return reads are key lookups. Newly created tables
+        are back-filled from history.
+        """
+        query = """
+            CREATE TABLE IF NOT EXISTS account_summaries (
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
+                snapshot_id INTEGER NOT NULL,
+                snapshot_date DATE NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                total_balance_usd NUMERIC(20,2) NOT NULL,
+                balances JSONB,
+                first_snapshot_date DATE NOT NULL,
+                snapshot_count INTEGER NOT NULL,
+                return_date DATE,
+                daily_return_usd NUMERIC(20,2),
+                daily_return_pct NUMERIC(10,4),
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (exchange, account_id)
+            );
+            CREATE TABLE IF NOT EXISTS balance_rollups (
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
+                period VARCHAR(10) NOT NULL,
+                period_start DATE NOT NULL,
+                open_date DATE NOT NULL,
+                close_date DATE NOT NULL,
+                open_balance_usd NUMERIC(20,2) NOT NULL,
+                close_balance_usd NUMERIC(20,2) NOT NULL,
+                high_balance_usd NUMERIC(20,2) NOT NULL,
+                low_balance_usd NUMERIC(20,2) NOT NULL,
+                previous_close_usd NUMERIC(20,2),
+                return_usd NUMERIC(20,2) NOT NULL,
+                return_pct NUMERIC(10,4),
+                snapshot_count INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (exchange, account_id, period, period_start)
+            );
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('account_summaries') IS NULL")
+                created = cur.fetchone()[0]
                 cur.execute(query)
-        print("Balance snapshots table created/verified")
+        self._summaries_ready = True
+        print("Summary tables created/verified")
+        if created:
+            self.refresh_summaries()
+
+    def ensure_snapshot_schema(self, intraday: bool = False):
+        """
+        Create the tables a daily (or intraday) snapshot writes, once per Database
+
+        A long-lived instance (the bot's scheduler, run_all_snapshots) skips
+        the DDL round trips on every later call.
+        """
+        with self._schema_lock:
+            if "daily" not in self._schema_ready:
+                self.create_returns_table()
+                self.create_trades_table()
+                self.create_sync_checkpoints_table()
+                self.create_balance_holdings_table()
+                self.create_raw_payloads_table()
+                self.create_summary_tables()
+                self._schema_ready.add("daily")
+            if intraday and "intraday" not in self._schema_ready:
+                self.create_intraday_snapshots_table()
+                self._schema_ready.add("intraday")
+
+    def create_sync_checkpoints_table(self):
+        query = """
+            CREATE TABLE IF NOT EXISTS sync_checkpoints (
+                exchange VARCHAR(50) NOT NULL,
+                account_id VARCHAR(100) NOT NULL,
+                stream VARCHAR(50) NOT NULL,
+                cursor JSONB NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (exchange, account_id, stream)
+            );
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+        print("Sync checkpoints table created/verified")
+
+    def create_raw_payloads_table(self):
+        # Payload columns hold already-compressed bytes, so skip pglz (EXTERNAL)
+        query = """
+            CREATE TABLE IF NOT EXISTS raw_payloads (
+                hash BYTEA PRIMARY KEY,
+                payload BYTEA NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+            ALTER TABLE raw_payloads ALTER COLUMN payload SET STORAGE EXTERNAL;
+            ALTER TABLE IF EXISTS trades
+                ADD COLUMN IF NOT EXISTS raw_compressed BYTEA,
+                ADD COLUMN IF NOT EXISTS raw_hash BYTEA,
+                ALTER COLUMN raw_compressed SET STORAGE EXTERNAL;
+            ALTER TABLE IF EXISTS balance_snapshots
+                ADD COLUMN IF NOT EXISTS raw_compressed BYTEA,
+                ADD COLUMN IF NOT EXISTS raw_hash BYTEA,
+                ALTER COLUMN raw_compressed SET STORAGE EXTERNAL;
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+        print("Raw payloads table created/verified")
+
+    def _raw_values(self, payload, offloaded: dict, mode: str = None) -> dict:
+        """Raw payload column values; blobs to offload are added to `offloaded`"""
+        values = raw_payloads.encode(payload, mode or self.raw_payload_mode)
+        blob = values.pop("offloaded", None)
+        if blob is not None:
+            offloaded[values["raw_hash"]] = blob
+        return values
+
+    def _store_offloaded(self, cur, offloaded: dict):
+        if offloaded:
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                INSERT INTO raw_payloads (hash, payload) VALUES %s
+                ON CONFLICT (hash) DO NOTHING
+                """,
+                list(offloaded.items()),
+            )
+
+    def get_raw_payload(self, table: str, row_id: int):
+        """Decoded raw ccxt payload of a trades/balance_snapshots row, or None"""
+        if table not in RAW_PAYLOAD_TABLES:
+            raise ValueError(f"{table} has no raw payloads")
+        query = f"""
+            SELECT t.raw_data, t.raw_compressed, p.payload
+            FROM {table} t
+            LEFT JOIN raw_payloads p ON p.hash = t.raw_hash
+            WHERE t.id = %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (row_id,))
+                row = cur.fetchone()
+                return raw_payloads.decode(*row) if row else None
+
+    def migrate_raw_payloads(
+        self, mode: str, tables=RAW_PAYLOAD_TABLES, batch_size: int = 1000
+    ) -> dict:
+        """
+        Rewrite stored raw payloads into another storage mode
+
+        Rows are converted in id order, batch_size per transaction, so an
+        interrupted migration picks up where it stopped. raw_payloads rows no
+        longer referenced are deleted afterwards. Run VACUUM (FULL) to hand
+        the freed space back to the OS.
+
+        Args:
+            mode: Target mode (raw_payloads.MODES)
+            tables: Tables to migrate
+            batch_size: Rows per transaction
+
+        Returns:
+            Dict of {table: rows converted} plus "orphans_deleted"
+        """
+        if mode not in raw_payloads.MODES:
+            raise ValueError(f"Unknown raw payload mode {mode!r}")
+        stored = {
+            "jsonb": "t.raw_data IS NOT NULL",
+            "off": "FALSE",
+            "compressed": "t.raw_compressed IS NOT NULL",
+            "offload": "t.raw_hash IS NOT NULL",
+        }
+        pending = (
+            "(t.raw_data IS NOT NULL OR t.raw_compressed IS NOT NULL "
+            f"OR t.raw_hash IS NOT NULL) AND NOT ({stored[mode]})"
+        )
+        result = {}
+        for table in tables:
+            if table not in RAW_PAYLOAD_TABLES:
+                raise ValueError(f"{table} has no raw payloads")
+            converted, last_id = 0, 0
+            while True:
+                with self.get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            f"""
+                            SELECT t.id, t.raw_data, t.raw_compressed, p.payload
+                            FROM {table} t
+                            LEFT JOIN raw_payloads p ON p.hash = t.raw_hash
+                            WHERE t.id > %s AND {pending}
+                            ORDER BY t.id LIMIT %s
+                            """,
+                            (last_id, batch_size),
+                        )
+                        batch = cur.fetchall()
+                        if not batch:
+                            break
+                        offloaded, rows = {}, []
+                        for row_id, raw_data, compressed, payload in batch:
+                            decoded = raw_payloads.decode(raw_data, compressed, payload)
+                            values = self._raw_values(decoded, offloaded, mode)
+                            rows.append(
+                                (
+                                    row_id,
+                                    values["raw_data"],
+                                    values["raw_compressed"],
+                                    values["raw_hash"],
+                                )
+                            )
+                        self._store_offloaded(cur, offloaded)
+                        psycopg2.extras.execute_values(
+                            cur,
+                            f"""
+                            UPDATE {table} t SET
+                                raw_data = v.raw_data,
+                                raw_compressed = v.raw_compressed,
+                                raw_hash = v.raw_hash
+                            FROM (VALUES %s)
+                                AS v(id, raw_data, raw_compressed, raw_hash)
+                            WHERE t.id = v.id
+                            """,
+                            rows,
+                            template="(%s, %s::jsonb, %s::bytea, %s::bytea)",
+                        )
+                converted += len(batch)
+                last_id = batch[-1][0]
+                print(f"{table}: {converted} raw payloads converted to {mode}")
+            result[table] = converted
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    DELETE FROM raw_payloads p
+                    WHERE NOT EXISTS (SELECT 1 FROM trades t WHERE t.raw_hash = p.hash)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM balance_snapshots s WHERE s.raw_hash = p.hash
+                    )
+                    """
+                )
+                result["orphans_deleted"] = cur.rowcount
+        return result
+
+    def raw_payload_report(self) -> dict:
+        """
+        On-disk size of the payload-carrying tables and how their rows store payloads
+
+        Returns:
+            Dict with "tables" ({name: heap/toast/index/total bytes}) and
+            "storage" ({table: row and per-mode counts and payload bytes})
+        """
+        sizes = """
+            SELECT c.relname,
+                   pg_relation_size(c.oid),
+                   COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0),
+                   pg_indexes_size(c.oid),
+                   pg_total_relation_size(c.oid)
+            FROM pg_class c
+            WHERE c.relname IN ('trades', 'balance_snapshots', 'raw_payloads')
+            AND c.relkind = 'r'
+        """
+        report = {"tables": {}, "storage": {}}
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sizes)
+                for name, heap, toast, indexes, total in cur.fetchall():
+                    report["tables"][name] = {
+                        "heap": heap,
+                        "toast": toast,
+                        "indexes": indexes,
+                        "total": total,
+                    }
+                for table in RAW_PAYLOAD_TABLES:
+                    cur.execute(
+                        f"""
+                        SELECT COUNT(*),
+                               COUNT(raw_data),
+                               COUNT(raw_compressed),
+                               COUNT(raw_hash),
+                               COALESCE(SUM(pg_column_size(raw_data)), 0),
+                               COALESCE(SUM(pg_column_size(raw_compressed)), 0)
+                        FROM {table}
+                        """
+                    )
+                    rows, jsonb, compressed, offloaded, jsonb_bytes, z_bytes = (
+                        cur.fetchone()
+                    )
+                    report["storage"][table] = {
+                        "rows": rows,
+                        "jsonb": jsonb,
+                        "compressed": compressed,
+                        "offload": offloaded,
+                        "jsonb_bytes": jsonb_bytes,
+                        "compressed_bytes": z_bytes,
+                    }
+        return report
+
+    def get_sync_checkpoint(
+        self, exchange: str, account_id: str, stream: str
+    ) -> Optional[dict]:
+        query = """
+            SELECT cursor FROM sync_checkpoints
+            WHERE exchange = %s AND account_id = %s AND stream = %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (exchange, account_id, stream))
+                row = cur.fetchone()
+                if not row:
+                    return None
+                return json.loads(row[0]) if isinstance(row[0], str) else row[0]
+
+    def save_sync_checkpoint(
+        self, exchange: str, account_id: str, stream: str, cursor: dict
+    ):
+        query = """
+            INSERT INTO sync_checkpoints (exchange, account_id, stream, cursor, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (exchange, account_id, stream)
+            DO UPDATE SET
+                cursor = EXCLUDED.cursor,
+                updated_at = EXCLUDED.updated_at
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    query,
+                    (exchange, account_id, stream, json.dumps(cursor, default=str)),
+                )
+
+    def clear_sync_checkpoint(self, exchange: str, account_id: str, stream: str):
+        query = """
+            DELETE FROM sync_checkpoints
+            WHERE exchange = %s AND account_id = %s AND stream = %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (exchange, account_id, stream))
+
+    def create_scheduler_jobs_table(self):
+        query = """
+            CREATE TABLE IF NOT EXISTS scheduler_jobs (
+                name VARCHAR(100) PRIMARY KEY,
+                last_started TIMESTAMP NOT NULL,
+                last_duration DOUBLE PRECISION,
+                last_status VARCHAR(20),
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+        print("Scheduler jobs table created/verified")
+
+    def get_job_state(self, name: str) -> Optional[dict]:
+        """Last run of a scheduler job: dict with started, duration and status"""
+        query = """
+            SELECT last_started AS started, last_duration AS duration,
+                   last_status AS status
+            FROM scheduler_jobs WHERE name = %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, (name,))
+                row = cur.fetchone()
+                return dict(row) if row else None
+
+    def save_job_state(
+        self, name: str, started: datetime, duration: float, status: str
+    ):
+        query = """
+            INSERT INTO scheduler_jobs
+                (name, last_started, last_duration, last_status, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (name)
+            DO UPDATE SET
+                last_started = EXCLUDED.last_started,
+                last_duration = EXCLUDED.last_duration,
+                last_status = EXCLUDED.last_status,
+                updated_at = EXCLUDED.updated_at
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (name, started, duration, status))
+
+    def create_price_cache_table(self):
+        query = """
+            CREATE TABLE IF NOT EXISTS price_cache (
+                symbol VARCHAR(30) PRIMARY KEY,
+                price DOUBLE PRECISION NOT NULL,
+                fetched_at DOUBLE PRECISION NOT NULL
+            );
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+        print("Price cache table created/verified")
+
+    def get_cached_prices(self, symbols: List[str], min_fetched_at: float) -> dict:
+        query = """
+            SELECT symbol, price, fetched_at FROM price_cache
+            WHERE symbol = ANY(%s) AND fetched_at >= %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (list(symbols), min_fetched_at))
+                return {
+                    symbol: {"last": price, "fetched_at": fetched_at}
+                    for symbol, price, fetched_at in cur.fetchall()
+                }
+
+    def save_cached_prices(self, prices: dict):
+        query = """
+            INSERT INTO price_cache (symbol, price, fetched_at) VALUES %s
+            ON CONFLICT (symbol) DO UPDATE SET
+                price = EXCLUDED.price,
+                fetched_at = EXCLUDED.fetched_at
+            WHERE price_cache.fetched_at < EXCLUDED.fetched_at
+        """
+        rows = [(s, p["last"], p["fetched_at"]) for s, p in prices.items()]
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, query, rows)
+
+    def _holding_rows(self, snapshot_id: int, snapshot: dict) -> list:
+        rows = []
+        for asset, data in snapshot["balances"].items():
+            amount = Decimal(str(data["amount"]))
+            usd_value = Decimal(str(data["usd_value"]))
+            price = data.get("price")
+            if price is None and amount:
+                price = usd_value / amount
+            rows.append(
+                (
+                    snapshot_id,
+                    snapshot["exchange"],
+                    snapshot["account_id"],
+                    snapshot["timestamp"].date(),
+                    asset,
+                    amount,
+                    usd_value,
+                    price,
+                )
+            )
+        return rows
 
     def save_balance_snapshot(self, snapshot: dict):
+        """Upsert a snapshot and replace its balance_holdings rows in one transaction"""
+        query = """
+            INSERT INTO balance_snapshots (
+                exchange, account_id, snapshot_date, timestamp,
+                total_balance_usd, balances, raw_data, raw_compressed, raw_hash
+            ) VALUES (
+                %(exchange)s, %(account_id)s, %(snapshot_date)s, %(timestamp)s,
+                %(total_balance_usd)s, %(balances)s, %(raw_data)s,
+                %(raw_compressed)s, %(raw_hash)s
+            )
+            ON CONFLICT (exchange, account_id, snapshot_date) 
+            DO UPDATE SET
+                timestamp = EXCLUDED.timestamp,
+                total_balance_usd = EXCLUDED.total_balance_usd,
+                balances = EXCLUDED.balances,
+                raw_data = EXCLUDED.raw_data,
+                raw_compressed = EXCLUDED.raw_compressed,
+                raw_hash = EXCLUDED.raw_hash
+            RETURNING id, (xmax = 0) AS inserted
+        """
+        offloaded = {}
+        raw = self._raw_values(
+            self._decimal_to_str(snapshot.get("raw_data", {})), offloaded
+        )
+        snapshot_date = snapshot["timestamp"].date()
+        for table in ("balance_snapshots", "balance_holdings"):
+            self._ensure_partitions(table, snapshot_date, snapshot_date)
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                self._store_offloaded(cur, offloaded)
+                cur.execute(
+                    query,
+                    {
+                        "exchange": snapshot["exchange"],
+                        "account_id": snapshot["account_id"],
+                        "snapshot_date": snapshot_date,
+                        "timestamp": snapshot["timestamp"],
+                        "total_balance_usd": snapshot["total_balance_usd"],
+                        "balances": json.dumps(
+                            self._decimal_to_str(snapshot["balances"])
+                        ),
+                        **raw,
+                    },
+                )
+                snapshot_id, inserted = cur.fetchone()
+                cur.execute(
+                    """
+                    DELETE FROM balance_holdings
+                    WHERE snapshot_id = %s AND snapshot_date = %s
+                    """,
+                    (snapshot_id, snapshot_date),
+                )
+                psycopg2.extras.execute_values(
+                    cur,
+                    """
+                    INSERT INTO balance_holdings (
+                        snapshot_id, exchange, account_id, snapshot_date,
+                        asset, amount, usd_value, price
+                    ) VALUES %s
+                    """,
+                    self._holding_rows(snapshot_id, snapshot),
+                )
+                if self._has_summaries(cur):
+                    self._update_summaries(
+                        cur,
+                        snapshot["exchange"],
+                        snapshot["account_id"],
+                        snapshot_date,
+                        1 if inserted else 0,
+                    )
+                self._notify_write(cur, "balance_snapshots", snapshot["account_id"])
+        print(
+            f"Saved balance snapshot for {snapshot['account_id']} on {snapshot['timestamp'].date()}"
+        )
+
+    def migrate_balance_holdings(self) -> int:
+        """
+        Explode existing balances JSONB into balance_holdings
+
+        Snapshots that already have holdings are skipped, so this is safe to
+        re-run. Returns the number of holdings rows inserted.
+        """
+        query = (
+            HOLDINGS_FROM_JSONB
+            + """
+            AND NOT EXISTS (
+                SELECT 1 FROM balance_holdings b WHERE b.snapshot_id = s.id
+            )
+            """
+        )
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT MIN(snapshot_date) FROM balance_snapshots")
+                first = cur.fetchone()[0]
+        if first:
+            self._ensure_partitions("balance_holdings", first, date.today())
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                inserted = cur.rowcount
+        print(f"Migrated {inserted} balance holdings from JSONB")
+        return inserted
+
+    def get_holdings(self, snapshot_id: int, snapshot_date=None) -> list:
+        """
+        Holdings of one snapshot, largest USD value first
+
+        Passing the snapshot's date lets a partitioned table read one partition.
+        """
+        query = """
+            SELECT asset, amount, usd_value, price
+            FROM balance_holdings
+            WHERE snapshot_id = %s
+        """
+        params = [snapshot_id]
+        if snapshot_date is not None:
+            query += " AND snapshot_date = %s"
+            params.append(snapshot_date)
+        query += " ORDER BY usd_value DESC"
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
+    def get_asset_history(
+        self,
+        asset: str,
+        exchange: str = "kraken",
+        account_id: str = None,
+        limit: int = 30,
+    ) -> list:
+        """Amount, USD value and price of one asset per snapshot, newest first"""
+        query = """
+            SELECT account_id, snapshot_date, amount, usd_value, price
+            FROM balance_holdings
+            WHERE exchange = %s AND asset = %s
+        """
+        params = [exchange, asset]
+        if account_id:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        query += " ORDER BY snapshot_date DESC LIMIT %s"
+        params.append(limit)
+
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
+    def save_intraday_snapshot(self, snapshot: dict, interval_seconds: int):
+        """
+        Record a balance sample in intraday_snapshots
+
+        The sample is filed under its interval's start (counted from
+        midnight), so a retried pull within one interval replaces the sample
+        instead of adding one. Raw payloads are not kept for intraday rows.
+
+        Args:
+            snapshot: Balance dict from KrakenConnector.get_account_balance()
+            interval_seconds: Sampling interval (should divide a day evenly)
+        """
+        ts = snapshot["timestamp"]
+        midnight = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+        offset = int((ts - midnight).total_seconds())
+        snapshot_time = midnight + timedelta(seconds=offset - offset % interval_seconds)
+        self._ensure_partitions("intraday_snapshots", snapshot_time, snapshot_time)
+
+        query = """
+            INSERT INTO intraday_snapshots (
+                exchange, account_id, snapshot_time, timestamp,
+                resolution_seconds, total_balance_usd, balances
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (exchange, account_id, snapshot_time)
+            DO UPDATE SET
+                timestamp = EXCLUDED.timestamp,
+                total_balance_usd = EXCLUDED.total_balance_usd,
+                balances = EXCLUDED.balances
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    query,
+                    (
+                        snapshot["exchange"],
+                        snapshot["account_id"],
+                        snapshot_time,
+                        ts,
+                        interval_seconds,
+                        snapshot["total_balance_usd"],
+                        json.dumps(self._decimal_to_str(snapshot["balances"])),
+                    ),
+                )
+        print(
+            f"Saved intraday snapshot for {snapshot['account_id']} at {snapshot_time}"
+        )
+
+    def rollup_daily_snapshots(
+        self,
+        exchange: str = "kraken",
+        account_id: str = None,
+        start_date=None,
+        end_date=None,
+    ) -> int:
+        """
+        Derive daily balance_snapshots rows from intraday samples
+
+        Each day's row becomes that day's last intraday sample, and its
+        balance_holdings are rebuilt from the sample's breakdown. A daily
+        row is only replaced by a sample at least as recent, so a direct
+        daily pull is never overwritten by an older sample.
+
+        Args:
+            exchange: Exchange name
+            account_id: Optional account filter
+            start_date: First day rolled up (inclusive, default: all)
+            end_date: Last day rolled up (inclusive, default: all)
+
+        Returns:
+            Number of daily snapshots written
+        """
+        where = ["exchange = %s"]
+        params = [exchange]
+        if account_id:
+            where.append("account_id = %s")
+            params.append(account_id)
+        if start_date:
+            where.append("snapshot_time >= %s")
+            params.append(start_date)
+        if end_date:
+            where.append("snapshot_time < %s")
+            params.append(end_date + timedelta(days=1))
+        where = " AND ".join(where)
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT MIN(snapshot_time), MAX(snapshot_time)
+                    FROM intraday_snapshots WHERE {where}
+                    """,
+                    params,
+                )
+                first, last = cur.fetchone()
+        if first is None:
+            return 0
+        for table in ("balance_snapshots", "balance_holdings"):
+            self._ensure_partitions(table, first, last)
+
+        query = f"""
+            WITH latest AS (
+                SELECT DISTINCT ON (exchange, account_id, snapshot_time::date)
+                    exchange, account_id, snapshot_time::date AS snapshot_date,
+                    timestamp, total_balance_usd, balances
+                FROM intraday_snapshots
+                WHERE {where}
+                ORDER BY exchange, account_id, snapshot_time::date,
+                         snapshot_time DESC
+            )
+            INSERT INTO balance_snapshots AS d (
+                exchange, account_id, snapshot_date, timestamp,
+                total_balance_usd, balances
+            )
+            SELECT * FROM latest
+            ON CONFLICT (exchange, account_id, snapshot_date) DO UPDATE SET
+                timestamp = EXCLUDED.timestamp,
+                total_balance_usd = EXCLUDED.total_balance_usd,
+                balances = EXCLUDED.balances
+            WHERE d.timestamp <= EXCLUDED.timestamp
+            RETURNING d.id, d.snapshot_date
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                rows = cur.fetchall()
+                if rows:
+                    ids = [row[0] for row in rows]
+                    dates = [row[1] for row in rows]
+                    cur.execute(
+                        """
+                        DELETE FROM balance_holdings
+                        WHERE (snapshot_id, snapshot_date) IN (
+                            SELECT * FROM unnest(%s::integer[], %s::date[])
+                        )
+                        """,
+                        (ids, dates),
+                    )
+                    cur.execute(HOLDINGS_FROM_JSONB + " AND s.id = ANY(%s)", (ids,))
+                    self._notify_write(cur, "balance_snapshots", account_id)
+        print(f"Rolled up {len(rows)} daily snapshots from intraday samples")
+        if rows:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    has_summaries = self._has_summaries(cur)
+            if has_summaries:
+                self.refresh_summaries(exchange, account_id, since=min(dates))
+        return len(rows)
+
+    def compact_intraday_snapshots(self, rules, retention_days: int = 0) -> dict:
+        """
+        Downsample old intraday samples and expire the oldest ones
+
+        Args:
+            rules: (age_seconds, resolution_seconds) pairs. Samples in buckets
+                that ended more than age ago are thinned to the last one per
+                resolution bucket, e.g.
+                [(7 * 86400, 3600), (90 * 86400, 86400)] keeps hourly points
+                after a week and daily points after 90 days.
+            retention_days: Delete samples older than this (0 keeps them).
+                The daily rollups in balance_snapshots are kept regardless.
+
+        Returns:
+            Dict with "downsampled" and "expired" row counts
+        """
+        # Buckets are aligned on the naive (local) clock, so daily buckets
+        # run midnight to midnight like snapshot_date. Only whole buckets are
+        # compacted: a bucket cut by the cutoff would keep one row from this
+        # run and another from the run that compacts the rest of it.
         query = """
-            INSERT INTO balance_snapshots (
-                exchange, account_id, snapshot_date, timestamp,
-                total_balance_usd, balances, raw_data
-            ) VALUES (
-                %(exchange)s, %(account_id)s, %(snapshot_date)s, %(timestamp)s,
-                %(total_balance_usd)s, %(balances)s, %(raw_data)s
+            WITH ranked AS (
+                SELECT id, snapshot_time,
+                       row_number() OVER (
+                           PARTITION BY exchange, account_id,
+                               floor(extract(epoch FROM snapshot_time) / %(resolution)s)
+                           ORDER BY snapshot_time DESC
+                       ) AS rank
+                FROM intraday_snapshots
+                WHERE snapshot_time < %(cutoff)s
+                AND resolution_seconds < %(resolution)s
+            ), dropped AS (
+                DELETE FROM intraday_snapshots i USING ranked r
+                WHERE i.id = r.id AND i.snapshot_time = r.snapshot_time
+                AND r.rank > 1
+                RETURNING 1
+            ), kept AS (
+                UPDATE intraday_snapshots i
+                SET resolution_seconds = %(resolution)s
+                FROM ranked r
+                WHERE i.id = r.id AND i.snapshot_time = r.snapshot_time
+                AND r.rank = 1
+                RETURNING 1
             )
-            ON CONFLICT (exchange, account_id, snapshot_date) 
-            DO UPDATE SET
-                timestamp = EXCLUDED.timestamp,
-                total_balance_usd = EXCLUDED.total_balance_usd,
-                balances = EXCLUDED.balances,
-                raw_data = EXCLUDED.raw_data
+            SELECT (SELECT COUNT(*) FROM dropped)
         """
+        now = datetime.now()
+        result = {"downsampled": 0, "expired": 0}
         with self.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    query,
-                    {
-                        "exchange": snapshot["exchange"],
-                        "account_id": snapshot["account_id"],
-                        "snapshot_date": snapshot["timestamp"].date(),
-                        "timestamp": snapshot["timestamp"],
-                        "total_balance_usd": snapshot["total_balance_usd"],
-                        "balances": json.dumps(
-                            self._decimal_to_str(snapshot["balances"])
-                        ),
-                        "raw_data": json.dumps(
-                            self._decimal_to_str(snapshot.get("raw_data", {}))
-                        ),
-                    },
-                )
+                for age, resolution in sorted(rules):
+                    cur.execute(
+                        query,
+                        {
+                            "cutoff": _bucket_start(
+                                now - timedelta(seconds=age), resolution
+                            ),
+                            "resolution": resolution,
+                        },
+                    )
+                    result["downsampled"] += cur.fetchone()[0]
+                if retention_days:
+                    cur.execute(
+                        "DELETE FROM intraday_snapshots WHERE snapshot_time < %s",
+                        (now - timedelta(days=retention_days),),
+                    )
+                    result["expired"] = cur.rowcount
         print(
-            f"Saved balance snapshot for {snapshot['account_id']} on {snapshot['timestamp'].date()}"
+            f"Intraday compaction: {result['downsampled']} samples downsampled, "
+            f"{result['expired']} expired"
         )
+        return result
 
-    def get_previous_balance(self, exchange: str, account_id: str, current_date):
+    def get_intraday_history(
+        self, exchange: str = "kraken", account_id: str = None, since=None
+    ) -> list:
+        """Intraday samples (oldest first) for an equity curve"""
         query = """
-            SELECT * FROM balance_snapshots
+            SELECT account_id, snapshot_time, resolution_seconds, total_balance_usd
+            FROM intraday_snapshots
+            WHERE exchange = %s
+        """
+        params = [exchange]
+        if account_id:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        if since:
+            query += " AND snapshot_time >= %s"
+            params.append(since)
+        query += " ORDER BY account_id, snapshot_time"
+
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
+    def get_previous_balance(self, exchange: str, account_id: str, current_date):
+        query = f"""
+            SELECT {SNAPSHOT_COLUMNS} FROM balance_snapshots
             WHERE exchange = %s AND account_id = %s AND snapshot_date < %s
             ORDER BY snapshot_date DESC LIMIT 1
         """
@@ -181,10 +1898,330 @@ class Database:
         with self.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(query, return_data)
+                if self._has_summaries(cur):
+                    cur.execute(
+                        SUMMARY_RETURN_QUERY.format(
+                            filter="exchange = %s AND account_id = %s"
+                        ),
+                        (return_data["exchange"], return_data["account_id"]),
+                    )
+                self._notify_write(cur, "daily_returns", return_data["account_id"])
         print(
             f"Saved daily return for {return_data['account_id']} on {return_data['return_date']}: {return_data['daily_return_pct']:.2f}%"
         )
 
+    def recompute_returns(
+        self,
+        exchange: str = "kraken",
+        account_id: str = None,
+        start_date=None,
+        end_date=None,
+    ) -> dict:
+        """
+        Rebuild daily_returns from balance_snapshots in one set-based pass
+
+        LAG() pairs each snapshot with the one before it (looking past
+        start_date, so the first day in range still gets its return), and
+        the results are upserted in a single statement. Returns in range
+        whose current or previous snapshot no longer exists are deleted.
+
+        Ledger flows (deposits, withdrawals, transfers) timestamped between
+        the two snapshots are taken out of the balance change, and the
+        percentage is measured against the previous balance plus those
+        flows, so daily returns chain into a time-weighted return. Weekly
+        and monthly rollups of the range are refreshed to match.
+
+        Args:
+            exchange: Exchange name
+            account_id: Account to rebuild (default: every account)
+            start_date: First return_date to rebuild (inclusive)
+            end_date: Last return_date to rebuild (inclusive)
+
+        Returns:
+            Dict with upserted and deleted row counts
+        """
+        filters, params = ["exchange = %(exchange)s"], {"exchange": exchange}
+        if account_id:
+            filters.append("account_id = %(account_id)s")
+            params["account_id"] = account_id
+        range_filters = []
+        if start_date:
+            range_filters.append("return_date >= %(start_date)s")
+            params["start_date"] = start_date
+        if end_date:
+            range_filters.append("return_date <= %(end_date)s")
+            params["end_date"] = end_date
+        where = " AND ".join(filters)
+        in_range = " AND ".join(range_filters) or "TRUE"
+
+        upsert = f"""
+            INSERT INTO daily_returns (
+                exchange, account_id, return_date, previous_date,
+                current_balance_usd, previous_balance_usd,
+                daily_return_usd, daily_return_pct, net_flow_usd, timestamp
+            )
+            SELECT
+                exchange, account_id, return_date, previous_date,
+                current_balance_usd, previous_balance_usd,
+                current_balance_usd - previous_balance_usd - net_flow_usd,
+                CASE WHEN previous_balance_usd + net_flow_usd <= 0 THEN 0
+                     ELSE ROUND((current_balance_usd - previous_balance_usd
+                                 - net_flow_usd)
+                                / (previous_balance_usd + net_flow_usd) * 100, 4)
+                END,
+                net_flow_usd, timestamp
+            FROM (
+                SELECT paired.*, COALESCE(flows.usd, 0) AS net_flow_usd
+                FROM (
+                    SELECT
+                        exchange, account_id, timestamp,
+                        snapshot_date AS return_date,
+                        total_balance_usd AS current_balance_usd,
+                        LAG(snapshot_date) OVER w AS previous_date,
+                        LAG(total_balance_usd) OVER w AS previous_balance_usd,
+                        LAG(timestamp) OVER w AS previous_timestamp
+                    FROM balance_snapshots
+                    WHERE {where}
+                    WINDOW w AS (
+                        PARTITION BY exchange, account_id ORDER BY snapshot_date
+                    )
+                ) paired
+                LEFT JOIN LATERAL (
+                    SELECT SUM(l.usd_value) AS usd FROM ledger_entries l
+                    WHERE l.exchange = paired.exchange
+                    AND l.account_id = paired.account_id
+                    AND l.entry_type IN %(flow_types)s
+                    AND l.entry_timestamp > (
+                        paired.previous_timestamp AT TIME ZONE %(local_tz)s
+                    ) AT TIME ZONE 'UTC'
+                    AND l.entry_timestamp <= (
+                        paired.timestamp AT TIME ZONE %(local_tz)s
+                    ) AT TIME ZONE 'UTC'
+                ) flows ON TRUE
+                WHERE paired.previous_date IS NOT NULL AND {in_range}
+            ) adjusted
+            ON CONFLICT (exchange, account_id, return_date)
+            DO UPDATE SET
+                previous_date = EXCLUDED.previous_date,
+                current_balance_usd = EXCLUDED.current_balance_usd,
+                previous_balance_usd = EXCLUDED.previous_balance_usd,
+                daily_return_usd = EXCLUDED.daily_return_usd,
+                daily_return_pct = EXCLUDED.daily_return_pct,
+                net_flow_usd = EXCLUDED.net_flow_usd,
+                timestamp = EXCLUDED.timestamp
+        """
+        prune = f"""
+            DELETE FROM daily_returns r
+            WHERE {" AND ".join(f"r.{f}" for f in filters)} AND {in_range}
+            AND (
+                SELECT COUNT(*) FROM balance_snapshots s
+                WHERE s.exchange = r.exchange AND s.account_id = r.account_id
+                AND s.snapshot_date IN (r.return_date, r.previous_date)
+            ) < 2
+        """
+        params["flow_types"] = LEDGER_FLOW_TYPES
+        params["local_tz"] = _local_timezone()
+        # Rollups of the periods holding the rebuilt days link their returns
+        rollup_filters = [f"s.{f}" for f in filters]
+        if start_date:
+            rollup_filters.append("s.snapshot_date >= %(start_date)s")
+        if end_date:
+            rollup_filters.append("s.snapshot_date <= %(end_date)s")
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(upsert, params)
+                upserted = cur.rowcount
+                cur.execute(prune, params)
+                deleted = cur.rowcount
+                if self._has_summaries(cur):
+                    cur.execute(SUMMARY_RETURN_QUERY.format(filter=where), params)
+                    cur.execute(
+                        ROLLUP_QUERY.format(filter=" AND ".join(rollup_filters)),
+                        params,
+                    )
+                self._notify_write(cur, "daily_returns", account_id)
+        print(f"Recomputed {upserted} daily returns ({deleted} stale rows removed)")
+        return {"upserted": upserted, "deleted": deleted}
+
+    def _has_summaries(self, cur) -> bool:
+        if not self._summaries_ready:
+            cur.execute("SELECT to_regclass('balance_rollups') IS NOT NULL")
+            self._summaries_ready = cur.fetchone()[0]
+        return self._summaries_ready
+
+    def _update_summaries(
+        self, cur, exchange: str, account_id: str, snapshot_date, inserted: int
+    ):
+        """
+        Bring one account's summary and rollups up to date after a snapshot write
+
+        Reads the latest snapshot by index and re-aggregates only the
+        week/month periods from snapshot_date on, so the cost does not grow
+        with history. snapshot_count is adjusted by `inserted` (0 for an
+        update of an existing day).
+        """
+        cur.execute(
+            """
+            INSERT INTO account_summaries (
+                exchange, account_id, snapshot_id, snapshot_date, timestamp,
+                total_balance_usd, balances, first_snapshot_date, snapshot_count
+            )
+            SELECT exchange, account_id, id, snapshot_date, timestamp,
+                   total_balance_usd, balances, snapshot_date, %(inserted)s
+            FROM balance_snapshots
+            WHERE exchange = %(exchange)s AND account_id = %(account_id)s
+            ORDER BY snapshot_date DESC LIMIT 1
+            ON CONFLICT (exchange, account_id) DO UPDATE SET
+                snapshot_id = EXCLUDED.snapshot_id,
+                snapshot_date = EXCLUDED.snapshot_date,
+                timestamp = EXCLUDED.timestamp,
+                total_balance_usd = EXCLUDED.total_balance_usd,
+                balances = EXCLUDED.balances,
+                first_snapshot_date = LEAST(
+                    account_summaries.first_snapshot_date, %(snapshot_date)s
+                ),
+                snapshot_count = account_summaries.snapshot_count + %(inserted)s,
+                updated_at = NOW()
+            """,
+            {
+                "exchange": exchange,
+                "account_id": account_id,
+                "snapshot_date": snapshot_date,
+                "inserted": inserted,
+            },
+        )
+        # Later periods are included because their return uses this one's close
+        cur.execute(
+            ROLLUP_QUERY.format(
+                filter="""
+                    s.exchange = %s AND s.account_id = %s
+                    AND s.snapshot_date >= LEAST(
+                        date_trunc('week', %s::date), date_trunc('month', %s::date)
+                    )
+                """
+            ),
+            (exchange, account_id, snapshot_date, snapshot_date),
+        )
+
+    def refresh_summaries(
+        self, exchange: str = "kraken", account_id: str = None, since=None
+    ) -> dict:
+        """
+        Rebuild account_summaries and balance_rollups from history
+
+        Used to back-fill, and after bulk writes (intraday rollups,
+        retention) that bypass save_balance_snapshot.
+
+        Args:
+            exchange: Exchange name
+            account_id: Account to rebuild (default: every account)
+            since: Only re-aggregate rollup periods from this date on
+
+        Returns:
+            Dict with summaries and rollups row counts written
+        """
+        filters, params = ["exchange = %(exchange)s"], {"exchange": exchange}
+        if account_id:
+            filters.append("account_id = %(account_id)s")
+            params["account_id"] = account_id
+        where = " AND ".join(filters)
+        rollup_filter = " AND ".join(f"s.{f}" for f in filters)
+        if since:
+            rollup_filter += """
+                AND s.snapshot_date >= LEAST(
+                    date_trunc('week', %(since)s::date),
+                    date_trunc('month', %(since)s::date)
+                )
+            """
+            params["since"] = since
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    DELETE FROM account_summaries a WHERE {where}
+                    AND NOT EXISTS (
+                        SELECT 1 FROM balance_snapshots s
+                        WHERE s.exchange = a.exchange AND s.account_id = a.account_id
+                    )
+                    """,
+                    params,
+                )
+                cur.execute(
+                    f"""
+                    INSERT INTO account_summaries (
+                        exchange, account_id, snapshot_id, snapshot_date, timestamp,
+                        total_balance_usd, balances, first_snapshot_date,
+                        snapshot_count
+                    )
+                    SELECT DISTINCT ON (s.exchange, s.account_id)
+                        s.exchange, s.account_id, s.id, s.snapshot_date,
+                        s.timestamp, s.total_balance_usd, s.balances,
+                        c.first_snapshot_date, c.snapshot_count
+                    FROM balance_snapshots s
+                    JOIN (
+                        SELECT exchange, account_id,
+                               MIN(snapshot_date) AS first_snapshot_date,
+                               COUNT(*) AS snapshot_count
+                        FROM balance_snapshots
+                        WHERE {where}
+                        GROUP BY exchange, account_id
+                    ) c USING (exchange, account_id)
+                    ORDER BY s.exchange, s.account_id, s.snapshot_date DESC
+                    ON CONFLICT (exchange, account_id) DO UPDATE SET
+                        snapshot_id = EXCLUDED.snapshot_id,
+                        snapshot_date = EXCLUDED.snapshot_date,
+                        timestamp = EXCLUDED.timestamp,
+                        total_balance_usd = EXCLUDED.total_balance_usd,
+                        balances = EXCLUDED.balances,
+                        first_snapshot_date = EXCLUDED.first_snapshot_date,
+                        snapshot_count = EXCLUDED.snapshot_count,
+                        updated_at = NOW()
+                    """,
+                    params,
+                )
+                summaries = cur.rowcount
+                cur.execute("SELECT to_regclass('daily_returns') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    cur.execute(SUMMARY_RETURN_QUERY.format(filter=where), params)
+                cur.execute(ROLLUP_QUERY.format(filter=rollup_filter), params)
+                rollups = cur.rowcount
+                self._notify_write(cur, "balance_snapshots", account_id)
+        print(f"Refreshed {summaries} account summaries and {rollups} rollups")
+        return {"summaries": summaries, "rollups": rollups}
+
+    def get_rollups(
+        self,
+        period: str = "week",
+        exchange: str = "kraken",
+        account_id: str = None,
+        limit: int = 12,
+    ) -> list:
+        """Latest weekly or monthly balance/return rollups, newest first"""
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(
+                f"Unknown rollup period {period!r} (use {', '.join(ROLLUP_PERIODS)})"
+            )
+        query = """
+            SELECT account_id, period_start, open_date, close_date,
+                   open_balance_usd, close_balance_usd, high_balance_usd,
+                   low_balance_usd, previous_close_usd, return_usd, return_pct,
+                   snapshot_count
+            FROM balance_rollups
+            WHERE exchange = %s AND period = %s
+        """
+        params = [exchange, period]
+        if account_id:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        query += " ORDER BY period_start DESC, account_id LIMIT %s"
+        params.append(limit)
+
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
     def get_latest_return(self, exchange: str = "kraken", account_id: str = None):
         query = (
             """
@@ -230,21 +2267,36 @@ class Database:
 
     def get_latest_balance(self, exchange: str = "kraken", account_id: str = None):
         query = (
-            """
-            SELECT * FROM balance_snapshots
+            f"""
+            SELECT {SNAPSHOT_COLUMNS} FROM balance_snapshots
             WHERE exchange = %s AND account_id = %s
             ORDER BY snapshot_date DESC LIMIT 1
         """
             if account_id
-            else """
-            SELECT * FROM balance_snapshots
+            else f"""
+            SELECT {SNAPSHOT_COLUMNS} FROM balance_snapshots
             WHERE exchange = %s
             ORDER BY snapshot_date DESC LIMIT 1
         """
         )
         params = [exchange, account_id] if account_id else [exchange]
+        summary_query = """
+            SELECT snapshot_id AS id, exchange, account_id, snapshot_date,
+                   timestamp, total_balance_usd, balances
+            FROM account_summaries
+            WHERE exchange = %s
+        """
+        if account_id:
+            summary_query += " AND account_id = %s"
+        summary_query += " ORDER BY snapshot_date DESC, timestamp DESC LIMIT 1"
         with self.get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Summary lookup first; history scan until summaries exist
+                if self._has_summaries(cur):
+                    cur.execute(summary_query, params)
+                    row = cur.fetchone()
+                    if row:
+                        return dict(row)
                 cur.execute(query, params)
                 row = cur.fetchone()
                 return dict(row) if row else None
@@ -253,14 +2305,14 @@ class Database:
         self, exchange: str = "kraken", account_id: str = None, limit: int = 30
     ):
         query = (
-            """
-            SELECT * FROM balance_snapshots
+            f"""
+            SELECT {SNAPSHOT_COLUMNS} FROM balance_snapshots
             WHERE exchange = %s AND account_id = %s
             ORDER BY snapshot_date DESC LIMIT %s
         """
             if account_id
-            else """
-            SELECT * FROM balance_snapshots
+            else f"""
+            SELECT {SNAPSHOT_COLUMNS} FROM balance_snapshots
             WHERE exchange = %s
             ORDER BY snapshot_date DESC LIMIT %s
         """
@@ -271,7 +2323,52 @@ class Database:
                 cur.execute(query, params)
                 return [dict(row) for row in cur.fetchall()]
 
+    def get_balance_history(
+        self,
+        exchange: str = "kraken",
+        account_id: str = None,
+        start_date=None,
+        end_date=None,
+    ):
+        """
+        Snapshot totals in date order, for one account or all of them
+
+        Each row carries the net deposits/withdrawals (net_flow_usd) netted
+        out of that day's return in daily_returns, 0 when there were none.
+        """
+        query = """
+            SELECT s.account_id, s.snapshot_date, s.total_balance_usd,
+                   COALESCE(r.net_flow_usd, 0) AS net_flow_usd
+            FROM balance_snapshots s
+            LEFT JOIN daily_returns r
+            ON r.exchange = s.exchange AND r.account_id = s.account_id
+            AND r.return_date = s.snapshot_date
+            WHERE s.exchange = %s
+        """
+        params = [exchange]
+        if account_id:
+            query += " AND s.account_id = %s"
+            params.append(account_id)
+        if start_date:
+            query += " AND s.snapshot_date >= %s"
+            params.append(start_date)
+        if end_date:
+            query += " AND s.snapshot_date <= %s"
+            params.append(end_date)
+        query += " ORDER BY s.account_id, s.snapshot_date"
+
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
     def list_accounts(self, exchange: str = "kraken"):
+        summary_query = """
+            SELECT account_id, snapshot_date AS last_snapshot, snapshot_count
+            FROM account_summaries
+            WHERE exchange = %s
+            ORDER BY last_snapshot DESC
+        """
         query = """
             SELECT DISTINCT account_id, 
                    MAX(snapshot_date) as last_snapshot,
@@ -283,9 +2380,169 @@ class Database:
         """
         with self.get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if self._has_summaries(cur):
+                    cur.execute(summary_query, [exchange])
+                    rows = cur.fetchall()
+                    if rows:
+                        return [dict(row) for row in rows]
                 cur.execute(query, [exchange])
                 return [dict(row) for row in cur.fetchall()]
 
+    def get_latest_ledger_timestamp(
+        self, exchange: str, account_id: str
+    ) -> Optional[int]:
+        query = """
+            SELECT MAX(entry_timestamp) FROM ledger_entries
+            WHERE exchange = %s AND account_id = %s
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (exchange, account_id))
+                row = cur.fetchone()
+                if row and row[0]:
+                    return int(row[0].replace(tzinfo=timezone.utc).timestamp() * 1000)
+                return None
+
+    def save_ledger_entries(
+        self, entries: List[Dict], exchange: str, account_id: str
+    ) -> int:
+        """
+        Insert ccxt ledger entries, skipping ones already stored
+
+        Timestamps are stored as naive UTC, like trades.trade_timestamp;
+        returns convert snapshot times to UTC to place flows
+        between the snapshots they fall between.
+
+        Returns:
+            Number of entries actually inserted
+        """
+        if not entries:
+            return 0
+        query = """
+            INSERT INTO ledger_entries (
+                exchange, account_id, entry_id, reference_id, entry_timestamp,
+                entry_type, subtype, currency, amount, fee, balance
+            ) VALUES %s
+            ON CONFLICT (exchange, account_id, entry_id) DO NOTHING
+            RETURNING 1
+        """
+        rows = []
+        for e in entries:
+            info = e.get("info") or {}
+            amount = Decimal(str(e["amount"] or 0))
+            if e.get("direction") == "out":
+                amount = -abs(amount)
+            fee = (e.get("fee") or {}).get("cost")
+            rows.append(
+                (
+                    exchange,
+                    account_id,
+                    e["id"],
+                    e.get("referenceId"),
+                    datetime.fromtimestamp(e["timestamp"] / 1000, timezone.utc).replace(
+                        tzinfo=None
+                    ),
+                    info.get("type") or e.get("type") or "unknown",
+                    info.get("subtype") or None,
+                    e["currency"],
+                    amount,
+                    fee,
+                    e.get("after"),
+                )
+            )
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                returned = psycopg2.extras.execute_values(
+                    cur, query, rows, page_size=500, fetch=True
+                )
+                if returned:
+                    self._notify_write(cur, "ledger_entries", account_id)
+        print(f"Inserted {len(returned)} new ledger entries")
+        return len(returned)
+
+    def value_ledger_flows(self, exchange: str, account_id: str = None):
+        """
+        Fill in usd_value for deposits/withdrawals/transfers not valued yet
+
+        Each flow is priced from the account's holdings on the first
+        snapshot on or after its local day (the one that first holds a
+        deposit), else the last one before it. Legs sharing a reference_id
+        (e.g. a staking transfer out of DOT and into DOT.S) are valued
+        together: while any leg has no price, none is valued, so a pair
+        never books a one-sided flow. Flows left NULL are retried on the
+        next call.
+
+        Returns:
+            Earliest local date of the flows valued, or None when none were
+        """
+        filters = ["l.exchange = %(exchange)s"]
+        params = {
+            "exchange": exchange,
+            "flow_types": LEDGER_FLOW_TYPES,
+            "local_tz": _local_timezone(),
+        }
+        if account_id:
+            filters.append("l.account_id = %(account_id)s")
+            params["account_id"] = account_id
+        local_time = "(l.entry_timestamp AT TIME ZONE 'UTC') AT TIME ZONE %(local_tz)s"
+        price = f"""
+            SELECT h.price FROM balance_holdings h
+            WHERE h.exchange = l.exchange AND h.account_id = l.account_id
+            AND h.asset = l.currency AND h.price IS NOT NULL
+            AND h.snapshot_date {{op}} ({local_time})::date
+            ORDER BY h.snapshot_date {{order}} LIMIT 1
+        """
+        query = f"""
+            WITH priced AS (
+                SELECT l.account_id, l.entry_id, l.reference_id,
+                       {local_time} AS local_time,
+                       ROUND(l.amount * COALESCE(
+                           CASE WHEN l.currency IN ('USD', 'ZUSD') THEN 1 END,
+                           ({price.format(op=">=", order="ASC")}),
+                           ({price.format(op="<", order="DESC")})
+                       ), 2) AS usd
+                FROM ledger_entries l
+                WHERE {" AND ".join(filters)} AND l.usd_value IS NULL
+                AND l.entry_type IN %(flow_types)s
+            )
+            UPDATE ledger_entries l SET usd_value = p.usd
+            FROM priced p
+            WHERE l.exchange = %(exchange)s AND l.account_id = p.account_id
+            AND l.entry_id = p.entry_id AND p.usd IS NOT NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM priced q
+                WHERE q.account_id = p.account_id
+                AND q.reference_id = p.reference_id AND q.usd IS NULL
+            )
+            RETURNING p.local_time
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                valued = [row[0] for row in cur.fetchall()]
+        return min(valued).date() if valued else None
+
+    def get_ledger_flows(
+        self, exchange: str = "kraken", account_id: str = None, limit: int = 50
+    ) -> list:
+        """Deposits, withdrawals and transfers, newest first"""
+        query = """
+            SELECT account_id, entry_timestamp, entry_type, subtype, currency,
+                   amount, fee, usd_value
+            FROM ledger_entries
+            WHERE exchange = %s AND entry_type IN %s
+        """
+        params = [exchange, LEDGER_FLOW_TYPES]
+        if account_id:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        query += " ORDER BY entry_timestamp DESC LIMIT %s"
+        params.append(limit)
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                return [dict(row) for row in cur.fetchall()]
+
     def get_latest_trade_timestamp(
         self, exchange: str, account_id: str
     ) -> Optional[int]:
@@ -304,58 +2561,149 @@ class Database:
                     return int(row[0].timestamp() * 1000)
                 return None
 
-    def save_trades(self, trades: List[Dict], exchange: str, account_id: str) -> int:
+    def _trade_record(
+        self, t: dict, exchange: str, account_id: str, offloaded: dict
+    ) -> dict:
+        fee = t.get("fee") or {}
+        return {
+            "exchange": exchange,
+            "account_id": account_id,
+            "trade_id": t["id"],
+            "trade_timestamp": (
+                t["datetime"]
+                if isinstance(t["datetime"], str)
+                else datetime.fromtimestamp(t["timestamp"] / 1000, timezone.utc)
+                .replace(tzinfo=None)
+                .isoformat()
+            ),
+            "symbol": t["symbol"],
+            "side": t["side"],
+            "type": t.get("type"),
+            "price": t["price"],
+            "amount": t["amount"],
+            "cost": t["cost"],
+            "fee_cost": fee.get("cost"),
+            "fee_currency": fee.get("currency"),
+            **self._raw_values(t, offloaded),
+        }
+
+    def save_trades(
+        self, trades: List[Dict], exchange: str, account_id: str, bulk: bool = None
+    ) -> int:
+        """
+        Insert trades, skipping ones already stored
+
+        Args:
+            trades: ccxt trade dictionaries
+            exchange: Exchange name
+            account_id: Account identifier
+            bulk: Force the COPY path (True) or the batched INSERT path (False).
+                  Defaults to COPY for batches of COPY_THRESHOLD trades or more.
+
+        Returns:
+            Number of trades actually inserted
+        """
         if not trades:
             return 0
 
-        query = """
-            INSERT INTO trades (
-                exchange, account_id, trade_id, trade_timestamp, symbol,
-                side, type, price, amount, cost, fee_cost, fee_currency, raw_data
-            ) VALUES (
-                %(exchange)s, %(account_id)s, %(trade_id)s, %(trade_timestamp)s, %(symbol)s,
-                %(side)s, %(type)s, %(price)s, %(amount)s, %(cost)s, %(fee_cost)s, %(fee_currency)s, %(raw_data)s
-            )
-            ON CONFLICT (exchange, account_id, trade_id) DO NOTHING
-        """
-
-        records = []
-        for t in trades:
-            fee = t.get("fee") or {}
-            records.append(
-                {
-                    "exchange": exchange,
-                    "account_id": account_id,
-                    "trade_id": t["id"],
-                    "trade_timestamp": (
-                        t["datetime"]
-                        if isinstance(t["datetime"], str)
-                        else t["timestamp"] / 1000
-                    ),
-                    "symbol": t["symbol"],
-                    "side": t["side"],
-                    "type": t.get("type"),
-                    "price": t["price"],
-                    "amount": t["amount"],
-                    "cost": t["cost"],
-                    "fee_cost": fee.get("cost"),
-                    "fee_currency": fee.get("currency"),
-                    "raw_data": json.dumps(t),
-                }
+        if bulk is None:
+            bulk = len(trades) >= self.COPY_THRESHOLD
+
+        stamps = [t["timestamp"] for t in trades if t.get("timestamp") is not None]
+        if stamps:
+            self._ensure_partitions(
+                "trades",
+                datetime.fromtimestamp(min(stamps) / 1000, timezone.utc),
+                datetime.fromtimestamp(max(stamps) / 1000, timezone.utc),
             )
 
+        if bulk:
+            inserted = self._copy_trades(trades, exchange, account_id)
+        else:
+            inserted = self._insert_trades(trades, exchange, account_id)
+        print(f"Inserted {inserted} new trades")
+        return inserted
+
+    def _insert_trades(self, trades: List[Dict], exchange: str, account_id: str) -> int:
+        # No conflict target: when partitioned, the unique key also holds
+        # trade_timestamp, and the serial primary key never conflicts
+        query = f"""
+            INSERT INTO trades ({", ".join(TRADE_COLUMNS)}) VALUES %s
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        """
+        template = "(" + ", ".join(f"%({col})s" for col in TRADE_COLUMNS) + ")"
+        offloaded = {}
+        records = [
+            self._trade_record(t, exchange, account_id, offloaded) for t in trades
+        ]
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                self._store_offloaded(cur, offloaded)
+                # RETURNING rows are collected across pages, unlike cur.rowcount
+                returned = psycopg2.extras.execute_values(
+                    cur, query, records, template=template, page_size=500, fetch=True
+                )
+                if returned:
+                    self._notify_write(cur, "trades", account_id)
+        return len(returned)
+
+    def _copy_trades(self, trades: List[Dict], exchange: str, account_id: str) -> int:
+        columns = ", ".join(TRADE_COLUMNS)
+
+        # Offloaded payloads ride along in an extra staging column instead of
+        # being collected in memory, then move to raw_payloads set-based
+        def staged_rows():
+            for t in trades:
+                offloaded = {}
+                record = self._trade_record(t, exchange, account_id, offloaded)
+                row = [record[col] for col in TRADE_COLUMNS]
+                row.append(offloaded.get(record["raw_hash"]))
+                yield row
+
         with self.get_connection() as conn:
             with conn.cursor() as cur:
-                psycopg2.extras.execute_batch(cur, query, records)
+                cur.execute(
+                    f"""
+                    CREATE TEMP TABLE trades_staging ON COMMIT DROP AS
+                    SELECT {columns} FROM trades WITH NO DATA;
+                    ALTER TABLE trades_staging ADD COLUMN raw_payload BYTEA;
+                    """
+                )
+                cur.copy_expert(
+                    f"COPY trades_staging ({columns}, raw_payload) FROM STDIN",
+                    _CopyRowStream(staged_rows()),
+                    size=COPY_CHUNK_SIZE,
+                )
+                if self.raw_payload_mode == "offload":
+                    cur.execute(
+                        """
+                        INSERT INTO raw_payloads (hash, payload)
+                        SELECT DISTINCT ON (raw_hash) raw_hash, raw_payload
+                        FROM trades_staging
+                        WHERE raw_hash IS NOT NULL
+                        ON CONFLICT (hash) DO NOTHING
+                        """
+                    )
+                cur.execute(
+                    f"""
+                    INSERT INTO trades ({columns})
+                    SELECT DISTINCT ON (exchange, account_id, trade_id) {columns}
+                    FROM trades_staging
+                    ON CONFLICT DO NOTHING
+                    """
+                )
                 inserted = cur.rowcount
-        print(f"Inserted {inserted} new trades")
-        return inserted
+                if inserted:
+                    self._notify_write(cur, "trades", account_id)
+                return inserted
 
     def get_all_trades(
         self, exchange: str = "kraken", account_id: str = None, limit: int = 100
     ):
-        query = """
-            SELECT * FROM trades
+        query = f"""
+            SELECT {TRADE_READ_COLUMNS} FROM trades
             WHERE exchange = %s
         """
         params = [exchange]
@@ -369,3 +2717,132 @@ class Database:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(query, params)
                 return [dict(row) for row in cur.fetchall()]
+
+    def iter_trades(
+        self,
+        exchange: str,
+        account_id: str,
+        after: list = None,
+        batch_size: int = 5000,
+    ):
+        """
+        Yield an account's trades oldest first, in batches of dicts
+
+        Rows come from a named server-side cursor ordered by
+        (trade_timestamp, id), so only one batch is held in memory.
+
+        Args:
+            after: Optional [trade_timestamp, id] keyset; only later trades are read
+        """
+        query = f"""
+            SELECT {TRADE_READ_COLUMNS} FROM trades
+            WHERE exchange = %s AND account_id = %s
+        """
+        params = [exchange, account_id]
+        if after:
+            query += " AND (trade_timestamp, id) > (%s::timestamp, %s)"
+            params.extend(after)
+        query += " ORDER BY trade_timestamp, id"
+
+        with self.get_connection() as conn:
+            with conn.cursor(name="iter_trades", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+
+    def has_trades_behind(
+        self, exchange: str, account_id: str, before, max_id: int
+    ) -> bool:
+        """
+        Whether a trade stored after max_id is dated before `before`
+
+        Ids grow with insertion, so this finds trades inserted behind a
+        keyset checkpoint (e.g. by a late backfill) by scanning only the
+        rows added since.
+        """
+        query = """
+            SELECT EXISTS (
+                SELECT 1 FROM trades
+                WHERE id > %s AND exchange = %s AND account_id = %s
+                AND trade_timestamp < %s::timestamp
+            )
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (max_id, exchange, account_id, before))
+                return cur.fetchone()[0]
+
+    def _export_query(
+        self, kind: str, exchange: str, account_id: str = None, limit: int = None
+    ):
+        select, order_by = EXPORT_QUERIES[kind]
+        query = select + " WHERE exchange = %s"
+        params = [exchange]
+        if account_id:
+            query += " AND account_id = %s"
+            params.append(account_id)
+        query += f" ORDER BY {order_by} DESC LIMIT %s"
+        params.append(limit)
+        return query, params
+
+    def export_csv(
+        self,
+        kind: str,
+        fileobj,
+        exchange: str = "kraken",
+        account_id: str = None,
+        limit: int = None,
+    ) -> int:
+        """
+        Stream an export as CSV (with header) into fileobj via COPY TO STDOUT
+
+        Rows go from the server straight into fileobj in chunks, so memory
+        stays flat however many rows are exported.
+
+        Args:
+            kind: One of EXPORT_QUERIES ('balances', 'returns', 'trades')
+            fileobj: Binary file object to write to
+            exchange: Exchange name
+            account_id: Optional account filter
+            limit: Maximum rows, newest first (None for all)
+
+        Returns:
+            Number of rows written
+        """
+        query, params = self._export_query(kind, exchange, account_id, limit)
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                select = cur.mogrify(query, params).decode()
+                cur.copy_expert(
+                    f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)", fileobj
+                )
+                return cur.rowcount
+
+    def iter_export(
+        self,
+        kind: str,
+        exchange: str = "kraken",
+        account_id: str = None,
+        limit: int = None,
+        batch_size: int = 50000,
+    ):
+        """
+        Yield an export's rows in batches from a named server-side cursor
+
+        Same rows and columns as export_csv, as lists of tuples of at most
+        batch_size rows. Only one batch is held in memory at a time.
+        """
+        query, params = self._export_query(kind, exchange, account_id, limit)
+        with self.get_connection() as conn:
+            with conn.cursor(name=f"export_{kind}") as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
@@ -0,0 +1,145 @@
+"""Export engine shared by the Telegram bot and CLI"""
+
+import gzip
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Format name -> file extension
+FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+}
+
+# Rows per Parquet row group, fetched per server-side cursor batch
+PARQUET_ROW_GROUP = 50000
+
+# Column types for Database.EXPORT_QUERIES, used when writing Parquet
+PARQUET_COLUMNS = {
+    "balances": [
+        ("timestamp", "timestamp"),
+        ("total_balance_usd", ("decimal", 20, 2)),
+    ],
+    "returns": [
+        ("date", "date"),
+        ("previous_date", "date"),
+        ("return_usd", ("decimal", 20, 2)),
+        ("return_pct", ("decimal", 10, 2)),
+        ("balance_usd", ("decimal", 20, 2)),
+    ],
+    "trades": [
+        ("timestamp", "timestamp"),
+        ("symbol", "string"),
+        ("side", "string"),
+        ("type", "string"),
+        ("amount", ("decimal", 20, 8)),
+        ("price", ("decimal", 20, 8)),
+        ("cost", ("decimal", 20, 2)),
+        ("fee_cost", ("decimal", 20, 8)),
+        ("fee_currency", "string"),
+        ("trade_id", "string"),
+    ],
+}
+
+
+def available_formats() -> list:
+    """Formats whose optional dependencies are installed"""
+    return [
+        fmt
+        for fmt in FORMATS
+        if not (fmt == "csv.zst" and zstandard is None)
+        and not (fmt == "parquet" and pa is None)
+    ]
+
+
+def export_filename(kind: str, fmt: str) -> str:
+    return f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M')}{FORMATS[fmt]}"
+
+
+def _parquet_schema(kind: str):
+    types = {"timestamp": pa.timestamp("s"), "date": pa.date32(), "string": pa.string()}
+    fields = []
+    for name, spec in PARQUET_COLUMNS[kind]:
+        if isinstance(spec, tuple):
+            _, precision, scale = spec
+            fields.append(pa.field(name, pa.decimal128(precision, scale)))
+        else:
+            fields.append(pa.field(name, types[spec]))
+    return pa.schema(fields)
+
+
+def _write_parquet(db, kind: str, fileobj, **query) -> int:
+    schema = _parquet_schema(kind)
+    rows = 0
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for batch in db.iter_export(kind, batch_size=PARQUET_ROW_GROUP, **query):
+            columns = list(zip(*batch))
+            table = pa.Table.from_arrays(
+                [pa.array(col, type=f.type) for col, f in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_table(table)
+            rows += len(batch)
+    return rows
+
+
+def write_export(
+    db,
+    kind: str,
+    fileobj,
+    fmt: str = "csv",
+    exchange: str = "kraken",
+    account_id: str = None,
+    limit: int = None,
+) -> int:
+    """
+    Stream an export into a binary file object in the requested format
+
+    CSV variants are written by COPY straight through the (optional)
+    compressor; Parquet is written one row group per server-side cursor
+    batch. Neither holds the full export in memory.
+
+    Args:
+        db: Database instance
+        kind: 'balances', 'returns' or 'trades'
+        fileobj: Binary file object to write to (left open)
+        fmt: One of FORMATS
+        exchange: Exchange name
+        account_id: Optional account filter
+        limit: Maximum rows, newest first (None for all)
+
+    Returns:
+        Number of rows exported
+
+    Raises:
+        ValueError: Unknown format, or its optional dependency is missing
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r} (use {', '.join(FORMATS)})")
+    if fmt not in available_formats():
+        package = "pyarrow" if fmt == "parquet" else "zstandard"
+        raise ValueError(f"{fmt} export requires the {package} package")
+
+    query = {"exchange": exchange, "account_id": account_id, "limit": limit}
+    if fmt == "parquet":
+        return _write_parquet(db, kind, fileobj, **query)
+    if fmt == "csv.gz":
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6) as gz:
+            return db.export_csv(kind, gz, **query)
+    if fmt == "csv.zst":
+        compressor = zstandard.ZstdCompressor(level=10)
+        with compressor.stream_writer(fileobj, closefd=False) as zst:
+            return db.export_csv(kind, zst, **query)
+    return db.export_csv(kind, fileobj, **query)
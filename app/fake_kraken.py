@@ -0,0 +1,388 @@
+"""Offline stand-in for ccxt's Kraken client, for deterministic load testing"""
+
+import asyncio
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+
+import ccxt
+
+# Spec keys accepted in FAKE_KRAKEN (e.g. "assets=20,trades=5000,latency=0.05")
+DEFAULTS = {
+    "accounts": 1,  # synthetic accounts when there is no registry or API key
+    "keys": 0,  # API keys they share (0: one key per account)
+    "assets": 8,  # currencies held per account
+    "trades": 500,  # trade history length per API key
+    "ledger": 20,  # deposits/withdrawals per API key
+    "days": 365,  # history span, ending at the start of today (UTC)
+    "latency": 0.0,  # mean seconds per call (uniform 0.5x-1.5x)
+    "rate_limit": 0.0,  # probability a call raises RateLimitExceeded
+    "timeouts": 0.0,  # probability a call raises RequestTimeout
+    "seed": 42,
+}
+
+# Currency universe: most trade against USD, some only against EUR or BTC
+# so valuation exercises its cross-rate routes
+QUOTES = {
+    "BTC": "USD",
+    "ETH": "USD",
+    "SOL": "USD",
+    "XRP": "USD",
+    "ADA": "USD",
+    "DOT": "USD",
+    "LTC": "USD",
+    "DOGE": "USD",
+    "LINK": "USD",
+    "ATOM": "USD",
+    "AVAX": "USD",
+    "MATIC": "USD",
+    "UNI": "USD",
+    "XLM": "USD",
+    "ALGO": "USD",
+    "FIL": "USD",
+    "EUR": "USD",
+    "GBP": "USD",
+    "KSM": "EUR",
+    "FLOW": "EUR",
+    "SC": "EUR",
+    "MINA": "EUR",
+    "XTZ": "BTC",
+    "ZEC": "BTC",
+}
+
+PAGE_SIZE = 50
+
+
+def parse_spec(spec: str) -> dict:
+    """
+    Parse a FAKE_KRAKEN spec into settings
+
+    Args:
+        spec: Comma-separated key=value pairs (keys from DEFAULTS); "1" or
+            "true" alone means all defaults
+
+    Returns:
+        DEFAULTS updated with the given values, cast to the default's type
+    """
+    settings = dict(DEFAULTS)
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        key, sep, value = pair.partition("=")
+        if not sep and key.lower() in ("1", "true"):
+            continue
+        if key not in DEFAULTS:
+            raise ValueError(
+                f"Unknown FAKE_KRAKEN setting {key!r} (use {', '.join(DEFAULTS)})"
+            )
+        settings[key] = type(DEFAULTS[key])(value)
+    return settings
+
+
+def fake_accounts(settings: dict) -> list:
+    """Accounts registry entries for the synthetic accounts"""
+    keys = settings["keys"] or settings["accounts"]
+    return [
+        {
+            "account_id": f"fake_{i:03d}",
+            "api_key": f"fake-key-{i % keys:03d}",
+            "api_secret": "fake-secret",
+        }
+        for i in range(settings["accounts"])
+    ]
+
+
+class _FakeAccount:
+    """Deterministic balances, trades and ledger for one API key"""
+
+    def __init__(self, api_key: str, settings: dict, prices: dict):
+        self.settings = settings
+        self.prices = prices
+        self.seed = f"{settings['seed']}:{api_key}"
+        # Keeps ids unique across keys (crc32, unlike hash(), is stable across runs)
+        self.tag = zlib.crc32(self.seed.encode()) % 100000
+        rng = random.Random(self.seed)
+
+        held = rng.sample(sorted(QUOTES), min(settings["assets"], len(QUOTES)))
+        self.balance = {"USD": round(rng.uniform(100, 50000), 4)}
+        for code in held:
+            self.balance[code] = round(rng.uniform(10, 20000) / prices[code], 8)
+        self.symbols = [f"{code}/{QUOTES[code]}" for code in held] or ["BTC/USD"]
+
+        # Rows are evenly spaced over the history span, so a time window maps
+        # to an index range without materializing the history
+        self.end_ms = int(
+            datetime.now(timezone.utc)
+            .replace(hour=0, minute=0, second=0, microsecond=0)
+            .timestamp()
+            * 1000
+        )
+        self.span_ms = settings["days"] * 86400 * 1000
+
+    def _step(self, count: int) -> int:
+        return max(self.span_ms // max(count, 1), 1)
+
+    def _window(self, count: int, since, end) -> range:
+        """Indices of rows in (since, end], oldest first"""
+        step = self._step(count)
+        start_ms = self.end_ms - step * count
+        lo = 0 if since is None else max(0, (int(since) - start_ms) // step)
+        hi = count if end is None else min(count, (int(end) * 1000 - start_ms) // step)
+        return range(lo, max(hi, lo))
+
+    def _stamp(self, count: int, i: int) -> int:
+        step = self._step(count)
+        return self.end_ms - step * count + step * (i + 1)
+
+    def trade(self, i: int) -> dict:
+        count = self.settings["trades"]
+        rng = random.Random(f"{self.seed}:trade:{i}")
+        symbol = rng.choice(self.symbols)
+        base, quote = symbol.split("/")
+        price = round(self.prices[base] / self.prices[quote] * rng.uniform(0.7, 1.3), 8)
+        amount = round(rng.uniform(10, 2000) / self.prices[base], 8)
+        cost = round(price * amount, 8)
+        ts = self._stamp(count, i)
+        return {
+            "id": f"FT{i:08d}-{self.tag:05d}",
+            "order": f"FO{i:08d}",
+            "timestamp": ts,
+            "datetime": _iso(ts),
+            "symbol": symbol,
+            "type": rng.choice(["limit", "market"]),
+            "side": rng.choice(["buy", "sell"]),
+            "takerOrMaker": "taker",
+            "price": price,
+            "amount": amount,
+            "cost": cost,
+            "fee": {"cost": round(cost * 0.0026, 8), "currency": quote},
+            "info": {"pair": symbol.replace("/", ""), "ordertype": "limit"},
+        }
+
+    def ledger_entry(self, i: int) -> dict:
+        count = self.settings["ledger"]
+        rng = random.Random(f"{self.seed}:ledger:{i}")
+        currency = rng.choice(["USD"] + [s.split("/")[0] for s in self.symbols])
+        deposit = rng.random() < 0.75
+        amount = round(rng.uniform(50, 5000) / self.prices.get(currency, 1), 8)
+        fee = 0.0 if deposit else round(amount * 0.001, 8)
+        ts = self._stamp(count, i)
+        kind = "deposit" if deposit else "withdrawal"
+        return {
+            "id": f"FL{i:08d}-{self.tag:05d}",
+            "timestamp": ts,
+            "datetime": _iso(ts),
+            "direction": "in" if deposit else "out",
+            "account": None,
+            "referenceId": f"FR{i:08d}",
+            "referenceAccount": None,
+            "type": "transaction",
+            "currency": currency,
+            "amount": amount,
+            "before": None,
+            "after": None,
+            "status": "ok",
+            "fee": {"cost": fee, "currency": currency},
+            "info": {"type": kind, "subtype": "", "asset": currency},
+        }
+
+    def page(self, kind: str, since, end, offset: int, limit: int = None) -> list:
+        """Newest-first page, like Kraken's TradesHistory/Ledgers with ofs"""
+        count = self.settings["trades" if kind == "trade" else "ledger"]
+        window = self._window(count, since, end)
+        build = self.trade if kind == "trade" else self.ledger_entry
+        newest = len(window) - 1 - offset
+        size = min(limit or PAGE_SIZE, PAGE_SIZE)
+        return [build(window[j]) for j in range(newest, max(newest - size, -1), -1)]
+
+
+def _iso(ms: int) -> str:
+    stamp = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    return stamp.strftime("%Y-%m-%dT%H:%M:%S.") + f"{stamp.microsecond // 1000:03d}Z"
+
+
+class FakeKraken:
+    """
+    ccxt-compatible stub for the Kraken methods KrakenConnector calls
+
+    Balances, trades and ledger entries are generated from the seed and API
+    key, so every run (and every connector sharing a key) sees the same
+    account. Each call sleeps for the configured latency and may raise
+    ccxt.RateLimitExceeded or ccxt.RequestTimeout, which KrakenConnector
+    retries like the real errors. Call counts are kept in `calls`.
+    """
+
+    def __init__(self, api_key: str = "fake-key", settings: dict = None):
+        self.settings = settings or dict(DEFAULTS)
+        self.apiKey = api_key
+        self.secret = "fake-secret"
+        self.markets = None
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._faults = random.Random(f"{self.settings['seed']}:faults:{api_key}")
+
+        prices_rng = random.Random(self.settings["seed"])
+        self.prices = {"USD": 1.0, "EUR": 1.08, "GBP": 1.27, "BTC": 65000.0}
+        for code in QUOTES:
+            self.prices.setdefault(code, round(10 ** prices_rng.uniform(-1.5, 3.5), 6))
+        self.account = _FakeAccount(api_key, self.settings, self.prices)
+
+    @classmethod
+    def from_spec(cls, spec: str, api_key: str = "fake-key"):
+        return cls(api_key, parse_spec(spec))
+
+    def _fault(self, method: str) -> float:
+        """Count the call, pick its latency and maybe raise a transient error"""
+        with self._lock:
+            self.calls[method] += 1
+            draw = self._faults.random()
+            delay = self.settings["latency"] * self._faults.uniform(0.5, 1.5)
+        if draw < self.settings["rate_limit"]:
+            self.errors["rate_limit"] += 1
+            raise ccxt.RateLimitExceeded("kraken EAPI:Rate limit exceeded (fake)")
+        if draw < self.settings["rate_limit"] + self.settings["timeouts"]:
+            self.errors["timeout"] += 1
+            raise ccxt.RequestTimeout(f"kraken {method} timed out (fake)")
+        return delay
+
+    def _call(self, method: str, build):
+        delay = self._fault(method)
+        if delay:
+            time.sleep(delay)
+        return build()
+
+    def set_markets(self, markets):
+        self.markets = markets
+
+    def _markets(self) -> dict:
+        markets = {}
+        for code, quote in QUOTES.items():
+            symbol = f"{code}/{quote}"
+            markets[symbol] = {
+                "id": f"{code}{quote}",
+                "symbol": symbol,
+                "base": code,
+                "quote": quote,
+                "active": True,
+                "spot": True,
+            }
+        return markets
+
+    def _load_markets(self) -> dict:
+        if self.markets is None:
+            self.markets = self._markets()
+        return self.markets
+
+    def _balance(self) -> dict:
+        total = dict(self.account.balance)
+        balance = {
+            "info": {"result": {k: str(v) for k, v in total.items()}},
+            "total": total,
+            "free": dict(total),
+            "used": {k: 0.0 for k in total},
+        }
+        for code, amount in total.items():
+            balance[code] = {"free": amount, "used": 0.0, "total": amount}
+        return balance
+
+    def _tickers(self, symbols=None) -> dict:
+        now = int(time.time() * 1000)
+        markets = self._load_markets()
+        tickers = {}
+        for symbol in symbols or list(markets):
+            if symbol not in markets:
+                raise ccxt.BadSymbol(f"kraken does not have market symbol {symbol}")
+            base, quote = symbol.split("/")
+            last = round(self.prices[base] / self.prices[quote], 8)
+            tickers[symbol] = {
+                "symbol": symbol,
+                "timestamp": now,
+                "datetime": _iso(now),
+                "last": last,
+                "bid": last * 0.9995,
+                "ask": last * 1.0005,
+            }
+        return tickers
+
+    def _trades(self, symbol=None, since=None, limit=None, params=None) -> list:
+        params = params or {}
+        page = self.account.page(
+            "trade", since, params.get("end"), int(params.get("ofs", 0)), limit
+        )
+        return [t for t in page if symbol is None or t["symbol"] == symbol]
+
+    def _ledger(self, code=None, since=None, limit=None, params=None) -> list:
+        params = params or {}
+        page = self.account.page(
+            "ledger", since, params.get("end"), int(params.get("ofs", 0)), limit
+        )
+        return [e for e in page if code is None or e["currency"] == code]
+
+    def load_markets(self, reload: bool = False, params=None) -> dict:
+        return self._call("load_markets", self._load_markets)
+
+    def fetch_balance(self, params=None) -> dict:
+        return self._call("fetch_balance", self._balance)
+
+    def fetch_tickers(self, symbols=None, params=None) -> dict:
+        return self._call("fetch_tickers", lambda: self._tickers(symbols))
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None):
+        return self._call(
+            "fetch_my_trades", lambda: self._trades(symbol, since, limit, params)
+        )
+
+    def fetch_ledger(self, code=None, since=None, limit=None, params=None):
+        return self._call(
+            "fetch_ledger", lambda: self._ledger(code, since, limit, params)
+        )
+
+    def as_async(self):
+        """Async twin sharing this stub's data and counters"""
+        return AsyncFakeKraken(self)
+
+
+class AsyncFakeKraken:
+    """ccxt.async_support-style wrapper around a FakeKraken"""
+
+    def __init__(self, fake: FakeKraken):
+        self.fake = fake
+        self.apiKey = fake.apiKey
+        self.secret = fake.secret
+
+    @property
+    def markets(self):
+        return self.fake.markets
+
+    def set_markets(self, markets):
+        self.fake.set_markets(markets)
+
+    async def _call(self, method: str, build):
+        delay = self.fake._fault(method)
+        if delay:
+            await asyncio.sleep(delay)
+        return build()
+
+    async def load_markets(self, reload: bool = False, params=None) -> dict:
+        return await self._call("load_markets", self.fake._load_markets)
+
+    async def fetch_balance(self, params=None) -> dict:
+        return await self._call("fetch_balance", self.fake._balance)
+
+    async def fetch_tickers(self, symbols=None, params=None) -> dict:
+        return await self._call("fetch_tickers", lambda: self.fake._tickers(symbols))
+
+    async def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None):
+        return await self._call(
+            "fetch_my_trades", lambda: self.fake._trades(symbol, since, limit, params)
+        )
+
+    async def fetch_ledger(self, code=None, since=None, limit=None, params=None):
+        return await self._call(
+            "fetch_ledger", lambda: self.fake._ledger(code, since, limit, params)
+        )
+
+    async def close(self):
+        pass
@@ -125,10 +125,15 @@
 
 
 """Kraken exchange connector"""
+import asyncio
+import time
 import ccxt
+import ccxt.async_support as ccxt_async
 from datetime import datetime
 from decimal import Decimal
-from pprint import pprint
+from price_cache import PriceCache, default_cache
+import metrics
+from valuation import ConversionGraph, clean_currency, route_symbols
 
 
 class KrakenConnector:
@@ -144,8 +149,25 @@ class KrakenConnector:
         "USDC.F",
     }
 
-    def __init__(self, api_key: str, api_secret: str, account_id: str = None):
-        self.exchange = ccxt.kraken(
+    # Kraken's TradesHistory/Ledgers endpoints return at most 50 rows per call
+    TRADE_PAGE_SIZE = 50
+    LEDGER_PAGE_SIZE = 50
+
+    # Retries for transient errors (rate limits, timeouts), doubling the delay each time
+    MAX_RETRIES = 3
+    RETRY_BACKOFF = 2.0
+
+    def __init__(
+        self,
+        api_key: str,
+        api_secret: str,
+        account_id: str = None,
+        price_cache: PriceCache = None,
+        exchange=None,
+    ):
+        # exchange: optional ccxt-compatible client to use instead of Kraken
+        # (e.g. fake_kraken.FakeKraken for offline load tests)
+        self.exchange = exchange or ccxt.kraken(
             {
                 "apiKey": api_key,
                 "secret": api_secret,
@@ -154,9 +176,17 @@ class KrakenConnector:
         )
         # Store account identifier
         self.account_id = account_id if account_id else api_key[-8:]
+        # Async client (created on first async call) and pricing pairs held last time
+        self._async_exchange = None
+        self._held_symbols = []
+        # Conversion graph memoized per price cache generation and symbol set
+        self._graph = None
+        self._graph_key = None
+        # Prices are shared with every other connector in the process by default
+        self.price_cache = price_cache or default_cache()
 
     def _calculate_usd_value(
-        self, currency: str, amount: float, tickers: dict
+        self, currency: str, amount: float, graph: ConversionGraph
     ) -> Decimal:
         """
         Calculate USD value for a given currency and amount
@@ -164,82 +194,226 @@ class KrakenConnector:
         Args:
             currency: Currency code (e.g., 'BTC', 'ETH', 'USD')
             amount: Amount of the currency
-            tickers: Dictionary of ticker data from exchange
+            graph: Conversion graph built from the current tickers
 
         Returns:
             Decimal: USD value of the amount
         """
-        # Clean currency code (remove .F suffix if present)
-        clean_currency = currency.split(".")[0] if "." in currency else currency
-
         # USD equivalents are 1:1
         if currency in self.USD_EQUIVALENTS:
             return Decimal(str(amount))
 
-        # Try to find USD pair for other currencies
-        symbol = f"{clean_currency}/USD"
-        if symbol in tickers:
-            price = Decimal(str(tickers[symbol]["last"]))
-            return price * Decimal(str(amount))
+        # Direct /USD pair or the shortest cross-rate route to USD
+        rate = graph.rate(currency)
+        if rate is not None:
+            return rate * Decimal(str(amount))
 
-        # If no USD pair found, print warning and return 0
-        print(f"{clean_currency} not in tickers, can't get USD price")
+        # If no route to USD found, print warning and return 0
+        print(f"{clean_currency(currency)} has no route to USD, can't get USD price")
         return Decimal("0")
 
+    def _conversion_graph(self, tickers: dict) -> ConversionGraph:
+        """Build the conversion graph once per ticker refresh"""
+        key = (self.price_cache.generation, tuple(sorted(tickers)))
+        if key != self._graph_key:
+            roots = {clean_currency(c) for c in self.USD_EQUIVALENTS}
+            self._graph = ConversionGraph(tickers, roots)
+            self._graph_key = key
+        return self._graph
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        metrics.inc("kraken_api_errors_total", error=type(error).__name__)
+        if attempt >= self.MAX_RETRIES:
+            raise error
+        delay = self.RETRY_BACKOFF * 2**attempt
+        print(
+            f"[{self.account_id}] {type(error).__name__}, retrying in {delay:.0f}s "
+            f"({attempt + 1}/{self.MAX_RETRIES})"
+        )
+        return delay
+
+    def _call(self, method, *args, **kwargs):
+        """Call an exchange method, retrying rate-limit and network errors"""
+        attempt = 0
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except ccxt.NetworkError as e:
+                time.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+            except ccxt.BaseError as e:
+                metrics.inc("kraken_api_errors_total", error=type(e).__name__)
+                raise
+
+    async def _call_async(self, method, *args, **kwargs):
+        """Async counterpart of _call"""
+        attempt = 0
+        while True:
+            try:
+                return await method(*args, **kwargs)
+            except ccxt.NetworkError as e:
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+            except ccxt.BaseError as e:
+                metrics.inc("kraken_api_errors_total", error=type(e).__name__)
+                raise
+
+    def _usd_symbols(self, currencies, markets: dict) -> list:
+        """
+        Map held currencies to the ticker symbols needed to value them in USD
+
+        Assets without a /USD market are routed through a cross quote
+        (e.g. 'FOO/EUR' plus 'EUR/USD').
+
+        Args:
+            currencies: Iterable of balance currency codes (e.g. 'BTC.F')
+            markets: Loaded exchange markets keyed by symbol
+
+        Returns:
+            Sorted list of symbols like 'BTC/USD'
+        """
+        currencies = [c for c in currencies if c not in self.USD_EQUIVALENTS]
+        roots = {clean_currency(c) for c in self.USD_EQUIVALENTS}
+        return route_symbols(currencies, markets, roots)
+
+    def _build_balance(self, balance: dict, tickers: dict) -> dict:
+        # Age of the oldest cached price used for valuation
+        now = time.time()
+        price_age = max(
+            (now - t["fetched_at"] for t in tickers.values() if "fetched_at" in t),
+            default=0.0,
+        )
+
+        # One graph build values every held asset
+        graph = self._conversion_graph(tickers)
+
+        # Calculate total in USD and build balances dict
+        total_usd = Decimal("0")
+        balances = {}
+
+        for currency, amount in balance["total"].items():
+            if amount > 0:
+                # Calculate USD value
+                usd_value = self._calculate_usd_value(currency, amount, graph)
+
+                # Add to balances dict (clean currency code for display)
+                balances[clean_currency(currency)] = {
+                    "amount": Decimal(str(amount)),
+                    "usd_value": usd_value,
+                    "price": (
+                        Decimal("1")
+                        if currency in self.USD_EQUIVALENTS
+                        else graph.rate(currency)
+                    ),
+                }
+
+                # Add to total
+                total_usd += usd_value
+
+        return {
+            "exchange": "kraken",
+            "account_id": self.account_id,
+            "timestamp": datetime.now(),
+            "total_balance_usd": total_usd,
+            "balances": balances,
+            "price_age_seconds": price_age,
+            "raw_data": balance,
+        }
+
+    @staticmethod
+    def _held_currencies(balance: dict) -> list:
+        return [c for c, amount in balance["total"].items() if amount and amount > 0]
+
     def get_account_balance(self):
         """
         Fetch current account balance from Kraken
 
+        Tickers are requested only for the pairs that price held assets in
+        USD (directly or via a cross quote) rather than every market on the
+        exchange.
+
         Returns dict with:
             - exchange: 'kraken'
             - account_id: account identifier
             - timestamp: datetime
             - total_balance_usd: Decimal
-            - balances: dict of {currency: {amount, usd_value}}
+            - balances: dict of {currency: {amount, usd_value, price}}
+            - price_age_seconds: age of the oldest cached price used
             - raw_data: full API response
         """
         try:
-            # Fetch balance and tickers
-            balance = self.exchange.fetch_balance()
-            tickers = self.exchange.fetch_tickers()
-
-            pprint(balance)
-
-            # Calculate total in USD and build balances dict
-            total_usd = Decimal("0")
-            balances = {}
-
-            for currency, amount in balance["total"].items():
-                if amount > 0:
-                    # Clean currency code for display
-                    clean_currency = (
-                        currency.split(".")[0] if "." in currency else currency
-                    )
-
-                    # Calculate USD value
-                    usd_value = self._calculate_usd_value(currency, amount, tickers)
-
-                    # Add to balances dict
-                    balances[clean_currency] = {
-                        "amount": Decimal(str(amount)),
-                        "usd_value": usd_value,
-                    }
-
-                    # Add to total
-                    total_usd += usd_value
-
-            return {
-                "exchange": "kraken",
-                "account_id": self.account_id,
-                "timestamp": datetime.now(),
-                "total_balance_usd": total_usd,
-                "balances": balances,
-                "raw_data": balance,
-            }
+            # Fetch balance, then prices for held assets only (via the shared cache)
+            balance = self._call(self.exchange.fetch_balance)
+            markets = self._call(self.exchange.load_markets)
+            symbols = self._usd_symbols(self._held_currencies(balance), markets)
+            tickers = self.price_cache.get_many(
+                symbols,
+                lambda missing: self._call(self.exchange.fetch_tickers, missing),
+            )
+            self._held_symbols = symbols
+
+            return self._build_balance(balance, tickers)
 
         except Exception as e:
             raise Exception(f"Failed to fetch Kraken balance: {str(e)}")
 
+    def _get_async_exchange(self):
+        if self._async_exchange is None and hasattr(self.exchange, "as_async"):
+            self._async_exchange = self.exchange.as_async()
+        if self._async_exchange is None:
+            self._async_exchange = ccxt_async.kraken(
+                {
+                    "apiKey": self.exchange.apiKey,
+                    "secret": self.exchange.secret,
+                    "enableRateLimit": True,
+                }
+            )
+            if self.exchange.markets:
+                self._async_exchange.set_markets(self.exchange.markets)
+        return self._async_exchange
+
+    async def get_account_balance_async(self):
+        """
+        Fetch current account balance using ccxt.async_support
+
+        The balance and ticker requests run concurrently. Tickers are fetched
+        for the pricing pairs used on the previous call; any newly held asset is
+        picked up with one follow-up ticker request.
+
+        Returns:
+            Same dict as get_account_balance()
+        """
+        try:
+            exchange = self._get_async_exchange()
+            markets = await self._call_async(exchange.load_markets)
+
+            def fetch_tickers(missing):
+                return self._call_async(exchange.fetch_tickers, missing)
+
+            balance, tickers = await asyncio.gather(
+                self._call_async(exchange.fetch_balance),
+                self.price_cache.get_many_async(self._held_symbols, fetch_tickers),
+            )
+
+            symbols = self._usd_symbols(self._held_currencies(balance), markets)
+            missing = [s for s in symbols if s not in tickers]
+            if missing:
+                tickers.update(
+                    await self.price_cache.get_many_async(missing, fetch_tickers)
+                )
+            self._held_symbols = symbols
+
+            return self._build_balance(balance, tickers)
+
+        except Exception as e:
+            raise Exception(f"Failed to fetch Kraken balance: {str(e)}")
+
+    async def close_async(self):
+        """Close the async exchange session, if one was opened"""
+        if self._async_exchange is not None:
+            await self._async_exchange.close()
+            self._async_exchange = None
+
     def get_trades(self, symbol: str = None, since: int = None, limit: int = 100):
         """
         Fetch historical trades from Kraken
@@ -278,6 +452,60 @@ class KrakenConnector:
         except Exception as e:
             raise Exception(f"Failed to fetch Kraken trades: {str(e)}")
 
+    def fetch_trades_page(self, since: int = None, end: int = None, offset: int = 0):
+        """
+        Fetch a single page of trade history from Kraken
+
+        Kraken returns at most TRADE_PAGE_SIZE trades per call, newest first.
+        Pinning `end` for the duration of a sync keeps offsets stable even if
+        new fills arrive while paging.
+
+        Args:
+            since: Lower bound timestamp in milliseconds (exclusive). None for full history.
+            end: Upper bound as a unix timestamp in seconds. None for now.
+            offset: Number of trades to skip within the [since, end] window
+
+        Returns:
+            List of ccxt trade dictionaries (at most TRADE_PAGE_SIZE)
+        """
+        params = {"ofs": offset}
+        if end is not None:
+            params["end"] = end
+
+        try:
+            return self._call(self.exchange.fetch_my_trades, since=since, params=params)
+        except Exception as e:
+            raise Exception(
+                f"Failed to fetch Kraken trades page (offset {offset}): {str(e)}"
+            )
+
+    def fetch_ledger_page(self, since: int = None, end: int = None, offset: int = 0):
+        """
+        Fetch a single page of ledger entries (deposits, withdrawals, transfers,
+        trade legs, staking, ...) from Kraken
+
+        Paged like fetch_trades_page: newest first, at most LEDGER_PAGE_SIZE
+        entries per call, with `end` pinned for the duration of a sync.
+
+        Args:
+            since: Lower bound timestamp in milliseconds (exclusive). None for full history.
+            end: Upper bound as a unix timestamp in seconds. None for now.
+            offset: Number of entries to skip within the [since, end] window
+
+        Returns:
+            List of ccxt ledger entry dictionaries (at most LEDGER_PAGE_SIZE)
+        """
+        params = {"ofs": offset}
+        if end is not None:
+            params["end"] = end
+
+        try:
+            return self._call(self.exchange.fetch_ledger, since=since, params=params)
+        except Exception as e:
+            raise Exception(
+                f"Failed to fetch Kraken ledger page (offset {offset}): {str(e)}"
+            )
+
     def print_trades(self, trades: list, detailed: bool = False):
         """
         Pretty print trades to console
@@ -364,9 +592,9 @@ class KrakenConnector:
 
 # For Testing Purposes
 if __name__ == "__main__":
-    from config import KRAKEN_API_KEY, KRAKEN_API_SECRET
-    from pprint import pprint
+    from main import create_connector
 
-    client = KrakenConnector(api_key=KRAKEN_API_KEY, api_secret=KRAKEN_API_SECRET)
+    # Honours FAKE_KRAKEN, so this runs offline against the stand-in too
+    client = create_connector()
     trades = client.get_trades()
     client.print_trades(trades)
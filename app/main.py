@@ -92,118 +92,489 @@
 # if __name__ == "__main__":
 #     run_daily_snapshot()
 
+import json
 import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from typing import Callable
 from config import DATABASE_URL, KRAKEN_API_KEY, KRAKEN_API_SECRET, ACCOUNT_ID
 from kraken import KrakenConnector
 from database import Database
 from decimal import Decimal
+from pnl import latest_prices, update_pnl
+from price_cache import default_cache
 import config as cfg
+import metrics
+import profiling
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def calculate_and_save_return(db: Database, current_snapshot: dict):
+def calculate_and_save_return(db: Database, current_snapshot: dict, since: date = None):
     """
-    Calculate and save daily return based on current and previous snapshots
+    Calculate and save the flow-adjusted daily return for a snapshot just saved
+
+    Returns are rebuilt by Database.recompute_returns in one set-based pass,
+    net of ledger deposits/withdrawals between snapshots.
 
     Args:
         db: Database instance
         current_snapshot: The snapshot just saved
+        since: Optional earlier date to rebuild from (e.g. the oldest newly
+            synced ledger flow), so older returns pick up late flows
     """
     exchange = current_snapshot["exchange"]
     account_id = current_snapshot["account_id"]
     current_date = current_snapshot["timestamp"].date()
-    current_balance = Decimal(str(current_snapshot["total_balance_usd"]))
+    start_date = min(since, current_date) if since else current_date
 
-    # Get previous snapshot
-    previous_snapshot = db.get_previous_balance(exchange, account_id, current_date)
+    db.recompute_returns(exchange, account_id, start_date, current_date)
 
-    if not previous_snapshot:
+    latest = db.get_latest_return(exchange, account_id)
+    if not latest or latest["return_date"] != current_date:
         logger.info(
             "No previous snapshot found - skipping return calculation (first day)"
         )
         return
 
-    previous_balance = Decimal(str(previous_snapshot["total_balance_usd"]))
-    previous_date = previous_snapshot["snapshot_date"]
+    flow = Decimal(str(latest["net_flow_usd"]))
+    logger.info(
+        f"Return calculated: ${latest['daily_return_usd']:,.2f} "
+        f"({latest['daily_return_pct']:.2f}%) vs {latest['previous_date']}"
+        + (f", net of ${flow:,.2f} deposits/withdrawals" if flow else "")
+    )
 
-    # Calculate returns
-    daily_return_usd = current_balance - previous_balance
 
-    # Avoid division by zero
-    if previous_balance == 0:
-        logger.warning("Previous balance is zero - cannot calculate percentage return")
-        daily_return_pct = Decimal("0")
+def _sync_pages(
+    db: Database,
+    account_id: str,
+    stream: str,
+    fetch_page: Callable,
+    save_page: Callable,
+    since,
+    page_size: int,
+    max_pages: int = None,
+) -> dict:
+    """
+    Page through a newest-first Kraken history endpoint, saving each page
+
+    The cursor is checkpointed after every saved page, so an interrupted
+    backfill resumes from the last saved offset instead of page one.
+
+    Args:
+        db: Database instance
+        account_id: Account identifier
+        stream: sync_checkpoints stream name (e.g. 'trades', 'ledger')
+        fetch_page: fetch_page(since=, end=, offset=) -> list of rows
+        save_page: save_page(rows) -> number of rows inserted
+        since: Callable returning the newest stored timestamp in ms (or None),
+            only called when no backfill is in progress
+        page_size: Rows per full page; a shorter page ends the sync
+        max_pages: Optional cap on pages fetched this run (remaining pages resume next run)
+
+    Returns:
+        Dict with pages, rows, inserted, elapsed and complete flag
+    """
+    exchange = "kraken"
+    cursor = db.get_sync_checkpoint(exchange, account_id, stream)
+
+    if cursor:
+        logger.info(
+            f"Resuming {stream} sync at offset {cursor['offset']} "
+            f"({cursor['pages']} pages already saved)"
+        )
     else:
-        daily_return_pct = (daily_return_usd / previous_balance) * Decimal("100")
-
-    # Prepare return data
-    return_data = {
-        "exchange": exchange,
-        "account_id": account_id,
-        "return_date": current_date,
-        "previous_date": previous_date,
-        "current_balance_usd": float(current_balance),
-        "previous_balance_usd": float(previous_balance),
-        "daily_return_usd": float(daily_return_usd),
-        "daily_return_pct": float(daily_return_pct),
-        "timestamp": current_snapshot["timestamp"],
-    }
-
-    # Save to database
-    db.save_daily_return(return_data)
+        start = since()
+        if start:
+            logger.info(f"Fetching {stream} since timestamp: {start}")
+        else:
+            logger.info(f"First {stream} pull - fetching full history")
+        cursor = {
+            "since": start,
+            "end": int(time.time()),
+            "offset": 0,
+            "pages": 0,
+            "rows": 0,
+        }
+
+    stats = {"pages": 0, "rows": 0, "inserted": 0, "complete": False}
+    started = time.perf_counter()
+
+    while max_pages is None or stats["pages"] < max_pages:
+        page_started = time.perf_counter()
+        page = fetch_page(
+            since=cursor["since"], end=cursor["end"], offset=cursor["offset"]
+        )
+        fetched = time.perf_counter()
+        inserted = save_page(page) if page else 0
+        saved = time.perf_counter()
 
-    logger.info(
-        f"Return calculated: ${daily_return_usd:,.2f} ({daily_return_pct:.2f}%) "
-        f"vs {previous_date}"
+        cursor["offset"] += len(page)
+        cursor["pages"] += 1
+        cursor["rows"] += len(page)
+        stats["pages"] += 1
+        stats["rows"] += len(page)
+        stats["inserted"] += inserted
+
+        logger.info(
+            f"{stream.capitalize()} page {cursor['pages']}: {len(page)} rows, "
+            f"{inserted} new (fetch {fetched - page_started:.2f}s, "
+            f"save {saved - fetched:.2f}s)"
+        )
+
+        if len(page) < page_size:
+            stats["complete"] = True
+            break
+
+        db.save_sync_checkpoint(exchange, account_id, stream, cursor)
+
+    if stats["complete"]:
+        db.clear_sync_checkpoint(exchange, account_id, stream)
+
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def sync_trades(
+    db: Database, connector: KrakenConnector, account_id: str, max_pages: int = None
+) -> dict:
+    """
+    Page through Kraken trade history and save each page as it arrives
+
+    Args:
+        db: Database instance
+        connector: KrakenConnector for the account
+        account_id: Account identifier
+        max_pages: Optional cap on pages fetched this run (remaining pages resume next run)
+
+    Returns:
+        Dict with pages, rows, inserted, elapsed and complete flag
+    """
+    return _sync_pages(
+        db,
+        account_id,
+        "trades",
+        connector.fetch_trades_page,
+        lambda page: db.save_trades(page, "kraken", account_id),
+        lambda: db.get_latest_trade_timestamp("kraken", account_id),
+        connector.TRADE_PAGE_SIZE,
+        max_pages,
     )
 
 
-def run_daily_snapshot():
+def sync_ledger(
+    db: Database, connector: KrakenConnector, account_id: str, max_pages: int = None
+) -> dict:
+    """
+    Page through the Kraken ledger (deposits, withdrawals, transfers, ...)
+    and save each page as it arrives, checkpointed like sync_trades
+
+    Returns:
+        Dict with pages, rows, inserted, elapsed and complete flag
+    """
+    return _sync_pages(
+        db,
+        account_id,
+        "ledger",
+        connector.fetch_ledger_page,
+        lambda page: db.save_ledger_entries(page, "kraken", account_id),
+        lambda: db.get_latest_ledger_timestamp("kraken", account_id),
+        connector.LEDGER_PAGE_SIZE,
+        max_pages,
+    )
+
+
+def create_database() -> Database:
+    """Create a pooled Database using the configured pool size"""
+    return Database(
+        DATABASE_URL,
+        cfg.DB_POOL_MIN,
+        cfg.DB_POOL_MAX,
+        cfg.RAW_PAYLOAD_MODE,
+        cfg.DB_PARTITIONING,
+    )
+
+
+def create_connector(account: dict = None) -> KrakenConnector:
+    """
+    Create a KrakenConnector for a registry account
+
+    With FAKE_KRAKEN set, the connector talks to a fake_kraken.FakeKraken
+    seeded from the account's API key instead of the real API.
+
+    Args:
+        account: Entry from config.load_accounts(). Defaults to the main account.
+    """
+    if account is None:
+        if not KRAKEN_API_KEY and cfg.FAKE_KRAKEN:
+            account = cfg.load_accounts()[0]
+        else:
+            account = {
+                "account_id": cfg.get_account_id(KRAKEN_API_KEY, ACCOUNT_ID),
+                "api_key": KRAKEN_API_KEY,
+                "api_secret": KRAKEN_API_SECRET,
+            }
+    exchange = None
+    if cfg.FAKE_KRAKEN:
+        from fake_kraken import FakeKraken
+
+        exchange = FakeKraken.from_spec(cfg.FAKE_KRAKEN, account["api_key"])
+    return KrakenConnector(
+        account["api_key"],
+        account["api_secret"],
+        account["account_id"],
+        exchange=exchange,
+    )
+
+
+@profiling.profiled("snapshot")
+def run_daily_snapshot(
+    db: Database = None,
+    connector: KrakenConnector = None,
+    balance: dict = None,
+    progress: Callable[[str], None] = None,
+):
+    """
+    Fetch balance, save snapshot and returns, then sync trades
+
+    Args:
+        db: Optional shared Database (e.g. the bot's pooled instance).
+            A new pooled Database is created when omitted.
+        connector: Optional warm KrakenConnector for the main account
+        balance: Optional balance already fetched (e.g. via get_account_balance_async)
+        progress: Optional callback receiving short status messages per stage
+    """
+    progress = progress or (lambda text: None)
     logger.info("Starting daily Kraken balance snapshot...")
-    account_id = cfg.get_account_id(KRAKEN_API_KEY, ACCOUNT_ID)
-    connector = KrakenConnector(KRAKEN_API_KEY, KRAKEN_API_SECRET, account_id)
+    connector = connector or create_connector()
+    account_id = connector.account_id
 
     try:
         # Fetch and save balance
-        balance = connector.get_account_balance()
-        db = Database(DATABASE_URL)
+        balance = balance or connector.get_account_balance()
+        db = db or create_database()
 
-        # Ensure tables exist
-        db.create_returns_table()
-        db.create_trades_table()
+        # Ensure tables exist (first snapshot on this Database only)
+        db.ensure_snapshot_schema()
 
         # Save balance snapshot
         db.save_balance_snapshot(balance)
         logger.info(f"SUCCESS: Saved balance ${balance['total_balance_usd']:,.2f}")
+        progress(f"Balance saved: ${balance['total_balance_usd']:,.2f}")
 
-        # Calculate and save daily return
-        calculate_and_save_return(db, balance)
+        # Sync deposits/withdrawals so the return excludes them
+        progress("Syncing ledger...")
+        ledger = sync_ledger(
+            db, connector, account_id, max_pages=cfg.TRADE_SYNC_MAX_PAGES
+        )
+        flows_since = db.value_ledger_flows("kraken", account_id)
+        logger.info(
+            f"Ledger sync {'complete' if ledger['complete'] else 'paused'}: "
+            f"{ledger['inserted']} new entries"
+        )
+
+        # Calculate and save daily return (and any earlier ones a new flow touches)
+        calculate_and_save_return(db, balance, since=flows_since)
 
         # Fetch and save trades
         logger.info("Fetching trades...")
-        latest_trade_ts = db.get_latest_trade_timestamp("kraken", account_id)
-
-        if latest_trade_ts:
-            logger.info(f"Fetching trades since timestamp: {latest_trade_ts}")
-            # Fetch only new trades since last saved trade
-            trades = connector.get_trades(since=latest_trade_ts, limit=500)
-        else:
-            logger.info("First trade pull - fetching all available trades")
-            # First pull - get all trades (use reasonable limit)
-            trades = connector.get_trades(limit=1000)
+        progress("Syncing trades...")
+        sync = sync_trades(
+            db, connector, account_id, max_pages=cfg.TRADE_SYNC_MAX_PAGES
+        )
+        status = "complete" if sync["complete"] else "paused, will resume next run"
+        logger.info(
+            f"Trade sync {status}: {sync['inserted']} new trades saved "
+            f"({sync['rows']} rows over {sync['pages']} pages in {sync['elapsed']:.1f}s)"
+        )
+        progress(f"Trade sync {status}: {sync['inserted']} new trades")
 
-        if trades:
-            new_trades_count = db.save_trades(trades, "kraken", account_id)
-            logger.info(f"Trade sync complete: {new_trades_count} new trades saved")
-        else:
-            logger.info("No new trades found")
+        # Match the new trades against the checkpointed cost-basis lots
+        engine = update_pnl(db, "kraken", account_id, cfg.COST_BASIS_METHOD)
+        report = engine.report(latest_prices(db, "kraken", account_id))
+        realized = sum(r["realized"] or 0 for r in report)
+        unrealized = sum(r["unrealized"] or 0 for r in report)
+        logger.info(
+            f"PnL ({engine.method}, {engine.count} trades): "
+            f"realized ${realized:,.2f}, unrealized ${unrealized:,.2f}"
+        )
 
     except Exception as e:
         logger.error(f"FAILED: {e}")
         raise
 
 
+def run_intraday_snapshot(
+    db: Database, connector: KrakenConnector, interval_seconds: int = None
+):
+    """
+    Record an intraday balance sample and refresh today's daily rollup
+
+    Trades are not synced here; the daily run keeps doing that.
+
+    Args:
+        db: Database instance
+        connector: KrakenConnector for the account
+        interval_seconds: Sampling interval (default: INTRADAY_INTERVAL_MINUTES)
+    """
+    interval_seconds = interval_seconds or cfg.INTRADAY_INTERVAL_MINUTES * 60
+    if not interval_seconds:
+        raise ValueError("Intraday mode needs INTRADAY_INTERVAL_MINUTES > 0")
+
+    balance = connector.get_account_balance()
+    db.save_intraday_snapshot(balance, interval_seconds)
+
+    today = balance["timestamp"].date()
+    db.rollup_daily_snapshots(
+        balance["exchange"], balance["account_id"], start_date=today, end_date=today
+    )
+    calculate_and_save_return(db, balance)
+    logger.info(
+        f"Intraday sample for {balance['account_id']}: "
+        f"${balance['total_balance_usd']:,.2f}"
+    )
+
+
+def _snapshot_key_group(
+    db: Database, accounts: list, run=None, connectors: dict = None
+) -> list:
+    """Snapshot accounts sharing one API key sequentially on one connector"""
+    run = run or run_daily_snapshot
+    results = []
+    connector = connectors.get(accounts[0]["api_key"]) if connectors else None
+    for account in accounts:
+        started = time.perf_counter()
+        result = {"account_id": account["account_id"], "status": "success"}
+        try:
+            if connector is None:
+                connector = create_connector(account)
+                if connectors is not None:
+                    connectors[account["api_key"]] = connector
+            connector.account_id = account["account_id"]
+            run(db, connector)
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["latency"] = time.perf_counter() - started
+        results.append(result)
+    return results
+
+
+def run_all_snapshots(
+    db: Database = None,
+    accounts: list = None,
+    max_workers: int = None,
+    intraday: bool = False,
+    connectors: dict = None,
+) -> list:
+    """
+    Snapshot every registered account concurrently
+
+    Each API key gets its own KrakenConnector (and so its own ccxt rate
+    limiter and nonce sequence); accounts that share a key run one after
+    another in the same worker so they never race on nonces.
+
+    Args:
+        db: Optional shared Database. A new pooled Database is created when omitted.
+        accounts: Accounts to snapshot (default: config.load_accounts())
+        max_workers: Worker pool size (default: SNAPSHOT_WORKERS)
+        intraday: Record intraday samples (run_intraday_snapshot) instead of
+            the full daily snapshot, then compact old samples
+        connectors: Optional {api_key: KrakenConnector} kept by a long-running
+            caller, so later runs reuse warm clients and loaded markets
+
+    Returns:
+        List of per-account dicts with account_id, status, latency and error
+    """
+    db = db or create_database()
+    accounts = cfg.load_accounts() if accounts is None else accounts
+    max_workers = max_workers or cfg.SNAPSHOT_WORKERS
+
+    # Upcoming partitions and retention, once per run rather than per account
+    maintenance = db.maintain_partitions(
+        {
+            "trades": cfg.TRADES_RETENTION_MONTHS,
+            "balance_snapshots": cfg.SNAPSHOTS_RETENTION_MONTHS,
+        },
+        archive=cfg.RETENTION_ARCHIVE,
+        months_ahead=cfg.PARTITION_PREMAKE_MONTHS,
+    )
+    if any(maintenance["created"].values()) or any(maintenance["retired"].values()):
+        logger.info(f"Partition maintenance: {maintenance}")
+
+    run = run_daily_snapshot
+    if intraday:
+        db.ensure_snapshot_schema(intraday=True)
+        run = run_intraday_snapshot
+
+    groups = {}
+    for account in accounts:
+        groups.setdefault(account["api_key"], []).append(account)
+
+    logger.info(
+        f"Snapshotting {len(accounts)} accounts "
+        f"({len(groups)} API keys, {max_workers} workers)"
+    )
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_snapshot_key_group, db, group, run, connectors)
+            for group in groups.values()
+        ]
+        for future in as_completed(futures):
+            results.extend(future.result())
+
+    results.sort(key=lambda r: r["account_id"])
+    if intraday:
+        db.compact_intraday_snapshots(
+            cfg.parse_compaction_rules(cfg.INTRADAY_COMPACTION),
+            cfg.INTRADAY_RETENTION_DAYS,
+        )
+    logger.info(
+        f"Snapshot run finished in {time.perf_counter() - started:.1f}s\n"
+        + format_snapshot_summary(results)
+    )
+    return results
+
+
+def format_snapshot_summary(results: list) -> str:
+    """Render per-account snapshot results as a fixed-width table"""
+    lines = [f"{'Account':<20} {'Status':<8} {'Latency':>9}  Error"]
+    for r in results:
+        lines.append(
+            f"{r['account_id']:<20} {r['status']:<8} {r['latency']:>8.1f}s  "
+            f"{r.get('error', '')}"
+        )
+    failed = sum(1 for r in results if r["status"] != "success")
+    lines.append(f"{len(results) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
+
+
+def log_metrics_summary(path: str = None):
+    """Log this run's metrics as one JSON line (and write them to path)"""
+    summary = json.dumps(metrics.registry.summary(), default=str)
+    logger.info(f"Run metrics: {summary}")
+    if path:
+        with open(path, "w") as f:
+            f.write(summary + "\n")
+
+
 if __name__ == "__main__":
-    run_daily_snapshot()
+    if "--profile" in sys.argv:
+        profiling.enable()
+    metrics.instrument_app()
+    database = create_database()
+    metrics.registry.add_collector("db_pool", database.pool_stats)
+    metrics.registry.add_collector("price_cache", default_cache().get_stats)
+    try:
+        summary = run_all_snapshots(database, intraday="--intraday" in sys.argv)
+        if any(r["status"] != "success" for r in summary):
+            raise SystemExit(1)
+    finally:
+        logger.info(f"DB pool stats: {database.pool_stats()}")
+        log_metrics_summary(cfg.METRICS_SUMMARY_FILE)
+        database.close()
@@ -0,0 +1,318 @@
+"""Process-wide latency/counter metrics with Prometheus text exposition"""
+
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Methods never wrapped: context managers and long-running loops would be
+# timed wrong (get_connection only builds its generator, listen_writes blocks)
+SKIP_METHODS = {"get_connection", "listen_writes", "close"}
+
+# Integer results of these methods are counted as rows written
+ROW_PREFIXES = ("save_", "rollup_", "migrate_")
+
+HELP = {
+    "kraken_call_seconds": "Latency of instrumented KrakenConnector/Database methods",
+    "kraken_call_errors_total": "Exceptions raised by instrumented methods",
+    "kraken_api_errors_total": "Failed Kraken API calls by error type (retries included)",
+    "kraken_rows_written_total": "Rows written by Database save/rollup/migrate methods",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and latency histograms
+
+    Pool and cache stats are not copied in; collectors registered with
+    add_collector() are read at render time and exposed as gauges.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        # (name, labels) -> [bucket counts..., sum, count, max]
+        self.histograms = {}
+        self.collectors = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * len(self.buckets) + [0.0, 0, 0.0]
+            if slot < len(self.buckets):
+                hist[slot] += 1
+            hist[-3] += seconds
+            hist[-2] += 1
+            hist[-1] = max(hist[-1], seconds)
+
+    def add_collector(self, name: str, collect):
+        """
+        Expose a stats dict (e.g. Database.pool_stats) as gauges
+
+        Args:
+            name: Prefix of the gauges, e.g. "db_pool" -> kraken_db_pool_<key>
+            collect: Callable returning {key: number} or None
+        """
+        with self._lock:
+            self.collectors[name] = collect
+
+    def _collected(self) -> dict:
+        with self._lock:
+            collectors = list(self.collectors.items())
+        gauges = {}
+        for name, collect in collectors:
+            try:
+                stats = collect() or {}
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    gauges[f"kraken_{name}_{key}"] = value
+        return gauges
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+
+        lines = []
+        seen = set()
+
+        def header(name: str, kind: str):
+            if name not in seen:
+                seen.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for (name, key), hist in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}"
+                )
+            lines.append(
+                f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {hist[-2]}"
+            )
+            lines.append(f"{name}_sum{_format_labels(key)} {hist[-3]}")
+            lines.append(f"{name}_count{_format_labels(key)} {hist[-2]}")
+
+        for name, value in sorted(self._collected().items()):
+            header(name, "gauge")
+            lines.append(f"{name} {value}")
+
+        header("kraken_process_uptime_seconds", "gauge")
+        lines.append(f"kraken_process_uptime_seconds {time.time() - self.started:.1f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """JSON-friendly snapshot: counters, per-method latency and gauges"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+
+        def label(name: str, key: tuple) -> str:
+            values = ",".join(f"{k}={v}" for k, v in key)
+            return f"{name}{{{values}}}" if values else name
+
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "counters": {label(*k): v for k, v in sorted(counters.items())},
+            "latency": {
+                label(*k): {
+                    "count": h[-2],
+                    "total_s": round(h[-3], 4),
+                    "mean_ms": round(h[-3] / h[-2] * 1000, 3) if h[-2] else 0.0,
+                    "max_ms": round(h[-1] * 1000, 3),
+                }
+                for k, h in sorted(histograms.items())
+            },
+            "gauges": self._collected(),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+
+registry = Metrics()
+
+
+def inc(name: str, value: float = 1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def _record(component: str, method: str, started: float, result=None, error=None):
+    registry.observe(
+        "kraken_call_seconds",
+        time.perf_counter() - started,
+        component=component,
+        method=method,
+    )
+    if error is not None:
+        registry.inc(
+            "kraken_call_errors_total",
+            component=component,
+            method=method,
+            error=type(error).__name__,
+        )
+    elif (
+        method.startswith(ROW_PREFIXES)
+        and isinstance(result, int)
+        and not isinstance(result, bool)
+    ):
+        registry.inc("kraken_rows_written_total", result, method=method)
+
+
+def _timed(component: str, name: str, method):
+    if inspect.isgeneratorfunction(method):
+        # Streams (iter_trades, iter_export) do their work while being iterated,
+        # so time the whole iteration, consumer included, not the call
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from method(*args, **kwargs)
+            except GeneratorExit:
+                _record(component, name, started)
+                raise
+            except Exception as e:
+                _record(component, name, started, error=e)
+                raise
+            _record(component, name, started)
+
+        return generator_wrapper
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception as e:
+                _record(component, name, started, error=e)
+                raise
+            _record(component, name, started, result)
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            _record(component, name, started, error=e)
+            raise
+        _record(component, name, started, result)
+        return result
+
+    return wrapper
+
+
+def instrument(cls, component: str):
+    """
+    Time every public method of cls in place
+
+    Each call lands in kraken_call_seconds{component, method}; exceptions
+    are counted by type and re-raised. Generator methods are timed from the
+    call until the generator is exhausted or closed. Static methods and
+    SKIP_METHODS are left alone. Instrumenting a class twice is a no-op.
+    """
+    if getattr(cls, "_metrics_instrumented", False):
+        return cls
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or name in SKIP_METHODS:
+            continue
+        if not inspect.isfunction(attr):
+            continue
+        setattr(cls, name, _timed(component, name, attr))
+    cls._metrics_instrumented = True
+    return cls
+
+
+def instrument_app():
+    """Instrument KrakenConnector and Database"""
+    from database import Database
+    from kraken import KrakenConnector
+
+    instrument(KrakenConnector, "kraken")
+    instrument(Database, "database")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            body = registry.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(registry.summary(), default=str).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics {self.address_string()} {format % args}")
+
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics (and /metrics.json) from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
@@ -0,0 +1,456 @@
+"""Cost-basis lot matching and realized/unrealized PnL over stored trades"""
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from valuation import ConversionGraph, clean_currency
+
+METHODS = ("fifo", "lifo", "average")
+
+# Lots smaller than this are treated as fully consumed (float rounding dust)
+DUST = 1e-12
+
+# Spent FIFO lots are cut off the front of the arrays once this many pile up
+COMPACT_AFTER = 256
+
+# Trades fetched per server-side cursor batch while catching up
+TRADE_BATCH_SIZE = 5000
+
+# Checkpoints of another layout are discarded and the trades replayed
+STATE_VERSION = 2
+
+# Cash currencies valued 1:1 in USD (KrakenConnector.USD_EQUIVALENTS without
+# the balance suffixes); they carry no lots
+USD_ROOTS = frozenset({"USD", "ZUSD", "USDT", "USDC"})
+
+# Trade prices older than this (seconds) no longer value other currencies
+RATE_MAX_AGE = 7 * 86400
+
+
+class LotQueue:
+    """
+    Open lots of one position as two parallel float arrays
+
+    FIFO consumes from a head offset (spent lots are sliced off in bulk),
+    LIFO pops from the tail and average cost keeps a single merged lot, so
+    matching a sale never shifts the arrays element by element.
+    """
+
+    __slots__ = ("method", "amounts", "prices", "head")
+
+    def __init__(self, method: str, amounts=(), prices=()):
+        self.method = method
+        self.amounts = array("d", amounts)
+        self.prices = array("d", prices)
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.amounts) - self.head
+
+    def add(self, amount: float, price: float):
+        """Open a lot of amount units at a unit cost of price"""
+        if self.method == "average" and len(self):
+            held = self.amounts[-1]
+            self.prices[-1] = (held * self.prices[-1] + amount * price) / (
+                held + amount
+            )
+            self.amounts[-1] = held + amount
+            return
+        self.amounts.append(amount)
+        self.prices.append(price)
+
+    def remove(self, amount: float):
+        """
+        Consume up to amount units in method order
+
+        Returns:
+            (matched amount, cost basis of the matched units). matched is
+            short of amount when the sale exceeds the open lots.
+        """
+        lifo = self.method == "lifo"
+        matched = basis = 0.0
+        while amount > DUST and len(self):
+            i = len(self.amounts) - 1 if lifo else self.head
+            take = min(amount, self.amounts[i])
+            matched += take
+            basis += take * self.prices[i]
+            amount -= take
+            left = self.amounts[i] - take
+            if left > DUST:
+                self.amounts[i] = left
+            elif lifo:
+                self.amounts.pop()
+                self.prices.pop()
+            else:
+                self.head += 1
+
+        if self.head >= COMPACT_AFTER or (self.head and not len(self)):
+            del self.amounts[: self.head]
+            del self.prices[: self.head]
+            self.head = 0
+        return matched, basis
+
+    def totals(self):
+        """(open amount, open cost basis)"""
+        amount = cost = 0.0
+        for i in range(self.head, len(self.amounts)):
+            amount += self.amounts[i]
+            cost += self.amounts[i] * self.prices[i]
+        return amount, cost
+
+    def to_state(self) -> list:
+        return [list(self.amounts[self.head :]), list(self.prices[self.head :])]
+
+
+class Position:
+    """Lots and running PnL of one asset, in USD"""
+
+    __slots__ = ("lots", "realized", "fees", "unmatched", "trades")
+
+    def __init__(self, method: str, state: dict = None):
+        state = state or {}
+        self.lots = LotQueue(method, *state.get("lots", ((), ())))
+        self.realized = state.get("realized", 0.0)
+        self.fees = state.get("fees", 0.0)
+        self.unmatched = state.get("unmatched", 0.0)
+        self.trades = state.get("trades", 0)
+
+    def to_state(self) -> dict:
+        return {
+            "lots": self.lots.to_state(),
+            "realized": self.realized,
+            "fees": self.fees,
+            "unmatched": self.unmatched,
+            "trades": self.trades,
+        }
+
+
+class HoldingsPrices:
+    """
+    USD price of an asset on a past date, from the account's snapshot holdings
+
+    Used when no recent trade prices a currency. Each asset's history is
+    loaded once; the price of the last snapshot on or before the date is
+    used, else the first one after it.
+    """
+
+    def __init__(self, db, exchange: str, account_id: str):
+        self.db = db
+        self.exchange = exchange
+        self.account_id = account_id
+        self._history = {}
+
+    def __call__(self, currency: str, day):
+        history = self._history.get(currency)
+        if history is None:
+            rows = self.db.get_asset_history(
+                currency, self.exchange, self.account_id, limit=100000
+            )
+            history = self._history[currency] = sorted(
+                (r["snapshot_date"], float(r["price"]))
+                for r in rows
+                if r["price"] is not None
+            )
+        if not history:
+            return None
+        i = bisect_right(history, (day, float("inf")))
+        return history[i - 1][1] if i else history[0][1]
+
+
+class CostBasisEngine:
+    """
+    Streaming lot matcher over trades in (trade_timestamp, id) order
+
+    Every trade moves two assets: buying BTC/EUR acquires BTC and disposes
+    of EUR, selling it does the reverse. Each non-USD asset is one position
+    whatever market it traded on, so BTC bought on BTC/USD and sold on
+    BTC/EUR match. Legs are valued in USD at trade time: the quote's rate
+    comes from recent trade prices through a ConversionGraph, else from
+    the snapshot holdings price of that day (historical_price). Fees are
+    added to the acquired lot's cost or taken off the disposal's proceeds.
+
+    Disposals beyond the open lots, e.g. of coins bought before the trade
+    history starts, have no known basis: they are counted as unmatched and
+    realize nothing. Trades whose quote has no USD rate at all are skipped
+    and counted as unpriced.
+
+    The whole state round-trips through to_state(), so a checkpointed
+    engine resumes after the last trade it applied.
+    """
+
+    def __init__(self, method: str = "fifo", state: dict = None, historical_price=None):
+        """
+        Args:
+            method: One of METHODS
+            state: Checkpointed to_state() output (ignored if from another
+                method or state version)
+            historical_price: Optional callable (currency, date) -> USD price
+                or None, e.g. HoldingsPrices
+        """
+        if method not in METHODS:
+            raise ValueError(
+                f"Unknown cost basis method {method!r} (use {', '.join(METHODS)})"
+            )
+        if not (
+            state
+            and state.get("method") == method
+            and state.get("version") == STATE_VERSION
+        ):
+            state = {}
+        self.method = method
+        self.historical_price = historical_price
+        self.positions = {
+            asset: Position(method, position)
+            for asset, position in state.get("positions", {}).items()
+        }
+        # Last trade price per market as [price, epoch seconds], for rates
+        self.market_prices = state.get("market_prices", {})
+        self.unpriced = state.get("unpriced", 0)
+        # Keyset of the last applied trade and the highest trade id seen
+        self.last = state.get("last")
+        self.max_id = state.get("max_id", 0)
+        self.count = state.get("count", 0)
+        self._graph = None
+
+    def _position(self, asset: str) -> Position:
+        position = self.positions.get(asset)
+        if position is None:
+            position = self.positions[asset] = Position(self.method)
+        return position
+
+    def usd_rate(self, currency: str, when: datetime):
+        """USD value of one unit of currency at trade time, or None"""
+        if currency in USD_ROOTS:
+            return 1.0
+        if self._graph is None:
+            cutoff = when.timestamp() - RATE_MAX_AGE
+            self._graph = ConversionGraph(
+                {
+                    symbol: {"last": price}
+                    for symbol, (price, seen) in self.market_prices.items()
+                    if seen >= cutoff
+                },
+                USD_ROOTS,
+            )
+        rate = self._graph.rate(currency)
+        if rate is not None:
+            return float(rate)
+        if self.historical_price is not None:
+            return self.historical_price(currency, when.date())
+        return None
+
+    def _acquire(self, asset: str, amount: float, cost: float):
+        if asset not in USD_ROOTS and amount > DUST:
+            self._position(asset).lots.add(amount, cost / amount)
+
+    def _dispose(self, asset: str, amount: float, proceeds: float):
+        if asset in USD_ROOTS or amount <= DUST:
+            return
+        position = self._position(asset)
+        matched, basis = position.lots.remove(amount)
+        position.realized += proceeds * matched / amount - basis
+        position.unmatched += amount - matched
+
+    def apply(self, trade: dict):
+        """Apply one trade row (as read from the trades table)"""
+        symbol = trade["symbol"]
+        base, _, quote = symbol.partition("/")
+        base, quote = clean_currency(base), clean_currency(quote.split(":")[0])
+        amount = float(trade["amount"])
+        price = float(trade["price"])
+        cost = float(trade["cost"] or 0) or amount * price
+        fee = float(trade.get("fee_cost") or 0)
+        fee_currency = clean_currency(trade.get("fee_currency") or "")
+
+        when = trade["trade_timestamp"]
+        if isinstance(when, str):
+            when = datetime.fromisoformat(when)
+        if when.tzinfo is None:
+            # Trades are stored as naive UTC
+            when = when.replace(tzinfo=timezone.utc)
+
+        if price > 0:
+            self.market_prices[symbol] = [price, when.timestamp()]
+            self._graph = None
+
+        quote_rate = self.usd_rate(quote, when)
+        if quote_rate is None and cost:
+            # No route for the quote (nor, through this trade, for the base)
+            # in recent trades: the base's snapshot price may still value it
+            base_rate = self.usd_rate(base, when)
+            if base_rate is not None:
+                quote_rate = base_rate * amount / cost
+
+        if quote_rate is None:
+            self.unpriced += 1
+        else:
+            # Fees in base or quote change the units moved; others only cost
+            buy = trade["side"] == "buy"
+            base_amount, quote_amount, fee_usd, other_fee = amount, cost, 0.0, 0.0
+            if fee_currency == base:
+                base_amount += -fee if buy else fee
+                fee_usd = fee * price * quote_rate
+            elif fee_currency == quote:
+                quote_amount += fee if buy else -fee
+                fee_usd = fee * quote_rate
+            elif fee:
+                rate = self.usd_rate(fee_currency, when)
+                fee_usd = other_fee = fee * rate if rate is not None else 0.0
+            value = quote_amount * quote_rate
+
+            position = self._position(base)
+            position.trades += 1
+            position.fees += fee_usd
+            if buy:
+                self._acquire(base, base_amount, value + other_fee)
+                self._dispose(quote, quote_amount, value)
+            else:
+                self._dispose(base, base_amount, value - other_fee)
+                self._acquire(quote, quote_amount, value)
+
+        stamp = trade["trade_timestamp"]
+        if hasattr(stamp, "isoformat"):
+            stamp = stamp.isoformat()
+        self.last = [stamp, trade["id"]]
+        self.max_id = max(self.max_id, trade["id"])
+        self.count += 1
+
+    def to_state(self) -> dict:
+        return {
+            "version": STATE_VERSION,
+            "method": self.method,
+            "last": self.last,
+            "max_id": self.max_id,
+            "count": self.count,
+            "unpriced": self.unpriced,
+            "market_prices": self.market_prices,
+            "positions": {
+                asset: position.to_state()
+                for asset, position in sorted(self.positions.items())
+            },
+        }
+
+    def report(self, prices: dict) -> list:
+        """
+        Per-asset PnL in USD
+
+        Args:
+            prices: {asset: USD price}, e.g. from latest_prices()
+
+        Returns:
+            Dicts with asset, open_amount, avg_cost, cost_basis, market_value
+            (None when the asset has no price), realized, unrealized, fees,
+            unmatched and trades
+        """
+        prices = {k: float(v) for k, v in prices.items() if v}
+        rows = []
+        for asset, position in sorted(self.positions.items()):
+            amount, cost = position.lots.totals()
+            rate = prices.get(asset)
+            market_value = amount * rate if rate is not None else None
+            rows.append(
+                {
+                    "asset": asset,
+                    "open_amount": amount,
+                    "avg_cost": cost / amount if amount > DUST else None,
+                    "cost_basis": cost,
+                    "market_value": market_value,
+                    "realized": position.realized,
+                    "unrealized": (
+                        market_value - cost if market_value is not None else None
+                    ),
+                    "fees": position.fees,
+                    "unmatched": position.unmatched,
+                    "trades": position.trades,
+                }
+            )
+        return rows
+
+
+def latest_prices(db, exchange: str, account_id: str) -> dict:
+    """USD price per asset from the account's latest balance snapshot"""
+    latest = db.get_latest_balance(exchange, account_id)
+    if not latest:
+        return {}
+    prices = {}
+    for holding in db.get_holdings(latest["id"], latest["snapshot_date"]):
+        if holding["price"] is not None:
+            prices[clean_currency(holding["asset"])] = float(holding["price"])
+    return prices
+
+
+def update_pnl(
+    db,
+    exchange: str,
+    account_id: str,
+    method: str = "fifo",
+    rebuild: bool = False,
+    batch_size: int = TRADE_BATCH_SIZE,
+) -> CostBasisEngine:
+    """
+    Bring an account's cost-basis state up to date with its trades
+
+    The engine state is checkpointed in sync_checkpoints (stream
+    "pnl_<method>"), so a run only streams the trades stored since the last
+    one. A trade inserted behind the checkpoint (e.g. a late backfill)
+    changes every later match, so the history is then replayed.
+
+    Args:
+        db: Database instance
+        exchange: Exchange name
+        account_id: Account identifier
+        method: One of METHODS
+        rebuild: Ignore the checkpoint and replay all trades
+        batch_size: Trades per server-side cursor batch
+
+    Returns:
+        The updated CostBasisEngine
+    """
+    stream = f"pnl_{method}"
+    state = None if rebuild else db.get_sync_checkpoint(exchange, account_id, stream)
+    historical_price = HoldingsPrices(db, exchange, account_id)
+    engine = CostBasisEngine(method, state, historical_price)
+    if engine.last and db.has_trades_behind(
+        exchange, account_id, engine.last[0], engine.max_id
+    ):
+        engine = CostBasisEngine(method, historical_price=historical_price)
+
+    applied = engine.count
+    for batch in db.iter_trades(exchange, account_id, engine.last, batch_size):
+        for trade in batch:
+            engine.apply(trade)
+
+    if engine.count != applied or rebuild or engine.to_state() != state:
+        db.save_sync_checkpoint(exchange, account_id, stream, engine.to_state())
+    return engine
+
+
+def format_pnl(account_id: str, rows: list) -> str:
+    """Render a PnL report as a fixed-width text block"""
+
+    def money(value) -> str:
+        return "n/a" if value is None else f"${value:,.2f}"
+
+    lines = [
+        f"Account: {account_id}",
+        f"{'Asset':<12} {'Open':>14} {'Basis':>13} {'Value':>13} "
+        f"{'Realized':>13} {'Unrealized':>13}",
+    ]
+    totals = {"realized": 0.0, "unrealized": 0.0, "fees": 0.0}
+    for r in rows:
+        lines.append(
+            f"{r['asset']:<12} {r['open_amount']:>14,.6f} "
+            f"{money(r['cost_basis']):>13} {money(r['market_value']):>13} "
+            f"{money(r['realized']):>13} {money(r['unrealized']):>13}"
+        )
+        for key in totals:
+            totals[key] += r[key] or 0.0
+    lines.append(
+        f"Total realized {money(totals['realized'])}, unrealized "
+        f"{money(totals['unrealized'])}, fees {money(totals['fees'])}"
+    )
+    unmatched = [r["asset"] for r in rows if r["unmatched"] > DUST]
+    if unmatched:
+        lines.append(f"Sales without a known basis: {', '.join(unmatched)}")
+    return "\n".join(lines)
@@ -0,0 +1,239 @@
+"""Shared TTL price cache for ticker lookups"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import config
+
+
+class FilePriceStore:
+    """JSON file store so separate processes on one host share fetched prices"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get_prices(self, symbols: list, min_fetched_at: float) -> dict:
+        stored = self._read()
+        return {
+            s: stored[s]
+            for s in symbols
+            if s in stored and stored[s]["fetched_at"] >= min_fetched_at
+        }
+
+    def save_prices(self, prices: dict):
+        with self._lock:
+            stored = self._read()
+            stored.update(prices)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+
+
+class PostgresPriceStore:
+    """price_cache table store shared by every process using the database"""
+
+    def __init__(self, db):
+        self.db = db
+        self.db.create_price_cache_table()
+
+    def get_prices(self, symbols: list, min_fetched_at: float) -> dict:
+        return self.db.get_cached_prices(symbols, min_fetched_at)
+
+    def save_prices(self, prices: dict):
+        self.db.save_cached_prices(prices)
+
+
+class PriceCache:
+    """
+    In-process LRU of last prices with a TTL, optionally backed by a shared store
+
+    Entries look like tickers ({"last": price, "fetched_at": epoch seconds}),
+    so callers can use them wherever a ccxt ticker's "last" was used. Misses
+    are fetched in one call; concurrent callers wait for an in-flight fetch
+    and then read its result instead of fetching the same prices again
+    (threads on one lock, coroutines on a lock per event loop).
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 2048, store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        # asyncio.Lock is bound to the loop it is first used on
+        self._async_fetch_locks = weakref.WeakKeyDictionary()
+        # Bumped on every write so derived data (e.g. conversion graphs) can be memoized
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "store_hits": 0, "fetches": 0}
+
+    def _lookup(self, symbols: list, count: bool = True):
+        min_fetched_at = time.time() - self.ttl
+        found, missing = {}, []
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry and entry["fetched_at"] >= min_fetched_at:
+                    self._entries.move_to_end(symbol)
+                    found[symbol] = entry
+                else:
+                    missing.append(symbol)
+            if count:
+                self.stats["hits"] += len(found)
+                self.stats["misses"] += len(missing)
+        return found, missing
+
+    def _recheck(self, missing: list):
+        """Look missing up again after waiting for a fetch; found ones count as hits"""
+        refreshed, missing = self._lookup(missing, count=False)
+        with self._lock:
+            self.stats["hits"] += len(refreshed)
+            self.stats["misses"] -= len(refreshed)
+        return refreshed, missing
+
+    def _async_fetch_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            lock = self._async_fetch_locks.get(loop)
+            if lock is None:
+                lock = self._async_fetch_locks[loop] = asyncio.Lock()
+        return lock
+
+    def put(self, prices: dict):
+        """Add {symbol: {"last", "fetched_at"}} entries to the in-process cache"""
+        with self._lock:
+            for symbol, entry in prices.items():
+                self._entries[symbol] = entry
+                self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.generation += 1
+
+    def _from_store(self, missing: list) -> list:
+        if not self.store or not missing:
+            return missing
+        stored = self.store.get_prices(missing, time.time() - self.ttl)
+        if stored:
+            self.put(stored)
+            with self._lock:
+                self.stats["store_hits"] += len(stored)
+        return [s for s in missing if s not in stored]
+
+    def _store_tickers(self, tickers: dict) -> dict:
+        now = time.time()
+        prices = {
+            symbol: {"last": ticker["last"], "fetched_at": now}
+            for symbol, ticker in tickers.items()
+            if ticker.get("last") is not None
+        }
+        self.put(prices)
+        if self.store and prices:
+            self.store.save_prices(prices)
+        with self._lock:
+            self.stats["fetches"] += 1
+        return prices
+
+    def get_many(self, symbols: list, fetch_tickers) -> dict:
+        """
+        Return cached prices for symbols, fetching any that are missing or stale
+
+        Args:
+            symbols: Ticker symbols like 'BTC/USD'
+            fetch_tickers: Callable taking a list of symbols and returning ccxt tickers
+
+        Returns:
+            Dict of {symbol: {"last": price, "fetched_at": epoch seconds}}
+        """
+        found, missing = self._lookup(symbols)
+        if not missing:
+            return found
+
+        with self._fetch_lock:
+            # Another thread may have fetched these while we waited
+            refreshed, missing = self._recheck(missing)
+            found.update(refreshed)
+            missing = self._from_store(missing)
+            if missing:
+                found.update(self._store_tickers(fetch_tickers(missing)))
+
+        found.update(self._lookup([s for s in symbols if s not in found], False)[0])
+        return found
+
+    async def get_many_async(self, symbols: list, fetch_tickers) -> dict:
+        """
+        Async counterpart of get_many
+
+        Args:
+            symbols: Ticker symbols like 'BTC/USD'
+            fetch_tickers: Coroutine function taking a list of symbols
+
+        Returns:
+            Dict of {symbol: {"last": price, "fetched_at": epoch seconds}}
+        """
+        found, missing = self._lookup(symbols)
+        if not missing:
+            return found
+
+        async with self._async_fetch_lock():
+            # Another task may have fetched these while we waited
+            refreshed, missing = self._recheck(missing)
+            found.update(refreshed)
+            if missing and self.store:
+                missing = await asyncio.to_thread(self._from_store, missing)
+            if missing:
+                tickers = await fetch_tickers(missing)
+                if self.store:
+                    found.update(await asyncio.to_thread(self._store_tickers, tickers))
+                else:
+                    found.update(self._store_tickers(tickers))
+
+        found.update(self._lookup([s for s in symbols if s not in found], False)[0])
+        return found
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> PriceCache:
+    """
+    Process-wide PriceCache built from config
+
+    PRICE_CACHE_STORE selects the shared backing store: empty for in-process
+    only, "postgres" for the price_cache table, or "file:<path>".
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            store = None
+            if config.PRICE_CACHE_STORE == "postgres":
+                from database import Database
+
+                store = PostgresPriceStore(Database(config.DATABASE_URL))
+            elif config.PRICE_CACHE_STORE.startswith("file:"):
+                store = FilePriceStore(config.PRICE_CACHE_STORE[len("file:") :])
+            _default_cache = PriceCache(ttl=config.PRICE_CACHE_TTL, store=store)
+        return _default_cache
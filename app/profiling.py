@@ -0,0 +1,177 @@
+"""Opt-in cProfile capture of pulls, CLI commands and bot commands"""
+
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Profile files are named <started>_<name>_<duration>ms.prof, so listing runs
+# needs no index: e.g. 20240601-000512_pull_8421ms.prof
+FILE_PATTERN = re.compile(r"^(\d{8}-\d{6})_(.+)_(\d+)ms\.prof$")
+
+# Directory profiles are written to; None while profiling is off
+_directory = config.PROFILE_DIR or None
+
+# Profilers of one thread do not nest: an outer profile already covers the inner call
+_active = threading.local()
+
+
+def enable(directory: str = None):
+    """Turn profiling on for this process (directory defaults to PROFILE_DIR or profiles)"""
+    global _directory
+    _directory = directory or config.PROFILE_DIR or "profiles"
+
+
+def enabled() -> bool:
+    return _directory is not None
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9.-]+", "-", name).strip("-") or "run"
+
+
+def _prune(directory: str, keep: int):
+    """Delete the oldest profiles beyond keep (0 keeps all)"""
+    if keep <= 0:
+        return
+    files = sorted(f for f in os.listdir(directory) if FILE_PATTERN.match(f))
+    for name in files[: max(len(files) - keep, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile(name: str):
+    """
+    Profile the enclosed block and write it as a pstats file
+
+    Does nothing unless profiling is enabled, or when this thread is
+    already being profiled. Runs faster than PROFILE_MIN_MS are not kept.
+    Coroutines awaited inside the block share their thread with whatever
+    else the event loop runs meanwhile, which then shows up in the profile.
+    """
+    directory = _directory
+    if directory is None or getattr(_active, "profiling", False):
+        yield
+        return
+
+    _active.profiling = True
+    started_at = datetime.now()
+    started = time.perf_counter()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _active.profiling = False
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        if elapsed_ms >= config.PROFILE_MIN_MS:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(
+                    directory,
+                    f"{started_at:%Y%m%d-%H%M%S}_{_safe_name(name)}_{elapsed_ms}ms.prof",
+                )
+                profiler.dump_stats(path)
+                _prune(directory, config.PROFILE_KEEP)
+                logger.info(f"Profile of {name} ({elapsed_ms} ms) written to {path}")
+            except OSError as e:
+                logger.warning(f"Could not write profile of {name}: {e}")
+
+
+def profiled(name: str = None):
+    """Decorator form of profile() for sync and async functions"""
+
+    def decorate(func):
+        label = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with profile(label):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def call(name: str, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) under profile(name)
+
+    cProfile only sees the thread that enabled it, so work handed to a
+    worker thread is profiled there: asyncio.to_thread(call, name, func, ...).
+    """
+    with profile(name):
+        return func(*args, **kwargs)
+
+
+def list_profiles(directory: str, name: str = None, since: datetime = None) -> list:
+    """
+    Profiles in directory, slowest first
+
+    Returns:
+        Dicts with path, name, started (datetime) and duration_ms
+    """
+    if not os.path.isdir(directory):
+        return []
+    runs = []
+    for filename in os.listdir(directory):
+        match = FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        started = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S")
+        if (name and match.group(2) != _safe_name(name)) or (since and started < since):
+            continue
+        runs.append(
+            {
+                "path": os.path.join(directory, filename),
+                "name": match.group(2),
+                "started": started,
+                "duration_ms": int(match.group(3)),
+            }
+        )
+    return sorted(runs, key=lambda r: r["duration_ms"], reverse=True)
+
+
+def top_functions(path: str, limit: int = 15, sort: str = "cumulative") -> list:
+    """
+    Most expensive functions of a profile
+
+    Returns:
+        Dicts with function ("file:line(name)"), calls, tottime and cumtime
+    """
+    stats = pstats.Stats(path)
+    key = 3 if sort == "cumulative" else 2
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)
+    return [
+        {
+            "function": f"{os.path.basename(file)}:{line}({func})",
+            "calls": calls,
+            "tottime": tottime,
+            "cumtime": cumtime,
+        }
+        for (file, line, func), (_, calls, tottime, cumtime, _) in rows[:limit]
+    ]
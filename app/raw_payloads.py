@@ -0,0 +1,80 @@
+"""Encoding of raw ccxt payloads for the compressed and offloaded storage modes"""
+
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Where raw ccxt payloads are kept:
+#   jsonb      - raw_data JSONB column (original behaviour)
+#   off        - not stored
+#   compressed - raw_compressed BYTEA column, zstd (if installed) or zlib
+#   offload    - compressed once per distinct payload in raw_payloads, rows keep raw_hash
+MODES = ("jsonb", "off", "compressed", "offload")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def canonical_json(payload) -> bytes:
+    return json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), default=str
+    ).encode()
+
+
+def payload_hash(data: bytes) -> bytes:
+    """SHA-256 of canonical JSON, so equal payloads share one raw_payloads row"""
+    return hashlib.sha256(data).digest()
+
+
+def compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    """Decompress zstd or zlib, told apart by the zstd frame magic"""
+    blob = bytes(blob)
+    if blob.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed payload requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+def encode(payload, mode: str) -> dict:
+    """
+    Column values for storing payload under mode
+
+    Returns:
+        Dict with raw_data (JSON text or None), raw_compressed (bytes or
+        None), raw_hash (bytes or None) and, in offload mode, the
+        compressed blob to store in raw_payloads under "offloaded"
+    """
+    values = {"raw_data": None, "raw_compressed": None, "raw_hash": None}
+    if mode == "jsonb":
+        values["raw_data"] = json.dumps(payload, default=str)
+    elif mode == "compressed":
+        values["raw_compressed"] = compress(canonical_json(payload))
+    elif mode == "offload":
+        data = canonical_json(payload)
+        values["raw_hash"] = payload_hash(data)
+        values["offloaded"] = compress(data)
+    elif mode != "off":
+        raise ValueError(f"Unknown raw payload mode {mode!r} (use {', '.join(MODES)})")
+    return values
+
+
+def decode(raw_data=None, raw_compressed=None, offloaded=None):
+    """Payload from whichever stored form is present, or None"""
+    if raw_data is not None:
+        return json.loads(raw_data) if isinstance(raw_data, str) else raw_data
+    blob = raw_compressed if raw_compressed is not None else offloaded
+    if blob is not None:
+        return json.loads(decompress(blob))
+    return None
@@ -0,0 +1,84 @@
+"""In-process read-through cache for the bot's database reads"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReadCache:
+    """
+    TTL cache of query results, invalidated by the tables they read
+
+    Entries are keyed by query name and arguments and tagged with the tables
+    the query reads, so a write to one table only drops the entries built
+    from it. The TTL bounds staleness if a write notification is missed.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; loads that raced one are not stored
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, name: str, tables, loader, *args, **kwargs):
+        """
+        Return a cached result, calling loader(*args, **kwargs) on a miss
+
+        Args:
+            name: Query name, combined with the arguments into the cache key
+            tables: Tables the query reads, used for invalidation
+            loader: Callable producing the value (e.g. db.get_latest_balance)
+        """
+        key = (name, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            self.stats["misses"] += 1
+            generation = self.generation
+
+        value = loader(*args, **kwargs)
+        if self.ttl <= 0:
+            return value
+
+        with self._lock:
+            # A write landed while loading, so the value may predate it
+            if generation == self.generation:
+                self._entries[key] = (value, now, frozenset(tables))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return value
+
+    def invalidate(self, tables=None) -> int:
+        """Drop entries reading any of tables (all entries when None)"""
+        with self._lock:
+            self.generation += 1
+            if tables is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                tables = set(tables)
+                stale = [k for k, e in self._entries.items() if e[2] & tables]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self.stats["invalidations"] += 1
+        return dropped
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            }
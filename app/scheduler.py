@@ -0,0 +1,316 @@
+"""In-process asyncio scheduler for snapshot jobs on cron-like schedules"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# (low, high) of the five cron fields: minute, hour, day of month, month, day of week
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+# Interval schedules count from here (naive local time, like cron), so their
+# runs land on the same wall clock times across restarts
+INTERVAL_EPOCH = datetime(2000, 1, 1)
+
+# Long sleeps are cut into slices so wall clock jumps (suspend, NTP) are noticed
+MAX_SLEEP = 60.0
+
+
+def _parse_field(text: str, low: int, high: int, dow: bool = False) -> set:
+    values = set()
+    for part in text.split(","):
+        expr, _, step = part.partition("/")
+        step = int(step) if step else 1
+        # A step past the field's span would silently fire once per hour/day/...
+        if step < 1 or step > high - low:
+            raise ValueError(
+                f"Invalid cron step in {part!r}: use 1-{high - low}, or an "
+                f"IntervalSchedule for longer intervals"
+            )
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(v) for v in expr.split("-", 1))
+        else:
+            start = int(expr)
+            end = high if step > 1 else start
+        # Day of week 7 is Sunday too
+        if dow and end == 7:
+            values.add(0)
+            end = 6
+            if start == 7:
+                continue
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field {part!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    Standard five-field cron expression ("minute hour dom month dow")
+
+    Fields accept *, lists, ranges and steps (e.g. "*/15", "1-5", "0,30").
+    As in cron, when both day of month and day of week are restricted a day
+    matching either one fires. Times are naive local datetimes, like cron.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Cron expression {expression!r} needs 5 fields (minute hour dom month dow)"
+            )
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_field(text, low, high, dow=i == 4)
+            for i, (text, (low, high)) in enumerate(zip(fields, CRON_FIELDS))
+        )
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, t: datetime) -> bool:
+        in_days = t.day in self.days
+        # Python weekday(): Monday=0; cron: Sunday=0
+        in_weekdays = (t.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after after"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + 5
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(
+                    day=1
+                )
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def __str__(self) -> str:
+        return self.expression
+
+
+class IntervalSchedule:
+    """
+    Fixed interval in seconds, on multiples of the interval since INTERVAL_EPOCH
+
+    Unlike a cron step ("*/N" can only count within one hour), any interval
+    works: 90 minutes fires at 00:00, 01:30, 03:00, ... and 45 minutes at
+    :00, :45, :30 and :15 in turn.
+    """
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive, got {seconds}")
+        self.seconds = seconds
+
+    def next_after(self, after: datetime) -> datetime:
+        """First multiple of the interval strictly after after"""
+        elapsed = (after - INTERVAL_EPOCH).total_seconds()
+        return INTERVAL_EPOCH + timedelta(
+            seconds=(elapsed // self.seconds + 1) * self.seconds
+        )
+
+    def __str__(self) -> str:
+        minutes, seconds = divmod(self.seconds, 60)
+        return f"every {minutes:g}m" if not seconds else f"every {self.seconds:g}s"
+
+
+class Job:
+    """A scheduled callable and its run history"""
+
+    def __init__(
+        self,
+        name: str,
+        schedule,
+        func,
+        jitter: float = 0,
+        catch_up: bool = True,
+    ):
+        """
+        Args:
+            name: Job name (also its scheduler_jobs key)
+            schedule: Cron expression, or a schedule object (e.g. IntervalSchedule)
+            func: Blocking callable, run in the scheduler's executor. It may
+                return a short result text shown by status().
+            jitter: Up to this many seconds of random delay per run
+            catch_up: On startup, run once if a scheduled run was missed
+                while the process was down (or the job never ran)
+        """
+        self.name = name
+        self.schedule = (
+            CronSchedule(schedule) if isinstance(schedule, str) else schedule
+        )
+        self.func = func
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.running = False
+        self.next_run = None
+        self.last_started = None
+        self.last_duration = None
+        self.last_status = None
+        self.last_result = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+
+
+class Scheduler:
+    """
+    Runs Jobs on the event loop's executor without ever overlapping a job
+
+    A firing job still running from its previous firing is skipped and
+    counted, not queued. Each job's last start is kept in scheduler_jobs,
+    so missed runs are caught up once on startup.
+    """
+
+    def __init__(self, db=None, executor=None, on_finish=None):
+        """
+        Args:
+            db: Database for last-run state (None: no catch-up across restarts)
+            executor: concurrent.futures executor jobs run in (default loop executor)
+            on_finish: Optional coroutine function awaited with (job, error)
+                after every run, e.g. to invalidate caches or notify
+        """
+        self.db = db
+        self.executor = executor
+        self.on_finish = on_finish
+        self.jobs = {}
+        self._tasks = []
+
+    def add_job(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Job {job.name!r} already scheduled")
+        self.jobs[job.name] = job
+        return job
+
+    def _load_state(self, job: Job):
+        if self.db is None:
+            return None
+        try:
+            return self.db.get_job_state(job.name)
+        except Exception as e:
+            logger.warning(f"Could not load state of job {job.name}: {e}")
+            return None
+
+    def _save_state(self, job: Job):
+        if self.db is None:
+            return
+        try:
+            self.db.save_job_state(
+                job.name, job.last_started, job.last_duration, job.last_status
+            )
+        except Exception as e:
+            logger.warning(f"Could not save state of job {job.name}: {e}")
+
+    def missed(self, job: Job, now: datetime = None) -> bool:
+        """Whether a scheduled run of job fell between its last start and now"""
+        state = self._load_state(job)
+        if state and state.get("started"):
+            job.last_started = state["started"]
+            job.last_duration = state.get("duration")
+            job.last_status = state.get("status")
+            return job.schedule.next_after(job.last_started) <= (now or datetime.now())
+        return True
+
+    async def _execute(self, job: Job):
+        job.running = True
+        job.last_started = datetime.now()
+        started = time.perf_counter()
+        error = None
+        logger.info(f"Job {job.name} started")
+        try:
+            loop = asyncio.get_running_loop()
+            job.last_result = await loop.run_in_executor(self.executor, job.func)
+            job.last_status = "success"
+        except Exception as e:
+            error = e
+            job.failures += 1
+            job.last_status = "failed"
+            job.last_result = str(e)
+            logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = round(time.perf_counter() - started, 1)
+        logger.info(f"Job {job.name} {job.last_status} in {job.last_duration:.1f}s")
+        await asyncio.to_thread(self._save_state, job)
+        if self.on_finish is not None:
+            try:
+                await self.on_finish(job, error)
+            except Exception as e:
+                logger.error(f"Job {job.name} finish hook failed: {e}")
+
+    def fire(self, job: Job) -> bool:
+        """Start job now unless its previous run is still going"""
+        if job.running:
+            job.skipped += 1
+            logger.warning(f"Job {job.name} still running, skipping this run")
+            return False
+        self._tasks.append(asyncio.get_running_loop().create_task(self._execute(job)))
+        self._tasks = [t for t in self._tasks if not t.done()]
+        return True
+
+    async def _job_loop(self, job: Job):
+        if job.catch_up and await asyncio.to_thread(self.missed, job):
+            logger.info(f"Job {job.name} missed a scheduled run, catching up")
+            self.fire(job)
+        while True:
+            scheduled = job.schedule.next_after(datetime.now())
+            job.next_run = scheduled + timedelta(
+                seconds=random.uniform(0, job.jitter) if job.jitter else 0
+            )
+            while True:
+                remaining = (job.next_run - datetime.now()).total_seconds()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, MAX_SLEEP))
+            self.fire(job)
+
+    def start(self):
+        """Start every job's loop on the running event loop"""
+        loop = asyncio.get_running_loop()
+        for job in self.jobs.values():
+            self._tasks.append(loop.create_task(self._job_loop(job)))
+            logger.info(
+                f"Scheduled job {job.name} at '{job.schedule}' "
+                f"(jitter {job.jitter:.0f}s, catch-up {'on' if job.catch_up else 'off'})"
+            )
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def status(self) -> list:
+        """Per-job dicts for a status display"""
+        return [
+            {
+                "name": job.name,
+                "schedule": str(job.schedule),
+                "running": job.running,
+                "next_run": job.next_run,
+                "last_started": job.last_started,
+                "last_duration": job.last_duration,
+                "last_status": job.last_status,
+                "last_result": job.last_result,
+                "runs": job.runs,
+                "failures": job.failures,
+                "skipped": job.skipped,
+            }
+            for job in self.jobs.values()
+        ]
@@ -303,16 +303,46 @@
 #     main()
 
 
+import asyncio
+import functools
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from database import Database
-from config import DATABASE_URL, TELEGRAM_BOT_TOKEN, ALLOWED_USER_IDS
+from read_cache import ReadCache
+from price_cache import default_cache
+import metrics
+import profiling
+from scheduler import IntervalSchedule, Job, Scheduler
+from analytics import compute_metrics, format_metrics, load_history
+from pnl import format_pnl, latest_prices, update_pnl
+from exports import FORMATS, export_filename, write_export
+from config import (
+    DATABASE_URL,
+    TELEGRAM_BOT_TOKEN,
+    ALLOWED_USER_IDS,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    EXPORT_FORMAT,
+    RAW_PAYLOAD_MODE,
+    DB_PARTITIONING,
+    READ_CACHE_TTL,
+    COST_BASIS_METHOD,
+    METRICS_PORT,
+    SCHEDULER_ENABLED,
+    SNAPSHOT_SCHEDULE,
+    SCHEDULE_JITTER_SECONDS,
+    INTRADAY_INTERVAL_MINUTES,
+    load_accounts,
+)
 from decimal import Decimal
 from telegram import Bot
-import csv
-import io
-from datetime import datetime
+from telegram.error import TelegramError
+import tempfile
+from datetime import date, datetime, timedelta
 
 # Enhanced logging with more detail
 logging.basicConfig(
@@ -326,7 +356,64 @@ logging.getLogger("telegram").setLevel(logging.WARNING)
 logger = logging.getLogger("ZO_KRAKEN_BOT")
 
 
-db = Database(DATABASE_URL)
+db = Database(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, RAW_PAYLOAD_MODE, DB_PARTITIONING)
+
+# One long-lived KrakenConnector (ccxt rate limiter and nonce sequence) per API
+# key, shared by /pull and the scheduled jobs. Only used on pull_executor.
+connectors = {}
+
+# Background /pull job: one worker thread, one running task, chats awaiting the result
+pull_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pull")
+pull_task = None
+pull_chats = set()
+
+# Query results reused until a write touching their tables is announced
+reads = ReadCache(ttl=READ_CACHE_TTL)
+write_listener_stop = threading.Event()
+
+# Scheduled snapshot jobs run on pull_executor, so they queue behind a /pull
+# (and vice versa) instead of racing it on a connector
+scheduler = Scheduler(db, pull_executor)
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+# Exports stay in memory up to this size, then spill to a temp file
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def _on_write(payload):
+    """Write listener callback (listener thread): drop entries built from the table"""
+    tables = None if payload is None else [payload.get("table")]
+    dropped = reads.invalidate(tables)
+    logger.debug(f"Read cache invalidated | tables: {tables or 'all'} | {dropped}")
+
+
+def _compute_stats(start_date):
+    balances, flows = load_history(db, "kraken", start_date=start_date)
+    return compute_metrics(balances, flows=flows)
+
+
+def _compute_pnl(method):
+    """PnL text block per account, catching each checkpoint up with new trades"""
+    blocks = []
+    for account in db.list_accounts("kraken"):
+        account_id = account["account_id"]
+        engine = update_pnl(db, "kraken", account_id, method)
+        report = engine.report(latest_prices(db, "kraken", account_id))
+        if report:
+            blocks.append(format_pnl(account_id, report))
+    return blocks
+
+
+def get_connector(account: dict):
+    """Return the bot's KrakenConnector for account's API key (pull_executor only)"""
+    connector = connectors.get(account["api_key"])
+    if connector is None:
+        from main import create_connector
+
+        connector = connectors[account["api_key"]] = create_connector(account)
+    return connector
 
 
 def is_authorized(user_id: int) -> bool:
@@ -370,39 +457,112 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "ZO KRAKEN TRACKING ACTIVE\n\n"
         "/pull → fetch balance & trades\n"
         "/balance → latest balance\n"
-        "/returns → recent returns\n"
+        "/returns [day|week|month] [n] → recent returns\n"
+        "/stats [days] → return analytics (rolling, Sharpe, drawdown)\n"
+        "/pnl [fifo|lifo|average] → realized/unrealized PnL from trades\n"
         "/trades → recent trades\n"
-        "/export [limit] → export balance snapshots\n"
-        "/export_returns [limit] → export returns\n"
-        "/export_trades [limit] → export all trades as CSV"
+        "/export [limit] [format] → export balance snapshots\n"
+        "/export_returns [limit] [format] → export returns\n"
+        "/export_trades [limit] [format] → export trades\n"
+        "/cache → read/price cache hit ratios\n"
+        "/jobs → scheduled snapshot jobs\n"
+        "Formats: csv, csv.gz, csv.zst, parquet"
     )
     await notify_owner(f"User @{user.username or user.id} started the bot")
 
 
+async def _notify_pull_chats(bot, text: str, chats=None):
+    for chat_id in list(pull_chats if chats is None else chats):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.error(f"Failed to send pull update to {chat_id}: {e}")
+
+
+def _pull_snapshots(progress, loop) -> str:
+    """
+    /pull job (pull_executor thread): snapshot every account, balance included
+
+    A single account's balance and held-asset tickers are fetched
+    concurrently by get_account_balance_async on the bot's loop, where its
+    async client lives. This worker waits for it, so pull_executor still
+    serializes every call made with the account's API key.
+    """
+    from main import run_daily_snapshot, run_all_snapshots, format_snapshot_summary
+
+    accounts = load_accounts()
+    if not accounts:
+        raise RuntimeError("No Kraken account configured")
+    if len(accounts) > 1:
+        progress(f"Snapshotting {len(accounts)} accounts...")
+        results = run_all_snapshots(db, accounts, connectors=connectors)
+        return "\n\n" + format_snapshot_summary(results)
+    kraken = get_connector(accounts[0])
+    balance = asyncio.run_coroutine_threadsafe(
+        kraken.get_account_balance_async(), loop
+    ).result()
+    run_daily_snapshot(db, kraken, balance, progress)
+    return ""
+
+
+async def _run_pull(bot):
+    """Run the snapshot pipeline off the event loop and report to waiting chats"""
+    global pull_task, pull_chats
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+
+    def progress(text: str):
+        # Called from the worker thread
+        asyncio.run_coroutine_threadsafe(_notify_pull_chats(bot, text), loop)
+
+    try:
+        summary = await loop.run_in_executor(
+            pull_executor, functools.partial(_pull_snapshots, progress, loop)
+        )
+        elapsed = time.monotonic() - started
+        text = (
+            f"Fresh data pulled successfully in {elapsed:.1f}s! "
+            f"Use /balance or /trades{summary}"
+        )
+        logger.info(f"Pull completed successfully in {elapsed:.1f}s")
+    except Exception as e:
+        text = f"Pull failed: {e}"
+        logger.error(text)
+
+    # Also covers a down write listener; a failed pull may have written part way
+    reads.invalidate()
+    # Hand off before awaiting: a /pull arriving while the result is sent
+    # starts a new pull instead of joining (and losing) this finished one
+    chats, pull_chats = pull_chats, set()
+    pull_task = None
+    await _notify_pull_chats(bot, text, chats)
+
+
 async def pull(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global pull_task
     user = update.effective_user
     log_command(user, "pull")
 
     if not is_authorized(user.id):
         return
 
-    await update.message.reply_text(
-        "<i>Pulling fresh data from Kraken...</i>", parse_mode="HTML"
-    )
-    logger.info("Executing run_daily_snapshot() via /pull")
+    pull_chats.add(update.effective_chat.id)
 
-    try:
-        from main import run_daily_snapshot
-
-        run_daily_snapshot()
+    # Single flight: concurrent /pull requests join the running job
+    if pull_task is not None and not pull_task.done():
         await update.message.reply_text(
-            "Fresh data pulled successfully! Use /balance or /trades"
+            "<i>A pull is already running — you'll get a message when it finishes.</i>",
+            parse_mode="HTML",
         )
-        logger.info("Pull completed successfully")
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"Pull failed: {error_msg}")
-        await update.message.reply_text(f"Pull failed: {error_msg}")
+        logger.info("Pull already running, request coalesced")
+        return
+
+    # Claim the slot before awaiting the reply, so a /pull meanwhile joins it
+    logger.info("Starting run_daily_snapshot() in background via /pull")
+    pull_task = context.application.create_task(_run_pull(context.bot))
+    await update.message.reply_text(
+        "<i>Pulling fresh data from Kraken...</i>", parse_mode="HTML"
+    )
 
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -413,7 +573,9 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     logger.info("Fetching latest balance snapshot")
-    bal = db.get_latest_balance("kraken")
+    bal = reads.get(
+        "latest_balance", ["balance_snapshots"], db.get_latest_balance, "kraken"
+    )
     if not bal:
         await update.message.reply_text("No data — run /pull first")
         logger.warning("No balance data found in DB")
@@ -421,8 +583,18 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     import json
 
+    # Normalized holdings first; snapshots saved before the migration fall back to JSON
+    holdings = reads.get(
+        "holdings",
+        ["balance_snapshots"],
+        db.get_holdings,
+        bal["id"],
+        bal["snapshot_date"],
+    )
     balances_raw = bal["balances"]
-    if isinstance(balances_raw, str):
+    if holdings:
+        balances_dict = {h["asset"]: h for h in holdings}
+    elif isinstance(balances_raw, str):
         try:
             balances_dict = json.loads(balances_raw)
         except Exception as e:
@@ -479,7 +651,7 @@ async def trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     logger.info(f"Fetching {limit} recent trades")
-    rows = db.get_all_trades(limit=limit) if hasattr(db, "get_all_trades") else []
+    rows = reads.get("trades", ["trades"], db.get_all_trades, limit=limit)
     if not rows:
         await update.message.reply_text("No trades found. Run /pull first.")
         logger.warning("No trades in database")
@@ -510,35 +682,277 @@ async def trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Sent {len(rows)} trades to user")
 
 
-async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def returns(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    log_command(user, "export", context.args)
+    period, limit = "day", 7
+    for arg in context.args or []:
+        if arg.lower() in ("day", "week", "month"):
+            period = arg.lower()
+            continue
+        try:
+            limit = int(arg)
+            if limit < 1:
+                limit = 7
+        except:
+            limit = 7
+    log_command(user, "returns", context.args)
 
     if not is_authorized(user.id):
         return
 
-    preview_limit = 10
+    logger.info(f"Fetching {period} returns | limit: {limit}")
+    # Weekly/monthly figures come from the rollup table maintained on write
+    if period == "day":
+        rows = [
+            {
+                "account_id": r["account_id"],
+                "start": r["return_date"],
+                "balance": r["current_balance_usd"],
+                "return_usd": r["daily_return_usd"],
+                "return_pct": r["daily_return_pct"],
+            }
+            for r in reads.get(
+                "returns", ["daily_returns"], db.get_all_returns, "kraken", limit=limit
+            )
+        ]
+    else:
+        rows = [
+            {
+                "account_id": r["account_id"],
+                "start": r["period_start"],
+                "balance": r["close_balance_usd"],
+                "return_usd": r["return_usd"],
+                "return_pct": r["return_pct"],
+            }
+            for r in reads.get(
+                "rollups",
+                # recompute_returns rewrites rollups but announces daily_returns
+                ["balance_snapshots", "daily_returns"],
+                db.get_rollups,
+                period,
+                "kraken",
+                limit=limit,
+            )
+        ]
+    if not rows:
+        await update.message.reply_text("No returns yet — run /pull first")
+        return
+
+    text = f"<b>{period.upper()} RETURNS</b> (last {len(rows)})\n<code>\n"
+    text += f"{'Start':<11} {'Account':<12} {'Balance':>12} {'Return':>11} {'%':>8}\n"
+    text += "—" * 58 + "\n"
+    for r in rows:
+        usd = float(r["return_usd"])
+        sign = "+" if usd >= 0 else "-"
+        pct = (
+            f"{float(r['return_pct']):+.2f}%" if r["return_pct"] is not None else "n/a"
+        )
+        text += (
+            f"{str(r['start']):<11} {r['account_id'][:12]:<12} "
+            f"${float(r['balance']):>11,.0f} {sign}${abs(usd):>9,.0f} {pct:>8}\n"
+        )
+    text += "</code>"
+    await update.message.reply_text(text, parse_mode="HTML")
+    logger.info(f"Sent {len(rows)} {period} returns to user")
+
+
+def _pack_blocks(
+    title: str, blocks: list, separate: bool = False, limit: int = MAX_MESSAGE_LENGTH
+) -> list:
+    """
+    Pack <pre> text blocks into HTML messages of at most limit characters
+
+    Blocks share a message while they fit (or each start a new one when
+    separate is set); the title heads the first message. A block too long
+    for one message is split between lines.
+    """
+    pieces = []
+    budget = limit - len("<pre></pre>\n") - len(title)
+    for block in blocks:
+        part, first = "", True
+        for line in block.split("\n"):
+            if part and len(part) + len(line) + 1 > budget:
+                pieces.append((part, first))
+                part, first = "", False
+            part = f"{part}\n{line}" if part else line[:budget]
+        pieces.append((part, first))
+
+    # The budget leaves room for the title, so the first piece always fits
+    messages, text = [], title
+    for piece, first in pieces:
+        chunk = f"<pre>{piece}</pre>\n"
+        if (separate and first and text != title) or len(text) + len(chunk) > limit:
+            messages.append(text)
+            text = ""
+        text += chunk
+    messages.append(text)
+    return messages
+
+
+async def _reply_blocks(update: Update, title: str, blocks: list, separate=False):
+    """Reply with blocks packed into as many messages as Telegram's limit needs"""
+    for text in _pack_blocks(title, blocks, separate):
+        try:
+            await update.message.reply_text(text, parse_mode="HTML")
+        except TelegramError as e:
+            logger.error(f"Failed to send reply part ({len(text)} chars): {e}")
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    days = None
     if context.args:
         try:
-            preview_limit = int(context.args[0])
-            if preview_limit < 1:
-                preview_limit = 10
+            days = int(context.args[0])
+            if days < 1:
+                days = None
+        except:
+            days = None
+    log_command(user, "stats", context.args)
+
+    if not is_authorized(user.id):
+        return
+
+    logger.info(f"Computing return analytics | days: {days or 'all'}")
+    start_date = date.today() - timedelta(days=days) if days else None
+
+    # pandas work runs off the event loop so other commands stay responsive
+    metrics = await asyncio.to_thread(
+        profiling.call,
+        "bot-stats-worker",
+        reads.get,
+        "stats",
+        ["balance_snapshots", "daily_returns"],
+        _compute_stats,
+        start_date,
+    )
+    if metrics.empty:
+        await update.message.reply_text("No balance history — run /pull first")
+        return
+
+    blocks = [format_metrics(account_id, row) for account_id, row in metrics.iterrows()]
+    await _reply_blocks(update, "<b>RETURN ANALYTICS</b>\n", blocks)
+    logger.info(f"Stats sent | {len(metrics)} accounts")
+
+
+async def pnl(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    method = COST_BASIS_METHOD
+    if context.args and context.args[0].lower() in ("fifo", "lifo", "average"):
+        method = context.args[0].lower()
+    log_command(user, "pnl", context.args)
+
+    if not is_authorized(user.id):
+        return
+
+    logger.info(f"Computing PnL | method: {method}")
+    blocks = await asyncio.to_thread(
+        profiling.call,
+        "bot-pnl-worker",
+        reads.get,
+        "pnl",
+        ["trades", "balance_snapshots"],
+        _compute_pnl,
+        method,
+    )
+    if not blocks:
+        await update.message.reply_text("No trades found — run /pull first")
+        return
+
+    # One message per account: a single account's report can run to thousands of chars
+    await _reply_blocks(
+        update, f"<b>PNL ({method.upper()})</b>\n", blocks, separate=True
+    )
+    logger.info(f"PnL sent | {len(blocks)} accounts")
+
+
+def _export_args(args, default: int):
+    """Split export command args into (number, format), e.g. ['500', 'parquet']"""
+    number, fmt = default, EXPORT_FORMAT
+    for arg in args or []:
+        if arg.lower() in FORMATS:
+            fmt = arg.lower()
+            continue
+        try:
+            number = int(arg)
         except:
-            preview_limit = 10
+            pass
+    return number, fmt
+
+
+async def _send_export(update: Update, kind: str, fmt: str, limit: int, caption) -> int:
+    """
+    Write an export into a spooled temp file off the event loop and upload it
+
+    Args:
+        update: Telegram update to reply to
+        kind: 'balances', 'returns' or 'trades'
+        fmt: One of exports.FORMATS
+        limit: Maximum rows, newest first
+        caption: Callable taking the row count and returning the caption
+
+    Returns:
+        Number of rows exported (nothing is uploaded when zero)
+    """
+    filename = export_filename(kind, fmt)
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as f:
+        rows = await asyncio.to_thread(
+            profiling.call,
+            f"bot-export-{kind}-worker",
+            write_export,
+            db,
+            kind,
+            f,
+            fmt,
+            "kraken",
+            None,
+            limit,
+        )
+        if rows:
+            size = f.tell()
+            f.seek(0)
+            started = time.monotonic()
+            await update.message.reply_document(
+                document=f, filename=filename, caption=caption(rows)
+            )
+            logger.info(
+                f"Export uploaded | {kind} | {rows} rows | {fmt} | "
+                f"{size / 1024:,.0f} KiB in {time.monotonic() - started:.1f}s | "
+                f"{filename}"
+            )
+    return rows
 
-    logger.info(f"Exporting balance snapshots | preview: {preview_limit}")
+
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_command(user, "export", context.args)
+
+    if not is_authorized(user.id):
+        return
+
+    preview_limit, fmt = _export_args(context.args, 10)
+    if preview_limit < 1:
+        preview_limit = 10
+
+    logger.info(f"Exporting balance snapshots | preview: {preview_limit} | {fmt}")
     await update.message.reply_text(
         f"<i>Exporting balance snapshots...</i>", parse_mode="HTML"
     )
 
-    snapshots = db.get_all_balances(exchange="kraken", limit=1000)
+    snapshots = reads.get(
+        "balances",
+        ["balance_snapshots"],
+        db.get_all_balances,
+        exchange="kraken",
+        limit=preview_limit,
+    )
     if not snapshots:
         await update.message.reply_text("No balance data.")
         return
 
-    preview_text = f"<b>BALANCE EXPORT</b> — {len(snapshots)} rows\n<code>"
+    preview_text = f"<b>BALANCE EXPORT</b> — latest {len(snapshots)} rows\n<code>"
     preview_text += f"{'Date':<20} {'Total USD':>15}\n" + "—" * 37 + "\n"
-    for s in snapshots[:preview_limit]:
+    for s in snapshots:
         ts = (
             s["timestamp"].strftime("%Y-%m-%d %H:%M")
             if isinstance(s["timestamp"], datetime)
@@ -549,24 +963,12 @@ async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
     preview_text += "</code>"
     await update.message.reply_text(preview_text, parse_mode="HTML")
 
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["timestamp", "total_balance_usd"])
-    for s in snapshots:
-        ts = (
-            s["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-            if isinstance(s["timestamp"], datetime)
-            else s["timestamp"]
+    try:
+        await _send_export(
+            update, "balances", fmt, 1000, lambda n: f"Balance snapshots: {n} rows"
         )
-        writer.writerow([ts, f"{float(s['total_balance_usd']):.2f}"])
-
-    filename = f"balances_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-    await update.message.reply_document(
-        document=io.BytesIO(buffer.getvalue().encode("utf-8")),
-        filename=filename,
-        caption=f"Balance snapshots: {len(snapshots)} rows",
-    )
-    logger.info(f"Balance CSV exported | {len(snapshots)} rows | {filename}")
+    except ValueError as e:
+        await update.message.reply_text(f"Export failed: {e}")
 
 
 async def export_returns(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -576,44 +978,20 @@ async def export_returns(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_authorized(user.id):
         return
 
-    limit = 1000
-    if context.args:
-        try:
-            limit = int(context.args[0])
-        except:
-            pass
+    limit, fmt = _export_args(context.args, 1000)
 
-    logger.info(f"Exporting returns data | limit: {limit}")
+    logger.info(f"Exporting returns data | limit: {limit} | {fmt}")
     await update.message.reply_text("<i>Exporting returns...</i>", parse_mode="HTML")
 
-    returns = db.get_all_returns(exchange="kraken", limit=limit)
-    if not returns:
-        await update.message.reply_text("No returns data.")
-        return
-
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(
-        ["date", "previous_date", "return_usd", "return_pct", "balance_usd"]
-    )
-    for r in returns:
-        writer.writerow(
-            [
-                r["return_date"],
-                r["previous_date"],
-                f"{float(r['daily_return_usd']):.2f}",
-                f"{float(r['daily_return_pct']):.2f}",
-                f"{float(r['current_balance_usd']):.2f}",
-            ]
+    try:
+        rows = await _send_export(
+            update, "returns", fmt, limit, lambda n: f"Returns: {n} days"
         )
-
-    filename = f"returns_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-    await update.message.reply_document(
-        document=io.BytesIO(buffer.getvalue().encode("utf-8")),
-        filename=filename,
-        caption=f"Returns: {len(returns)} days",
-    )
-    logger.info(f"Returns CSV exported | {len(returns)} rows | {filename}")
+    except ValueError as e:
+        await update.message.reply_text(f"Export failed: {e}")
+        return
+    if not rows:
+        await update.message.reply_text("No returns data.")
 
 
 async def export_trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -623,85 +1001,202 @@ async def export_trades(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_authorized(user.id):
         return
 
-    limit = 5000
-    if context.args:
-        try:
-            limit = int(context.args[0])
-        except:
-            pass
+    limit, fmt = _export_args(context.args, 5000)
 
-    logger.info(f"Exporting trades | limit: {limit}")
+    logger.info(f"Exporting trades | limit: {limit} | {fmt}")
     await update.message.reply_text(
         f"<i>Exporting up to {limit} trades...</i>", parse_mode="HTML"
     )
 
-    trades = db.get_all_trades(limit=limit) if hasattr(db, "get_all_trades") else []
-    if not trades:
+    try:
+        rows = await _send_export(
+            update, "trades", fmt, limit, lambda n: f"Exported {n} trades"
+        )
+    except ValueError as e:
+        await update.message.reply_text(f"Export failed: {e}")
+        return
+    if not rows:
         await update.message.reply_text("No trades found.")
         logger.warning("No trades found for export")
         return
 
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(
-        [
-            "timestamp",
-            "symbol",
-            "side",
-            "type",
-            "amount",
-            "price",
-            "cost",
-            "fee_cost",
-            "fee_currency",
-            "trade_id",
-        ]
-    )
+    await update.message.reply_text(f"Done! {rows} trades exported.")
 
-    for t in trades:
-        ts = t["trade_timestamp"]
-        ts_str = (
-            ts.strftime("%Y-%m-%d %H:%M:%S") if isinstance(ts, datetime) else str(ts)
+
+async def cache(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_command(user, "cache")
+
+    if not is_authorized(user.id):
+        return
+
+    text = "<b>CACHE STATS</b>\n<code>\n"
+    for name, stats in (
+        ("Reads", reads.get_stats()),
+        ("Prices", default_cache().get_stats()),
+    ):
+        lookups = stats["hits"] + stats["misses"]
+        text += (
+            f"{name:<7} {stats['hit_ratio']:>6.1%} hit  "
+            f"({stats['hits']}/{lookups}, {stats['entries']} entries)\n"
+        )
+    pool = db.pool_stats()
+    if pool:
+        text += f"DB pool {pool}\n"
+    text += "</code>"
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_command(user, "jobs")
+
+    if not is_authorized(user.id):
+        return
+
+    if not scheduler.jobs:
+        await update.message.reply_text("Scheduler is off (SCHEDULER_ENABLED=false).")
+        return
+
+    def when(value) -> str:
+        return f"{value:%Y-%m-%d %H:%M:%S}" if value else "never"
+
+    text = "<b>SCHEDULED JOBS</b>\n<code>\n"
+    for job in scheduler.status():
+        state = "running" if job["running"] else (job["last_status"] or "idle")
+        duration = (
+            f" ({job['last_duration']:.1f}s)"
+            if job["last_duration"] is not None
+            else ""
         )
-        writer.writerow(
-            [
-                ts_str,
-                t["symbol"],
-                t["side"].upper(),
-                t.get("type", ""),
-                f"{float(t['amount']):.8f}",
-                f"{float(t['price']):.8f}",
-                f"{float(t['cost']):.2f}",
-                t["fee_cost"] or "",
-                t["fee_currency"] or "",
-                t["trade_id"],
-            ]
+        text += (
+            f"{job['name']} [{job['schedule']}] {state}\n"
+            f"  last {when(job['last_started'])}{duration}\n"
+            f"  next {when(job['next_run'])}\n"
+            f"  runs {job['runs']}, failed {job['failures']}, "
+            f"skipped {job['skipped']}\n"
         )
+        if job["last_status"] == "failed" and job["last_result"]:
+            text += f"  error: {job['last_result'][:200]}\n"
+    text += "</code>"
+    await update.message.reply_text(text, parse_mode="HTML")
+
 
-    filename = f"trades_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-    await update.message.reply_document(
-        document=io.BytesIO(buffer.getvalue().encode("utf-8")),
-        filename=filename,
-        caption=f"Exported {len(trades)} trades",
+def _scheduled_snapshots(intraday: bool = False) -> str:
+    """Scheduler job (pull_executor thread): snapshot every account"""
+    from main import run_all_snapshots
+
+    results = run_all_snapshots(
+        db, load_accounts(), intraday=intraday, connectors=connectors
     )
-    await update.message.reply_text(f"Done! {len(trades)} trades exported.")
-    logger.info(f"Trades CSV exported | {len(trades)} trades | {filename}")
+    failed = [r for r in results if r["status"] != "success"]
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)}/{len(results)} accounts failed: "
+            + ", ".join(f"{r['account_id']} ({r.get('error')})" for r in failed)
+        )
+    return f"{len(results)} accounts"
+
+
+async def _on_job_finish(job: Job, error: Exception):
+    # Also covers a down write listener, as after /pull
+    reads.invalidate()
+    if error is not None:
+        await notify_owner(f"Scheduled {job.name} failed: {error}")
+
+
+def schedule_jobs():
+    """Register the snapshot jobs cron used to run"""
+    scheduler.on_finish = _on_job_finish
+    scheduler.add_job(
+        Job(
+            "daily",
+            SNAPSHOT_SCHEDULE,
+            _scheduled_snapshots,
+            jitter=SCHEDULE_JITTER_SECONDS,
+        )
+    )
+    if INTRADAY_INTERVAL_MINUTES > 0:
+        # Missed samples are not worth catching up
+        scheduler.add_job(
+            Job(
+                "intraday",
+                IntervalSchedule(INTRADAY_INTERVAL_MINUTES * 60),
+                functools.partial(_scheduled_snapshots, intraday=True),
+                jitter=min(SCHEDULE_JITTER_SECONDS, INTRADAY_INTERVAL_MINUTES * 6),
+                catch_up=False,
+            )
+        )
+
+
+async def _post_init(application: Application):
+    if scheduler.jobs:
+        await asyncio.to_thread(db.create_scheduler_jobs_table)
+        scheduler.start()
+
+
+async def _post_shutdown(application: Application):
+    await scheduler.stop()
+    for connector in list(connectors.values()):
+        await connector.close_async()
 
 
 def main():
     logger.info("KRAKEN ACCOUNT TRACKING BOT STARTED")
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+
+    commands = {
+        "start": start,
+        "pull": pull,
+        "balance": balance,
+        "trades": trades,
+        "returns": returns,
+        "stats": stats,
+        "pnl": pnl,
+        "export": export,
+        "export_returns": export_returns,
+        "export_trades": export_trades,
+        "cache": cache,
+        "jobs": jobs,
+    }
+    for name, callback in commands.items():
+        # Profiled only while PROFILE_DIR is set (checked per invocation)
+        callback = profiling.profiled(f"bot-{name}")(callback)
+        app.add_handler(CommandHandler(name, callback))
+
+    if READ_CACHE_TTL > 0:
+        threading.Thread(
+            target=db.listen_writes,
+            args=(_on_write, write_listener_stop),
+            name="write-listener",
+            daemon=True,
+        ).start()
+        logger.info(
+            f"Read cache on (TTL {READ_CACHE_TTL:.0f}s, write listener started)"
+        )
 
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("pull", pull))
-    app.add_handler(CommandHandler("balance", balance))
-    app.add_handler(CommandHandler("trades", trades))
-    app.add_handler(CommandHandler("export", export))
-    app.add_handler(CommandHandler("export_returns", export_returns))
-    app.add_handler(CommandHandler("export_trades", export_trades))
+    metrics.instrument_app()
+    metrics.registry.add_collector("db_pool", db.pool_stats)
+    metrics.registry.add_collector("read_cache", reads.get_stats)
+    metrics.registry.add_collector("price_cache", default_cache().get_stats)
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        logger.info(f"Metrics endpoint on :{METRICS_PORT}/metrics")
+
+    if SCHEDULER_ENABLED:
+        schedule_jobs()
 
     logger.info("Bot handlers registered. Starting polling...")
-    app.run_polling(drop_pending_updates=True)
+    try:
+        app.run_polling(drop_pending_updates=True)
+    finally:
+        write_listener_stop.set()
 
 
 if __name__ == "__main__":
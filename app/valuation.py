@@ -0,0 +1,113 @@
+"""Cross-rate conversion graph for valuing assets in USD"""
+
+from collections import deque
+from decimal import Decimal
+
+# Quotes tried, in order, when an asset has no direct /USD market
+CROSS_QUOTES = ("USDT", "USDC", "EUR", "BTC", "ETH", "GBP")
+
+
+def clean_currency(currency: str) -> str:
+    """Strip Kraken's balance suffixes (e.g. 'BTC.F' -> 'BTC')"""
+    return currency.split(".")[0] if "." in currency else currency
+
+
+def route_symbols(currencies, markets: dict, roots, quotes=CROSS_QUOTES) -> list:
+    """
+    Pick the ticker symbols needed to value currencies in USD
+
+    A currency with a USD market (X/USD or USD/X) needs just that pair.
+    Otherwise the first listed cross quote Q is used, adding X/Q (or Q/X)
+    plus the pairs needed to value Q itself.
+
+    Args:
+        currencies: Iterable of balance currency codes (e.g. 'BTC.F')
+        markets: Loaded exchange markets keyed by symbol
+        roots: Currency codes valued 1:1 in USD
+        quotes: Intermediate quotes tried in order
+
+    Returns:
+        Sorted list of symbols like 'BTC/USD' or 'FOO/EUR'
+    """
+
+    def pair(a: str, b: str):
+        for symbol in (f"{a}/{b}", f"{b}/{a}"):
+            if symbol in markets:
+                return symbol
+        return None
+
+    symbols, seen = set(), set()
+    pending = [clean_currency(c) for c in currencies]
+    while pending:
+        currency = pending.pop()
+        if currency in seen or currency in roots:
+            continue
+        seen.add(currency)
+
+        direct = pair(currency, "USD")
+        if direct:
+            symbols.add(direct)
+            continue
+        for quote in quotes:
+            cross = pair(currency, quote) if quote != currency else None
+            if cross:
+                symbols.add(cross)
+                pending.append(quote)
+                break
+    return sorted(symbols)
+
+
+class ConversionGraph:
+    """
+    USD rates for every currency reachable from a set of tickers
+
+    Each ticker X/Y adds edges X->Y and Y->X. One breadth-first search out
+    from the USD roots fixes every currency's fewest-hop route to USD and
+    its rate, so valuing an asset afterwards is a dict lookup.
+    """
+
+    def __init__(self, tickers: dict, roots):
+        """
+        Args:
+            tickers: {symbol: {"last": price, ...}} ccxt tickers or cached prices
+            roots: Currency codes valued 1:1 in USD
+        """
+        # edges[a][b] = price of one `a` in `b`
+        edges = {}
+        for symbol, ticker in sorted(tickers.items()):
+            price = ticker.get("last")
+            if "/" not in symbol or not price:
+                continue
+            base, quote = symbol.split("/", 1)
+            base, quote = clean_currency(base), clean_currency(quote.split(":")[0])
+            price = Decimal(str(price))
+            edges.setdefault(base, {})[quote] = price
+            edges.setdefault(quote, {})[base] = 1 / price
+
+        self.rates = {}
+        self.routes = {}
+        queue = deque()
+        for root in sorted({clean_currency(r) for r in roots}):
+            self.rates[root] = Decimal("1")
+            self.routes[root] = [root]
+            queue.append(root)
+
+        # Walking outward from USD: a neighbour's rate is its price in the
+        # currency just reached times that currency's USD rate
+        while queue:
+            currency = queue.popleft()
+            for neighbour in edges.get(currency, {}):
+                if neighbour in self.rates:
+                    continue
+                rate = edges[neighbour][currency] * self.rates[currency]
+                self.rates[neighbour] = rate
+                self.routes[neighbour] = [neighbour] + self.routes[currency]
+                queue.append(neighbour)
+
+    def rate(self, currency: str):
+        """USD value of one unit of currency, or None if there is no route"""
+        return self.rates.get(clean_currency(currency))
+
+    def route(self, currency: str) -> list:
+        """Currencies walked from currency to USD (e.g. ['FOO', 'EUR', 'USD'])"""
+        return self.routes.get(clean_currency(currency), [])
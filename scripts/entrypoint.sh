@@ -5,38 +5,79 @@ timestamp() {
     date '+%Y-%m-%d %H:%M:%S %Z'
 }
 
+# Crontab lines running $2 every $1 minutes. A minute step ("*/N") only counts
+# within an hour, so intervals that do not divide 60 are spelled out as the
+# minutes/hours of each run in the day. Fails if $1 does not divide a day.
+intraday_cron_lines() {
+    awk -v n="$1" -v cmd="$2" 'BEGIN {
+        if (n <= 0 || 1440 % n) exit 1
+        if (60 % n == 0) { print "*/" n " * * * * " cmd; exit 0 }
+        for (t = 0; t < 1440; t += n) {
+            m = t % 60; h = int(t / 60)
+            hours[m] = seen[m]++ ? hours[m] "," h : h
+        }
+        for (m = 0; m < 60; m++) if (seen[m]) print m " " hours[m] " * * * " cmd
+    }'
+}
+
 echo "[$(timestamp)] Starting Kraken Account Tracking"
 
 # Verify/create ALL tables via database.py
 echo "[$(timestamp)] Verifying database schema via database.py..."
 uv run python -c "
 from database import Database
-from config import DATABASE_URL
-db = Database(DATABASE_URL)
+from config import DATABASE_URL, DB_PARTITIONING
+db = Database(DATABASE_URL, partitioned=DB_PARTITIONING)
 db.create_balance_snapshots_table()
+db.create_balance_holdings_table()
 db.create_returns_table()
 db.create_trades_table()
+db.create_sync_checkpoints_table()
+db.create_scheduler_jobs_table()
+db.create_raw_payloads_table()
+db.create_intraday_snapshots_table()
+db.create_summary_tables()
+db.migrate_balance_holdings()
 print('All tables verified/created. schema LOCKED')
 "
 
-# Run initial data pull (first deploy or after nuke)
-echo "[$(timestamp)] Running initial data pull..."
-if uv run main.py >> /var/log/cron.log 2>&1; then
-    echo "[$(timestamp)] Initial pull: SUCCESS"
+if [ "${SCHEDULER_ENABLED:-true}" = "true" ]; then
+    # The bot schedules the daily (and intraday) snapshots itself and catches
+    # up a missed or first run on startup, so neither the initial pull nor cron runs
+    echo "[$(timestamp)] In-process scheduler enabled (SNAPSHOT_SCHEDULE=${SNAPSHOT_SCHEDULE:-5 0 * * *}), cron not started"
 else
-    echo "[$(timestamp)] Initial pull: FAILED — will retry daily at 12:05 AM PH"
-fi
+    # Run initial data pull (first deploy or after nuke)
+    echo "[$(timestamp)] Running initial data pull..."
+    if uv run main.py >> /var/log/cron.log 2>&1; then
+        echo "[$(timestamp)] Initial pull: SUCCESS"
+    else
+        echo "[$(timestamp)] Initial pull: FAILED — will retry daily at 12:05 AM PH"
+    fi
 
-# Start cron daemon in the background
-echo "[$(timestamp)] Starting cron daemon..."
-cron
-sleep 1
+    # Intraday samples every INTRADAY_INTERVAL_MINUTES (off when unset or 0)
+    if [ "${INTRADAY_INTERVAL_MINUTES:-0}" -gt 0 ]; then
+        if intraday_cron_lines "$INTRADAY_INTERVAL_MINUTES" \
+            "root /root/.cargo/bin/uv run --project /app main.py --intraday >> /var/log/cron.log 2>&1" \
+            > /etc/cron.d/intraday-pull; then
+            echo "[$(timestamp)] Scheduling intraday snapshots every ${INTRADAY_INTERVAL_MINUTES} minutes"
+            chmod 0644 /etc/cron.d/intraday-pull
+        else
+            rm -f /etc/cron.d/intraday-pull
+            echo "[$(timestamp)] ✗ WARNING: INTRADAY_INTERVAL_MINUTES=${INTRADAY_INTERVAL_MINUTES} does not divide a day; cron cannot run it evenly. Intraday snapshots are off (the in-process scheduler handles any interval)"
+        fi
+    fi
 
-# Verify cron is running
-if ps aux | grep -q '[c]ron'; then
-    echo "[$(timestamp)] ✓ Cron daemon confirmed running"
-else
-    echo "[$(timestamp)] ✗ WARNING: Cron daemon failed to start!"
+    # Start cron daemon in the background
+    echo "[$(timestamp)] Starting cron daemon..."
+    cron
+    sleep 1
+
+    # Verify cron is running
+    if ps aux | grep -q '[c]ron'; then
+        echo "[$(timestamp)] ✓ Cron daemon confirmed running"
+    else
+        echo "[$(timestamp)] ✗ WARNING: Cron daemon failed to start!"
+    fi
 fi
 
 # Start Telegram bot — FOREVER (PID 1)
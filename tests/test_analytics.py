@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from analytics import (
+    balances_frame,
+    compute_metrics,
+    compute_returns,
+    flows_frame,
+    format_metrics,
+)
+
+
+def test_all_na_drawdown_column_gives_nat():
+    # An account that only ever held 0 has no drawdown at all
+    balances = pd.DataFrame(
+        {"funded": [100.0, 90.0, 95.0], "empty": [0.0, 0.0, 0.0]},
+        index=pd.date_range("2024-01-01", periods=3),
+    )
+    metrics = compute_metrics(balances)
+    assert metrics.loc["funded", "max_drawdown"] == pytest.approx(-0.1)
+    assert str(metrics.loc["funded", "max_drawdown_date"]) == "2024-01-02"
+    assert pd.isna(metrics.loc["empty", "max_drawdown_date"])
+    assert "Max drawdown:  n/a (n/a)" in format_metrics("empty", metrics.loc["empty"])
+
+
+def history(rows):
+    return [
+        {
+            "account_id": "a",
+            "snapshot_date": day,
+            "total_balance_usd": bal,
+            "net_flow_usd": flow,
+        }
+        for day, bal, flow in rows
+    ]
+
+
+def test_deposit_is_not_a_return():
+    # +1% a day, with a 1000 USD deposit arriving on day 3
+    rows = history(
+        [
+            ("2024-01-01", 1000.0, 0),
+            ("2024-01-02", 1010.0, 0),
+            ("2024-01-03", 2030.1, 1000.0),
+            ("2024-01-04", 2050.401, 0),
+        ]
+    )
+    balances = balances_frame(rows)
+    flows = flows_frame(rows, balances)
+    returns = compute_returns(balances, flows)
+    assert returns["a"].iloc[1:].tolist() == pytest.approx([0.01, 0.01, 0.01])
+
+    metrics = compute_metrics(balances, flows=flows, windows=(2,))
+    row = metrics.loc["a"]
+    assert row["cumulative_return"] == pytest.approx(1.01**3 - 1)
+    assert row["return_2d"] == pytest.approx(1.01**2 - 1)
+    assert row["max_drawdown"] == 0
+    assert row["end_balance"] == pytest.approx(2050.401)
+
+
+def test_withdrawal_is_not_a_drawdown():
+    rows = history(
+        [
+            ("2024-01-01", 1000.0, 0),
+            ("2024-01-02", 500.0, -500.0),
+            ("2024-01-03", 505.0, 0),
+        ]
+    )
+    balances = balances_frame(rows)
+    metrics = compute_metrics(balances, flows=flows_frame(rows, balances))
+    assert metrics.loc["a", "max_drawdown"] == 0
+    assert metrics.loc["a", "cumulative_return"] == pytest.approx(0.01)
+    # Without the flows the withdrawal reads as a 50% loss
+    assert compute_metrics(balances).loc["a", "max_drawdown"] == pytest.approx(-0.5)
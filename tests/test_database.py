@@ -0,0 +1,9 @@
+import config
+from database import Database
+
+
+def test_partition_premake_months_follows_config(monkeypatch):
+    monkeypatch.setattr(config, "PARTITION_PREMAKE_MONTHS", 6)
+    assert Database("postgresql://unused").partition_premake_months == 6
+    db = Database("postgresql://unused", partition_premake_months=1)
+    assert db.partition_premake_months == 1
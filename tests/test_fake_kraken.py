@@ -0,0 +1,135 @@
+import pytest
+
+import main
+from fake_kraken import PAGE_SIZE, FakeKraken, parse_spec
+from kraken import KrakenConnector
+from price_cache import PriceCache
+
+
+def fake(**settings) -> FakeKraken:
+    spec = ",".join(f"{k}={v}" for k, v in settings.items())
+    return FakeKraken("fake-key-000", parse_spec(spec))
+
+
+def page_all(fetch, **kwargs) -> list:
+    """Follow ofs until a short page, like KrakenConnector callers do"""
+    rows, pages = [], []
+    while True:
+        page = fetch(params={"ofs": len(rows), **kwargs})
+        pages.append(len(page))
+        rows += page
+        if len(page) < PAGE_SIZE:
+            return rows, pages
+
+
+@pytest.mark.parametrize(
+    "count,pages", [(120, [50, 50, 20]), (100, [50, 50, 0]), (7, [7])]
+)
+def test_trade_pages_cover_history_once(count, pages):
+    exchange = fake(trades=count)
+    rows, sizes = page_all(exchange.fetch_my_trades)
+    assert sizes == pages
+    ids = [t["id"] for t in rows]
+    assert len(ids) == len(set(ids)) == count
+    stamps = [t["timestamp"] for t in rows]
+    assert stamps == sorted(stamps, reverse=True)
+
+
+def test_ledger_pages_cover_history_once():
+    exchange = fake(ledger=130)
+    rows, sizes = page_all(exchange.fetch_ledger)
+    assert sizes == [50, 50, 30]
+    assert len({e["id"] for e in rows}) == 130
+
+
+def test_since_is_exclusive_and_end_inclusive():
+    exchange = fake(trades=120)
+    everything, _ = page_all(exchange.fetch_my_trades)
+    newest_first = [t["timestamp"] for t in everything]
+    since = newest_first[60]
+    end = newest_first[10] // 1000
+
+    rows = []
+    while True:
+        page = exchange.fetch_my_trades(
+            since=since, params={"ofs": len(rows), "end": end}
+        )
+        rows += page
+        if len(page) < PAGE_SIZE:
+            break
+    stamps = [t["timestamp"] for t in rows]
+    assert all(since < ts <= end * 1000 for ts in stamps)
+    expected = [ts for ts in newest_first if since < ts <= end * 1000]
+    assert stamps == expected
+
+
+class MemoryDb:
+    """Stand-in for the Database methods sync_trades/sync_ledger use"""
+
+    def __init__(self):
+        self.rows = {"trades": {}, "ledger": {}}
+        self.checkpoints = {}
+
+    def get_sync_checkpoint(self, exchange, account_id, stream):
+        cursor = self.checkpoints.get(stream)
+        return dict(cursor) if cursor else None
+
+    def save_sync_checkpoint(self, exchange, account_id, stream, cursor):
+        self.checkpoints[stream] = dict(cursor)
+
+    def clear_sync_checkpoint(self, exchange, account_id, stream):
+        self.checkpoints.pop(stream, None)
+
+    def _save(self, stream, rows):
+        stored = self.rows[stream]
+        new = [r for r in rows if r["id"] not in stored]
+        stored.update((r["id"], r) for r in new)
+        return len(new)
+
+    def _latest(self, stream):
+        stored = self.rows[stream].values()
+        return max((r["timestamp"] for r in stored), default=None)
+
+    def save_trades(self, trades, exchange, account_id):
+        return self._save("trades", trades)
+
+    def get_latest_trade_timestamp(self, exchange, account_id):
+        return self._latest("trades")
+
+    def save_ledger_entries(self, entries, exchange, account_id):
+        return self._save("ledger", entries)
+
+    def get_latest_ledger_timestamp(self, exchange, account_id):
+        return self._latest("ledger")
+
+
+def connector(exchange: FakeKraken) -> KrakenConnector:
+    return KrakenConnector(
+        exchange.apiKey, "fake-secret", "fake_000", PriceCache(), exchange=exchange
+    )
+
+
+def test_interrupted_trade_backfill_resumes_without_duplicates():
+    exchange = fake(trades=230)
+    db = MemoryDb()
+    kraken = connector(exchange)
+
+    first = main.sync_trades(db, kraken, "fake_000", max_pages=2)
+    assert (first["rows"], first["complete"]) == (100, False)
+    assert db.checkpoints["trades"]["offset"] == 100
+
+    rest = main.sync_trades(db, kraken, "fake_000")
+    assert (rest["rows"], rest["inserted"], rest["complete"]) == (130, 130, True)
+    assert len(db.rows["trades"]) == 230
+    assert "trades" not in db.checkpoints
+
+    again = main.sync_trades(db, kraken, "fake_000")
+    assert (again["rows"], again["inserted"]) == (0, 0)
+
+
+def test_ledger_sync_pages_through_connector():
+    exchange = fake(ledger=75)
+    db = MemoryDb()
+    stats = main.sync_ledger(db, connector(exchange), "fake_000")
+    assert (stats["pages"], stats["inserted"], stats["complete"]) == (2, 75, True)
+    assert exchange.calls["fetch_ledger"] == 2
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+import metrics
+
+
+class Store:
+    def iter_rows(self, n):
+        for i in range(n):
+            time.sleep(0.01)
+            yield i
+
+    def iter_broken(self):
+        yield 1
+        raise ValueError("boom")
+
+
+def call_key(method):
+    return ("kraken_call_seconds", (("component", "store"), ("method", method)))
+
+
+def test_generator_methods_are_timed_over_iteration(monkeypatch):
+    registry = metrics.Metrics()
+    monkeypatch.setattr(metrics, "registry", registry)
+    metrics.instrument(Store, "store")
+
+    rows = Store().iter_rows(5)
+    assert call_key("iter_rows") not in registry.histograms
+    assert list(rows) == [0, 1, 2, 3, 4]
+    hist = registry.histograms[call_key("iter_rows")]
+    assert hist[-2] == 1
+    assert hist[-3] >= 0.05
+
+    stream = Store().iter_rows(100)
+    next(stream)
+    stream.close()
+    assert registry.histograms[call_key("iter_rows")][-2] == 2
+
+    with pytest.raises(ValueError):
+        list(Store().iter_broken())
+    assert registry.histograms[call_key("iter_broken")][-2] == 1
+    errors = (
+        "kraken_call_errors_total",
+        (("component", "store"), ("error", "ValueError"), ("method", "iter_broken")),
+    )
+    assert registry.counters[errors] == 1
@@ -0,0 +1,149 @@
+from datetime import date, datetime
+
+import pytest
+
+from pnl import CostBasisEngine, LotQueue
+
+
+def trade(id, symbol, side, amount, price, fee=0.0, fee_currency=None, day=1):
+    return {
+        "id": id,
+        "symbol": symbol,
+        "side": side,
+        "amount": amount,
+        "price": price,
+        "cost": amount * price,
+        "fee_cost": fee,
+        "fee_currency": fee_currency or symbol.split("/")[1],
+        "trade_timestamp": datetime(2024, 6, day, 12, 0, id),
+    }
+
+
+def by_asset(engine, prices=None):
+    return {r["asset"]: r for r in engine.report(prices or {})}
+
+
+@pytest.mark.parametrize(
+    "method, basis", [("fifo", 100.0), ("lifo", 200.0), ("average", 150.0)]
+)
+def test_lot_queue_methods(method, basis):
+    lots = LotQueue(method)
+    lots.add(1.0, 100.0)
+    lots.add(1.0, 200.0)
+    assert lots.remove(1.0) == (1.0, basis)
+    assert lots.totals() == (1.0, 300.0 - basis)
+
+
+def test_lot_queue_sale_beyond_open_lots():
+    lots = LotQueue("fifo")
+    lots.add(1.0, 100.0)
+    assert lots.remove(3.0) == (1.0, 100.0)
+    assert len(lots) == 0
+
+
+def test_buy_and_sell_on_different_quotes_match():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "EUR/USD", "buy", 1000, 1.10))
+    engine.apply(trade(2, "BTC/USD", "buy", 1, 50000))
+    # Sold for 55000 EUR while EUR is worth 1.10 USD (60500 USD)
+    engine.apply(trade(3, "BTC/EUR", "sell", 1, 55000))
+
+    btc = by_asset(engine)["BTC"]
+    assert btc["open_amount"] == pytest.approx(0)
+    assert btc["unmatched"] == 0
+    assert btc["realized"] == pytest.approx(10500)
+    # The EUR received is a new lot at its USD value at trade time
+    eur = by_asset(engine)["EUR"]
+    assert eur["open_amount"] == pytest.approx(56000)
+    assert eur["cost_basis"] == pytest.approx(61600)
+
+
+def test_quote_leg_of_cross_trade_disposes_quote_lots():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "buy", 1, 40000))
+    engine.apply(trade(2, "BTC/USD", "buy", 0.0001, 60000))
+    # 0.5 BTC spent on ETH when BTC is worth 60000: the BTC leg realizes
+    engine.apply(trade(3, "ETH/BTC", "buy", 10, 0.05))
+
+    rows = by_asset(engine)
+    assert rows["BTC"]["realized"] == pytest.approx(0.5 * (60000 - 40000))
+    assert rows["BTC"]["open_amount"] == pytest.approx(0.5001)
+    assert rows["ETH"]["cost_basis"] == pytest.approx(30000)
+
+
+def test_fees_in_quote_go_into_basis_and_proceeds():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "buy", 1, 100, fee=1))
+    engine.apply(trade(2, "BTC/USD", "sell", 1, 110, fee=1))
+    btc = by_asset(engine)["BTC"]
+    assert btc["realized"] == pytest.approx(109 - 101)
+    assert btc["fees"] == pytest.approx(2)
+
+
+def test_fee_in_base_reduces_units_bought():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "buy", 1, 100, fee=0.01, fee_currency="BTC"))
+    btc = by_asset(engine)["BTC"]
+    assert btc["open_amount"] == pytest.approx(0.99)
+    assert btc["cost_basis"] == pytest.approx(100)
+
+
+def test_sale_without_history_is_unmatched():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "sell", 2, 100))
+    btc = by_asset(engine)["BTC"]
+    assert btc["unmatched"] == 2
+    assert btc["realized"] == 0
+
+
+def test_unrealized_uses_current_prices():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "buy", 2, 100))
+    btc = by_asset(engine, {"BTC": 150})["BTC"]
+    assert btc["market_value"] == pytest.approx(300)
+    assert btc["unrealized"] == pytest.approx(100)
+
+
+def test_historical_price_values_unrouted_quote():
+    prices = {("EUR", date(2024, 6, 1)): 1.25}
+    engine = CostBasisEngine(
+        "fifo", historical_price=lambda currency, day: prices.get((currency, day))
+    )
+    engine.apply(trade(1, "BTC/EUR", "buy", 1, 40000))
+    assert by_asset(engine)["BTC"]["cost_basis"] == pytest.approx(50000)
+    assert engine.unpriced == 0
+
+
+def test_trade_without_any_rate_is_unpriced():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "FOO/BAR", "buy", 1, 2))
+    assert engine.unpriced == 1
+    assert engine.count == 1
+
+
+def test_state_round_trip_resumes():
+    trades = [
+        trade(1, "BTC/USD", "buy", 1, 100),
+        trade(2, "BTC/USD", "buy", 1, 200),
+        trade(3, "BTC/USD", "sell", 1.5, 300),
+    ]
+    full = CostBasisEngine("fifo")
+    for t in trades:
+        full.apply(t)
+
+    first = CostBasisEngine("fifo")
+    first.apply(trades[0])
+    resumed = CostBasisEngine("fifo", first.to_state())
+    for t in trades[1:]:
+        resumed.apply(t)
+
+    assert resumed.report({}) == full.report({})
+    assert resumed.last == full.last
+
+
+def test_state_of_other_method_or_version_is_ignored():
+    engine = CostBasisEngine("fifo")
+    engine.apply(trade(1, "BTC/USD", "buy", 1, 100))
+    state = engine.to_state()
+    assert CostBasisEngine("lifo", state).count == 0
+    assert CostBasisEngine("fifo", {**state, "version": 1}).count == 0
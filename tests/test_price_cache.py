@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from price_cache import PriceCache
+
+
+def tickers(symbols, price=100.0):
+    return {s: {"symbol": s, "last": price} for s in symbols}
+
+
+def test_concurrent_async_callers_share_one_fetch():
+    cache = PriceCache(ttl=60)
+    calls = []
+
+    async def fetch(symbols):
+        calls.append(list(symbols))
+        await asyncio.sleep(0.01)
+        return tickers(symbols)
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_many_async(["BTC/USD", "ETH/USD"], fetch) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+    assert calls == [["BTC/USD", "ETH/USD"]]
+    assert all(r["BTC/USD"]["last"] == 100.0 for r in results)
+    stats = cache.get_stats()
+    assert stats["fetches"] == 1
+    assert (stats["hits"], stats["misses"]) == (8, 2)
+
+
+def test_async_fetches_only_symbols_still_missing():
+    cache = PriceCache(ttl=60)
+    calls = []
+
+    async def fetch(symbols):
+        calls.append(list(symbols))
+        return tickers(symbols)
+
+    async def run():
+        await cache.get_many_async(["BTC/USD"], fetch)
+        return await cache.get_many_async(["BTC/USD", "ETH/USD"], fetch)
+
+    result = asyncio.run(run())
+    assert calls == [["BTC/USD"], ["ETH/USD"]]
+    assert set(result) == {"BTC/USD", "ETH/USD"}
+
+
+def test_concurrent_threads_share_one_fetch():
+    cache = PriceCache(ttl=60)
+    calls = []
+    started = threading.Event()
+
+    def fetch(symbols):
+        calls.append(list(symbols))
+        started.wait(1)
+        return tickers(symbols)
+
+    threads = [
+        threading.Thread(target=cache.get_many, args=(["BTC/USD"], fetch))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    started.set()
+    for t in threads:
+        t.join()
+    assert calls == [["BTC/USD"]]
@@ -0,0 +1,27 @@
+import asyncio
+import pstats
+
+import config
+import profiling
+
+
+def busy():
+    return sum(i * i for i in range(20000))
+
+
+def test_call_profiles_work_in_worker_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_MIN_MS", 0)
+    monkeypatch.setattr(profiling, "_directory", str(tmp_path))
+
+    async def handler():
+        return await asyncio.to_thread(profiling.call, "bot-test-worker", busy)
+
+    assert asyncio.run(handler()) == busy()
+    (run,) = profiling.list_profiles(str(tmp_path), name="bot-test-worker")
+    functions = {func for _, _, func in pstats.Stats(run["path"]).stats}
+    assert "busy" in functions
+
+
+def test_call_without_profiling_just_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_directory", None)
+    assert profiling.call("off", busy) == busy()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronSchedule, IntervalSchedule, Job, Scheduler
+
+
+@pytest.mark.parametrize(
+    "expression, after, expected",
+    [
+        ("5 0 * * *", datetime(2024, 6, 1, 0, 4), datetime(2024, 6, 1, 0, 5)),
+        ("5 0 * * *", datetime(2024, 6, 1, 0, 5, 20), datetime(2024, 6, 2, 0, 5)),
+        (
+            "*/15 * * * *",
+            datetime(2024, 6, 1, 10, 14, 59),
+            datetime(2024, 6, 1, 10, 15),
+        ),
+        ("0 */6 * * *", datetime(2024, 6, 1, 7), datetime(2024, 6, 1, 12)),
+        ("0 0,12 * * *", datetime(2024, 6, 1, 12), datetime(2024, 6, 2, 0)),
+        # Saturday -> Monday
+        ("0 9 * * 1-5", datetime(2024, 6, 1, 12), datetime(2024, 6, 3, 9)),
+        # Day of month or day of week (7 is Sunday): Sunday the 9th comes first
+        ("0 0 1 * 7", datetime(2024, 6, 3), datetime(2024, 6, 9)),
+        ("30 2 29 2 *", datetime(2024, 3, 1), datetime(2028, 2, 29, 2, 30)),
+        ("0 0 1 1 *", datetime(2024, 12, 31, 23, 59), datetime(2025, 1, 1)),
+    ],
+)
+def test_cron_next_after(expression, after, expected):
+    assert CronSchedule(expression).next_after(after) == expected
+
+
+@pytest.mark.parametrize(
+    "expression", ["*/90 * * * *", "*/60 * * * *", "0 24 * * *", "* * * *", "0 0 0 * *"]
+)
+def test_cron_rejects_invalid(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_cron_that_never_fires():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 30 2 *").next_after(datetime(2024, 1, 1))
+
+
+@pytest.mark.parametrize(
+    "minutes, after, expected",
+    [
+        (90, datetime(2024, 6, 1, 0, 0), datetime(2024, 6, 1, 1, 30)),
+        (90, datetime(2024, 6, 1, 1, 30), datetime(2024, 6, 1, 3, 0)),
+        (120, datetime(2024, 6, 1, 1, 0), datetime(2024, 6, 1, 2, 0)),
+        (45, datetime(2024, 6, 1, 0, 50), datetime(2024, 6, 1, 1, 30)),
+        (5, datetime(2024, 6, 1, 0, 4, 59), datetime(2024, 6, 1, 0, 5)),
+    ],
+)
+def test_interval_next_after(minutes, after, expected):
+    assert IntervalSchedule(minutes * 60).next_after(after) == expected
+
+
+def test_interval_spacing_is_constant():
+    schedule = IntervalSchedule(7 * 60)
+    t = datetime(2024, 6, 1, 23, 50)
+    runs = []
+    for _ in range(5):
+        t = schedule.next_after(t)
+        runs.append(t)
+    assert {(b - a).total_seconds() for a, b in zip(runs, runs[1:])} == {420}
+
+
+class MemoryStore:
+    """Stand-in for the job state methods of Database"""
+
+    def __init__(self, states=None):
+        self.states = dict(states or {})
+
+    def get_job_state(self, name):
+        return self.states.get(name)
+
+    def save_job_state(self, name, started, duration, status):
+        self.states[name] = {"started": started, "duration": duration, "status": status}
+
+
+def test_missed_run_detection():
+    scheduler = Scheduler(
+        MemoryStore({"daily": {"started": datetime(2024, 6, 1, 0, 5, 10)}})
+    )
+    job = scheduler.add_job(Job("daily", "5 0 * * *", lambda: None))
+    assert not scheduler.missed(job, now=datetime(2024, 6, 1, 23, 0))
+    assert scheduler.missed(job, now=datetime(2024, 6, 2, 0, 6))
+    assert job.last_started == datetime(2024, 6, 1, 0, 5, 10)
+
+
+def test_never_run_job_counts_as_missed():
+    scheduler = Scheduler(MemoryStore())
+    job = scheduler.add_job(Job("daily", "5 0 * * *", lambda: None))
+    assert scheduler.missed(job)
+
+
+def test_overlapping_run_is_skipped_and_state_saved():
+    store = MemoryStore()
+
+    async def run():
+        scheduler = Scheduler(store)
+        slow = scheduler.add_job(Job("slow", "0 0 * * *", lambda: time.sleep(0.2)))
+        failing = scheduler.add_job(Job("failing", "0 0 * * *", lambda: 1 / 0))
+        assert scheduler.fire(slow)
+        await asyncio.sleep(0.05)
+        assert not scheduler.fire(slow)
+        scheduler.fire(failing)
+        await asyncio.sleep(0.4)
+        await scheduler.stop()
+        return slow, failing
+
+    slow, failing = asyncio.run(run())
+    assert (slow.runs, slow.skipped, slow.last_status) == (1, 1, "success")
+    assert (failing.failures, failing.last_status) == (1, "failed")
+    assert store.states["slow"]["status"] == "success"
+    assert store.states["failing"]["status"] == "failed"
@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+import pytest
+
+from valuation import ConversionGraph, clean_currency, route_symbols
+
+ROOTS = {"USD", "ZUSD"}
+MARKETS = dict.fromkeys(
+    ["BTC/USD", "ETH/USD", "USDT/USD", "EUR/USD", "FOO/EUR", "BAR/BTC", "USD/JPY"], {}
+)
+
+
+@pytest.mark.parametrize(
+    "currency,expected",
+    [("BTC.F", "BTC"), ("DOT.S", "DOT"), ("ETH", "ETH"), ("ETH2.S", "ETH2")],
+)
+def test_clean_currency(currency, expected):
+    assert clean_currency(currency) == expected
+
+
+def test_route_symbols_prefers_direct_usd_pairs():
+    assert route_symbols(["BTC", "ETH.F", "USD"], MARKETS, ROOTS) == [
+        "BTC/USD",
+        "ETH/USD",
+    ]
+
+
+def test_route_symbols_accepts_inverted_usd_pair():
+    assert route_symbols(["JPY"], MARKETS, ROOTS) == ["USD/JPY"]
+
+
+def test_route_symbols_adds_cross_quote_legs():
+    assert route_symbols(["FOO", "BAR"], MARKETS, ROOTS) == [
+        "BAR/BTC",
+        "BTC/USD",
+        "EUR/USD",
+        "FOO/EUR",
+    ]
+
+
+def test_route_symbols_follows_quote_order():
+    markets = {"FOO/EUR": {}, "FOO/USDT": {}, "USDT/USD": {}, "EUR/USD": {}}
+    assert route_symbols(["FOO"], markets, ROOTS) == ["FOO/USDT", "USDT/USD"]
+    assert route_symbols(["FOO"], markets, ROOTS, quotes=("EUR",)) == [
+        "EUR/USD",
+        "FOO/EUR",
+    ]
+
+
+def test_route_symbols_skips_unroutable_currency():
+    assert route_symbols(["NOPE"], MARKETS, ROOTS) == []
+
+
+def graph(prices: dict, roots=ROOTS) -> ConversionGraph:
+    return ConversionGraph({s: {"last": p} for s, p in prices.items()}, roots)
+
+
+def test_conversion_graph_direct_and_cross_rates():
+    g = graph({"BTC/USD": 60000, "EUR/USD": 1.1, "FOO/EUR": 2, "BAR/BTC": 0.001})
+    assert g.rate("USD") == 1
+    assert g.rate("BTC.F") == Decimal("60000")
+    assert g.rate("FOO") == Decimal("2") * Decimal("1.1")
+    assert g.rate("BAR") == Decimal("0.001") * 60000
+    assert g.route("FOO") == ["FOO", "EUR", "USD"]
+
+
+def test_conversion_graph_inverts_usd_base_pairs():
+    g = graph({"USD/JPY": 150})
+    assert g.rate("JPY") == 1 / Decimal("150")
+    assert g.route("JPY") == ["JPY", "USD"]
+
+
+def test_conversion_graph_takes_fewest_hops():
+    g = graph({"FOO/EUR": 2, "EUR/USD": 1.1, "FOO/USD": 3})
+    assert g.rate("FOO") == Decimal("3")
+    assert g.route("FOO") == ["FOO", "USD"]
+
+
+def test_conversion_graph_ignores_missing_prices_and_unreachable_currencies():
+    g = graph({"BTC/USD": None, "FOO/BAR": 5, "ETH/USD:USD": 3000, "bogus": 1})
+    assert g.rate("BTC") is None
+    assert g.rate("FOO") is None
+    assert g.route("FOO") == []
+    assert g.rate("ETH") == Decimal("3000")
+
+
+def test_conversion_graph_treats_every_root_as_usd():
+    g = graph({"USDT/EUR": 0.9, "EUR/USD": 1.1}, roots={"USD", "USDT"})
+    assert g.rate("USDT") == 1
+    assert g.rate("EUR") == Decimal("1.1")